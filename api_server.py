@@ -4,7 +4,9 @@ Wraps the existing Python chatbot for web integration
 """
 import sys
 import os
-from flask import Flask, request, jsonify
+import json
+import contextlib
+from flask import Flask, Response, request, jsonify, stream_with_context
 from flask_cors import CORS
 
 # Add the Python chatbot files to the path
@@ -13,6 +15,12 @@ sys.path.append(os.path.join(os.path.dirname(__file__), 'python_chatbot'))
 
 try:
     from chatbot_enhanced import CampChatbot
+    from config import Config
+    from llm_resilience import Deadline
+    from recommender import FACTORS, PROFILE_OVERRIDES, validate_overrides
+    from batch_runner import normalize_sessions
+    from admission import AdmissionController, AdmissionRejected
+    from single_flight import SingleFlight, StillInFlight
 except ImportError:
     print("Error: Python chatbot files not found. Please ensure chatbot files are available.")
     sys.exit(1)
@@ -21,75 +29,189 @@ app = Flask(__name__)
 CORS(app)  # Enable CORS for Next.js frontend
 
 # Global chatbot instance (in production, you'd want session management)
+# It is ONE conversation: every client shares its state and history, and its turns run one at a time
+# (conversation_turn). Session ids sent by clients only key rate limits and duplicate-message coalescing;
+# /chat/batch is the one path with separate conversations (spawn_session)
 chatbot = None
 
+# Rate limits and LLM concurrency cap shared by all chat requests
+admission = AdmissionController(
+    session_rate_per_minute=Config.RATE_LIMIT_SESSION_PER_MINUTE,
+    session_burst=Config.RATE_LIMIT_SESSION_BURST,
+    ip_rate_per_minute=Config.RATE_LIMIT_IP_PER_MINUTE,
+    ip_burst=Config.RATE_LIMIT_IP_BURST,
+    max_in_flight=Config.LLM_MAX_IN_FLIGHT,
+    max_queue=Config.LLM_MAX_QUEUE,
+    queue_timeout=Config.LLM_QUEUE_TIMEOUT_SECONDS,
+    max_clients=Config.RATE_LIMIT_MAX_CLIENTS
+) if Config.ADMISSION_CONTROL_ENABLED else None
+
+# Coalesces double-submitted chat messages per session
+single_flight = SingleFlight(replay_seconds=Config.CHAT_REPLAY_SECONDS)
+
 def initialize_chatbot():
     """Initialize the chatbot instance"""
     global chatbot
     try:
-        chatbot = CampChatbot()
+        # Batch replay and speculative prefetch take their LLM slots from the same admission controller
+        chatbot = CampChatbot(llm_slot=admission.hold_slot if admission else None)
         print("✅ Chatbot initialized successfully!")
         return True
     except Exception as e:
         print(f"❌ Error initializing chatbot: {e}")
         return False
 
+def request_deadline():
+    """
+    Build the deadline for this request
+    Clients may send a shorter budget via the X-Request-Timeout header (seconds)
+    """
+    timeout = Config.REQUEST_DEADLINE_SECONDS
+    header = request.headers.get('X-Request-Timeout')
+    if header:
+        try:
+            timeout = min(float(header), Config.MAX_REQUEST_DEADLINE_SECONDS)
+        except ValueError:
+            pass
+    return Deadline(max(timeout, 0.1))
+
+def client_ip():
+    """Caller's IP (first X-Forwarded-For hop when running behind a trusted proxy)"""
+    forwarded = request.headers.get('X-Forwarded-For')
+    if Config.TRUST_FORWARDED_FOR and forwarded:
+        return forwarded.split(',')[0].strip()
+    return request.remote_addr
+
+def session_id_from(data):
+    """Conversation id from a 'session_id' body field or the X-Session-Id header (None if absent)"""
+    session_id = (data or {}).get('session_id') or request.headers.get('X-Session-Id')
+    return str(session_id) if session_id else None
+
+def session_key(data):
+    """Session id, falling back to the client IP for clients that don't send one"""
+    return session_id_from(data) or f"ip:{client_ip()}"
+
+def admit_request(data, needs_llm=True, deadline=None):
+    """Admission for this request; raises AdmissionRejected when rate limited or overloaded"""
+    if not admission:
+        return contextlib.nullcontext()
+    return admission.admit(
+        session_id_from(data), client_ip(),
+        needs_llm=needs_llm, timeout=deadline.remaining() if deadline else None
+    )
+
+@contextlib.contextmanager
+def conversation_turn(deadline=None):
+    """
+    Hold the conversation for one turn (state, history and last_response are not safe to interleave)
+    Waits at most until the deadline, then turns the request away with a 503
+    """
+    timeout = deadline.remaining() if deadline else -1
+    if not chatbot.turn_lock.acquire(timeout=timeout):
+        raise AdmissionRejected(503, 'conversation busy', 1)
+    try:
+        yield
+    finally:
+        chatbot.turn_lock.release()
+
+def rejected_response(error):
+    """Fast 429/503 with a Retry-After hint"""
+    response = jsonify({
+        'error': error.reason,
+        'response': f"I'm getting a lot of messages right now. Please try again in {error.retry_after} seconds.",
+        'suggestions': ['Try again'],
+        'retry_after': error.retry_after
+    })
+    response.headers['Retry-After'] = str(error.retry_after)
+    return response, error.status
+
 def generate_smart_suggestions(state):
-    """Generate contextual suggestions based on current state"""
-    suggestions = []
-    
-    if not state:
-        return ['Tell me about camps', 'What activities are available?', 'Help me get started']
-    
-    # Basic info gathering suggestions
-    if not state.get('child_name') or not state.get('child_age'):
-        suggestions.extend(['My child is 8 years old', 'Tell me about age-appropriate camps'])
-    
-    # Activity-based suggestions
-    if state.get('preferred_activities'):
-        activities = state['preferred_activities']
-        if 'swimming' in str(activities).lower():
-            suggestions.append('Swimming camps near me')
-        if 'art' in str(activities).lower():
-            suggestions.append('Creative arts programs')
-    else:
-        suggestions.extend(['Arts and crafts', 'Swimming', 'Sports camps', 'STEM programs'])
-    
-    # Location suggestions
-    if not state.get('location_preference'):
-        suggestions.extend(['Camps in Texas', 'Local camps', 'Day camps vs overnight'])
-    
-    # Budget suggestions
-    if not state.get('budget_range'):
-        suggestions.extend(['Budget-friendly options', 'Premium programs'])
-    
-    # Phase-based suggestions
-    session_context = state.get('session_context', {})
-    current_phase = session_context.get('current_phase', 'exploring')
-    
-    if current_phase == 'building_profile':
-        suggestions.extend(['Tell me more about my child', 'What information do you need?'])
-    elif current_phase == 'exploring_options':
-        suggestions.extend(['Show me recommendations', 'Compare these camps'])
-    elif current_phase == 'planning_schedule':
-        suggestions.extend(['Available dates', 'How do I register?'])
-    
-    # Return unique suggestions, limited to 4-6 items
-    unique_suggestions = list(dict.fromkeys(suggestions))
-    return unique_suggestions[:6]
+    """
+    Generate contextual suggestions based on current state
+    Drawn from the catalog's facet counts, so every lookup chip has matching camps
+    """
+    if not chatbot:
+        return ['Find camps', 'Tell me about activities', 'Help me get started']
+    return chatbot.get_suggestions(state or {})
 
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
-        'chatbot_ready': chatbot is not None
+        'chatbot_ready': chatbot is not None,
+        'admission': admission.get_stats() if admission else None,
+        'coalescing': single_flight.get_stats()
     })
 
+def run_chat_turn(data, user_message, deadline):
+    """Run one chat turn and build the JSON payload for it"""
+    with admit_request(data, needs_llm=not chatbot.can_answer_locally(user_message), deadline=deadline):
+        with conversation_turn(deadline):
+            return chat_turn_payload(data, user_message, deadline)
+
+def chat_turn_payload(data, user_message, deadline):
+    """One turn on the conversation and its JSON payload (caller holds conversation_turn)"""
+    # An explicit region pins its catalog shard; without one the turn routes by location preference
+    if data.get('region'):
+        chatbot.route_catalog(data['region'])
+    
+    # Process message with chatbot (disable token details for API)
+    bot_response = chatbot.process_message(user_message, show_token_details=False, deadline=deadline)
+
+    # This conversation's response for the turn (the LLM handler is shared with batch sessions)
+    llm_response_data = chatbot.last_response or {}
+
+    # --- DEBUG LOGGING START ---
+    print("\n" + "="*40 + " CHATBOT DEBUG " + "="*40)
+    print(f"User Message: {user_message}")
+    print("-" * 20 + " RAW BOT RESPONSE " + "-"*20)
+    print(bot_response)
+
+    # Check for email draft
+    email_draft = llm_response_data.get('email_draft')
+    if email_draft:
+        print("-" * 20 + " EMAIL DRAFT FOUND " + "-"*20)
+        print(f"Email Draft: {email_draft}")
+    else:
+        print("-" * 20 + " NO EMAIL DRAFT " + "-"*20)
+
+    # Fallback check for email draft
+    email_keywords = ['email', 'contact', 'draft']
+    if any(keyword in user_message.lower() for keyword in email_keywords):
+        if not email_draft:
+            print("\n⚠️  WARNING: AI may have failed to generate an email draft when requested.\n")
+
+    print("-" * 20 + " CURRENT STATE " + "-"*20)
+    try:
+        print(json.dumps(chatbot.state_manager.get_compact_state(), indent=2))
+    except Exception as e:
+        print(f"Could not dump state: {e}")
+    print("="*95 + "\n")
+    # --- DEBUG LOGGING END ---
+
+    # Get current state for suggestions
+    current_state = chatbot.state_manager.get_compact_state()
+    suggestions = generate_smart_suggestions(current_state)
+
+    # Prefetch responses for the chips the parent is most likely to click next
+    chatbot.speculate(suggestions)
+
+    # Return structured response
+    return {
+        'response': bot_response,
+        'suggestions': suggestions,
+        'state_summary': chatbot.state_manager.get_state_summary(),
+        'status': 'degraded' if llm_response_data.get('degraded') else 'success',
+        'email_draft': llm_response_data.get('email_draft'),
+        'camp_ids': llm_response_data.get('camp_ids') or []
+    }
+
 @app.route('/chat', methods=['POST'])
 def chat_endpoint():
     """Main chat endpoint"""
     try:
+        deadline = request_deadline()
         if not chatbot:
             return jsonify({
                 'error': 'Chatbot not initialized',
@@ -113,54 +235,45 @@ def chat_endpoint():
                 'suggestions': ['Find camps', 'Tell me about activities', 'Help me get started']
             })
         
-        # Process message with chatbot (disable token details for API)
-        bot_response = chatbot.process_message(user_message, show_token_details=False)
-        
-        # Get the last response from LLM handler to check for email draft
-        llm_response_data = chatbot.llm_handler.last_response or {}
-
-        # --- DEBUG LOGGING START ---
-        print("\n" + "="*40 + " CHATBOT DEBUG " + "="*40)
-        print(f"User Message: {user_message}")
-        print("-" * 20 + " RAW BOT RESPONSE " + "-"*20)
-        print(bot_response)
+        # An explicit 'region' must name a catalog shard; the switch itself happens inside the admitted turn
+        try:
+            if data.get('region'):
+                chatbot.catalogs.route(region=data['region'])
+        except ValueError as e:
+            return jsonify({
+                'error': str(e),
+                'response': "Sorry, I don't have a camp catalog for that region.",
+                'suggestions': []
+            }), 400
         
-        # Check for email draft
-        email_draft = llm_response_data.get('email_draft')
-        if email_draft:
-            print("-" * 20 + " EMAIL DRAFT FOUND " + "-"*20)
-            print(f"Email Draft: {email_draft}")
+        # A double-submitted message joins the turn already running (or just finished) instead of re-running it.
+        # Only an idempotency key or a real session id identifies a resubmission: clients behind one IP
+        # sending the same text are different people and each get their own turn
+        idempotency_key = request.headers.get('Idempotency-Key') or data.get('idempotency_key')
+        if idempotency_key or session_id_from(data):
+            payload, replayed = single_flight.run(
+                (session_key(data), str(idempotency_key) if idempotency_key else ('message', user_message)),
+                lambda: run_chat_turn(data, user_message, deadline),
+                timeout=deadline.remaining(),
+                replay=bool(idempotency_key)
+            )
         else:
-            print("-" * 20 + " NO EMAIL DRAFT " + "-"*20)
+            payload, replayed = run_chat_turn(data, user_message, deadline), False
+        response = jsonify(payload)
+        if replayed:
+            response.headers['Idempotent-Replayed'] = 'true'
+        return response
         
-        # Fallback check for email draft
-        email_keywords = ['email', 'contact', 'draft']
-        if any(keyword in user_message.lower() for keyword in email_keywords):
-            if not email_draft:
-                print("\n⚠️  WARNING: AI may have failed to generate an email draft when requested.\n")
-
-        print("-" * 20 + " CURRENT STATE " + "-"*20)
-        try:
-            import json
-            print(json.dumps(chatbot.state_manager.get_compact_state(), indent=2))
-        except Exception as e:
-            print(f"Could not dump state: {e}")
-        print("="*95 + "\n")
-        # --- DEBUG LOGGING END ---
-        
-        # Get current state for suggestions
-        current_state = chatbot.state_manager.get_compact_state()
-        suggestions = generate_smart_suggestions(current_state)
-        
-        # Return structured response
-        return jsonify({
-            'response': bot_response,
-            'suggestions': suggestions,
-            'state_summary': chatbot.state_manager.get_state_summary(),
-            'status': 'success',
-            'email_draft': llm_response_data.get('email_draft')
+    except AdmissionRejected as e:
+        return rejected_response(e)
+    except StillInFlight:
+        response = jsonify({
+            'error': 'An identical message is still being processed',
+            'response': "I'm still working on that message. One moment!",
+            'suggestions': []
         })
-        
+        response.headers['Retry-After'] = '1'
+        return response, 409
     except Exception as e:
         print(f"Error in chat endpoint: {e}")
         return jsonify({
@@ -169,6 +282,42 @@ def chat_endpoint():
             'suggestions': ['Try again', 'Help', 'Reset conversation']
         }), 500
 
+@app.route('/chat/batch', methods=['POST'])
+def chat_batch_endpoint():
+    """
+    Replay many independent conversations concurrently
+    Streams one JSON object per line: per-turn results, per-session token totals, then a summary
+    """
+    try:
+        if not chatbot:
+            return jsonify({'error': 'Chatbot not initialized'}), 500
+        
+        data = request.get_json(silent=True) or {}
+        sessions = normalize_sessions(data.get('sessions'))
+        if not sessions:
+            return jsonify({'error': 'No sessions provided'}), 400
+        if len(sessions) > Config.BATCH_MAX_SESSIONS:
+            return jsonify({'error': f'Too many sessions (max {Config.BATCH_MAX_SESSIONS})'}), 400
+        
+        max_workers = int(data.get('max_workers', Config.BATCH_MAX_WORKERS))
+        max_workers = max(1, min(max_workers, Config.BATCH_MAX_WORKERS_LIMIT))
+        
+        # Counts against the caller's rate limit; each replayed turn that reaches the LLM then waits
+        # for an LLM slot of its own (CampChatbot llm_slot), so the batch stays under LLM_MAX_IN_FLIGHT
+        with admit_request(data, needs_llm=False):
+            results = chatbot.run_batch(sessions, max_workers=max_workers)
+        return Response(
+            stream_with_context(json.dumps(record) + '\n' for record in results),
+            mimetype='application/x-ndjson'
+        )
+        
+    except AdmissionRejected as e:
+        return rejected_response(e)
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid request: {e}'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/debug-chat', methods=['POST'])
 def debug_chat():
     """Debug endpoint to see raw AI responses"""
@@ -177,11 +326,12 @@ def debug_chat():
         message = data.get('message', '')
         
         # Process message with chatbot
-        response = chatbot.process_message(message, show_token_details=False)
-        
-        # Return both the response and debug info
-        current_state = chatbot.state_manager.get_compact_state()
-        suggestions = generate_smart_suggestions(current_state)
+        with admit_request(data, needs_llm=not chatbot.can_answer_locally(message)), conversation_turn():
+            response = chatbot.process_message(message, show_token_details=False)
+            
+            # Return both the response and debug info
+            current_state = chatbot.state_manager.get_compact_state()
+            suggestions = generate_smart_suggestions(current_state)
         
         return jsonify({
             'response': response,
@@ -196,12 +346,242 @@ def debug_chat():
             }
         })
         
+    except AdmissionRejected as e:
+        return rejected_response(e)
     except Exception as e:
         return jsonify({
             'error': str(e),
             'debug_info': {'error_occurred': True}
         }), 500
 
+@app.route('/recommendations', methods=['GET', 'POST'])
+def recommendations_endpoint():
+    """Deterministic top-K ranking for the current learner profile"""
+    try:
+        if not chatbot:
+            return jsonify({'error': 'Chatbot not initialized'}), 500
+        
+        data = request.get_json(silent=True) or {}
+        k = int(data.get('k', request.args.get('k', Config.RECOMMENDATION_DEFAULT_K)))
+        k = max(1, min(k, Config.RECOMMENDATION_MAX_K))
+        
+        weights = data.get('weights') or {}
+        unknown = set(weights) - set(FACTORS)
+        if unknown:
+            return jsonify({'error': f"Unknown weights: {', '.join(sorted(unknown))}"}), 400
+        weights = {name: float(value) for name, value in weights.items()}
+        
+        # Optional profile fields overriding the conversation state (e.g. grade, max_price, latitude)
+        overrides = data.get('profile') or {}
+        if not isinstance(overrides, dict):
+            return jsonify({'error': 'Invalid request: profile must be an object'}), 400
+        unknown = set(overrides) - set(PROFILE_OVERRIDES)
+        if unknown:
+            return jsonify({'error': f"Unknown profile fields: {', '.join(sorted(unknown))}"}), 400
+        overrides = validate_overrides(overrides)
+        
+        region = data.get('region') or request.args.get('region')
+        return jsonify(chatbot.get_recommendations(k=k, weights=weights, overrides=overrides, region=region))
+        
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid request: {e}'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def payload_response(payloads, payload):
+    """
+    Serve a pre-encoded catalog payload: 304 when If-None-Match names it, else the best
+    Accept-Encoding variant, with a strong ETag per encoding
+    """
+    not_modified = payload.matches(request.headers.get('If-None-Match'))
+    encoding = payload.negotiate(request.headers.get('Accept-Encoding'))
+    payloads.record_response(payload, encoding, not_modified)
+    headers = {
+        'ETag': payload.etags[encoding],
+        'Cache-Control': f'public, max-age={Config.CATALOG_CACHE_MAX_AGE_SECONDS}, must-revalidate',
+        'Vary': 'Accept-Encoding'
+    }
+    if not_modified:
+        return Response(status=304, headers=headers)
+    if encoding != 'identity':
+        headers['Content-Encoding'] = encoding
+    return Response(payload.encodings[encoding], mimetype='application/json', headers=headers)
+
+@app.route('/camps', methods=['GET'])
+def camps_endpoint():
+    """
+    Catalog camps in pages: ?fields=camp_id,camp_name,price&limit=100&cursor=<next_cursor>
+    Optional filters: grade, min_price, max_price, categories (repeatable), bbox=west,south,east,north
+    ?region= picks the catalog shard (default region otherwise)
+    Bodies are encoded once per catalog version; send If-None-Match to get a 304 for an unchanged page
+    """
+    try:
+        if not chatbot:
+            return jsonify({'error': 'Chatbot not initialized'}), 500
+        
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+        filters = {
+            'grade': int(request.args['grade']) if request.args.get('grade') else None,
+            'min_price': float(request.args['min_price']) if request.args.get('min_price') else None,
+            'max_price': float(request.args['max_price']) if request.args.get('max_price') else None,
+            'categories': request.args.getlist('categories'),
+            'bbox': [float(value) for value in request.args['bbox'].split(',')] if request.args.get('bbox') else None
+        }
+        if filters['bbox'] is not None and len(filters['bbox']) != 4:
+            raise ValueError('bbox must be west,south,east,north')
+        payloads = chatbot.catalog_view(request.args.get('region')).catalog_payloads
+        payload = payloads.page(
+            fields=request.args.get('fields'), cursor=request.args.get('cursor'), limit=limit, filters=filters
+        )
+        return payload_response(payloads, payload)
+        
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid request: {e}'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/camps/<camp_id>', methods=['GET'])
+def camp_endpoint(camp_id):
+    """One camp's catalog record (?fields= projects it, ?region= as for /camps), cached and conditional like /camps"""
+    try:
+        if not chatbot:
+            return jsonify({'error': 'Chatbot not initialized'}), 500
+        
+        payloads = chatbot.catalog_view(request.args.get('region')).catalog_payloads
+        payload = payloads.camp(camp_id, fields=request.args.get('fields'))
+        if payload is None:
+            return jsonify({'error': f'Unknown camp_id: {camp_id}'}), 404
+        return payload_response(payloads, payload)
+        
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid request: {e}'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/camps/<camp_id>/similar', methods=['GET'])
+def similar_camps_endpoint(camp_id):
+    """"More like this" — camps most similar to the given camp"""
+    try:
+        if not chatbot:
+            return jsonify({'error': 'Chatbot not initialized'}), 500
+        
+        k = int(request.args.get('k', Config.SIMILAR_DEFAULT_K))
+        k = max(1, min(k, Config.RECOMMENDATION_MAX_K))
+        
+        grade = request.args.get('grade')
+        max_price = request.args.get('max_price')
+        max_distance_km = request.args.get('max_distance_km')
+        origin = None
+        if request.args.get('lat') is not None and request.args.get('lon') is not None:
+            origin = (float(request.args['lat']), float(request.args['lon']))
+        
+        result = chatbot.get_similar_camps(
+            camp_id, k=k, region=request.args.get('region'),
+            grade=int(grade) if grade is not None else None,
+            max_price=float(max_price) if max_price is not None else None,
+            max_distance_km=float(max_distance_km) if max_distance_km is not None else None,
+            origin=origin
+        )
+        if result is None:
+            return jsonify({'error': f'Unknown camp_id: {camp_id}'}), 404
+        return jsonify(result)
+        
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid request: {e}'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/geocode', methods=['GET'])
+def geocode_endpoint():
+    """Resolve a zip code or place name to coordinates from the offline gazetteer"""
+    try:
+        if not chatbot:
+            return jsonify({'error': 'Chatbot not initialized'}), 500
+        
+        query = request.args.get('q') or request.args.get('zipcode')
+        if not query:
+            return jsonify({'error': 'No location provided'}), 400
+        
+        place = chatbot.resolve_location(query, region=request.args.get('region'))
+        if not place:
+            return jsonify({'error': f'Location not found: {query}'}), 404
+        return jsonify({**place, 'source': 'gazetteer'})
+        
+    except ValueError as e:
+        return jsonify({'error': f'Invalid request: {e}'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+def facet_filters_from_args(args, skip=()):
+    """Facet filters from query parameters (repeat a parameter for several values)"""
+    filters = {}
+    for key in args:
+        if key in skip:
+            continue
+        if key == 'grade':
+            filters[key] = int(args[key])
+        elif key in ('min_price', 'max_price'):
+            filters[key] = float(args[key])
+        else:
+            filters[key] = args.getlist(key)
+    return filters
+
+@app.route('/facets', methods=['GET'])
+def facets_endpoint():
+    """
+    Camp counts per facet value for a filter combination
+    Repeat a parameter to select several values: ?categories=Art&categories=STEM&cities=Plano&grade=3
+    ?region= picks the catalog shard (default region otherwise)
+    """
+    try:
+        if not chatbot:
+            return jsonify({'error': 'Chatbot not initialized'}), 500
+        
+        filters = facet_filters_from_args(request.args, skip=('limit', 'region'))
+        limit = int(request.args['limit']) if request.args.get('limit') else None
+        
+        return jsonify(chatbot.get_facets(filters, limit=limit, region=request.args.get('region')))
+        
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid request: {e}'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/map/clusters', methods=['GET'])
+def map_clusters_endpoint():
+    """
+    Marker clusters and single camps inside a map viewport
+    ?bbox=west,south,east,north&zoom=10, plus optional facet filters and region as for /facets (e.g. &categories=STEM&grade=3)
+    """
+    try:
+        if not chatbot:
+            return jsonify({'error': 'Chatbot not initialized'}), 500
+        
+        if not request.args.get('bbox') or request.args.get('zoom') is None:
+            return jsonify({'error': 'bbox and zoom are required'}), 400
+        bbox = [float(value) for value in request.args['bbox'].split(',')]
+        zoom = float(request.args['zoom'])
+        filters = facet_filters_from_args(request.args, skip=('bbox', 'zoom', 'region'))
+        
+        return jsonify(chatbot.get_map_clusters(bbox, zoom, filters, region=request.args.get('region')))
+        
+    except (TypeError, ValueError) as e:
+        return jsonify({'error': f'Invalid request: {e}'}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/catalogs', methods=['GET'])
+def catalogs_endpoint():
+    """Configured catalog regions, which are loaded, and load / eviction counters"""
+    try:
+        if not chatbot:
+            return jsonify({'error': 'Chatbot not initialized'}), 500
+        
+        return jsonify({'active_region': chatbot.region, **chatbot.catalogs.get_stats()})
+        
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/status', methods=['GET'])
 def status_endpoint():
     """Get chatbot status"""
@@ -210,6 +590,8 @@ def status_endpoint():
             return jsonify({'error': 'Chatbot not initialized'}), 500
         
         status = chatbot.get_status()
+        status['admission'] = admission.get_stats() if admission else None
+        status['coalescing'] = single_flight.get_stats()
         return jsonify(status)
         
     except Exception as e:
@@ -222,7 +604,8 @@ def reset_endpoint():
         if not chatbot:
             return jsonify({'error': 'Chatbot not initialized'}), 500
         
-        reset_message = chatbot.reset_conversation()
+        with conversation_turn():
+            reset_message = chatbot.reset_conversation()
         return jsonify({
             'message': reset_message,
             'status': 'reset_complete'
@@ -240,8 +623,17 @@ if __name__ == '__main__':
         print("📡 CORS enabled for Next.js frontend")
         print("📍 Endpoints:")
         print("   POST /chat - Main chat endpoint")
+        print("   POST /chat/batch - Replay many sessions (streams JSON lines)")
         print("   GET  /health - Health check")
         print("   GET  /status - Chatbot status")
+        print("   POST /recommendations - Ranked camps for the learner profile")
+        print("   GET  /camps - Catalog camps in pages (fields, cursor, limit; ETag / gzip)")
+        print("   GET  /camps/<camp_id> - One camp's catalog record")
+        print("   GET  /camps/<camp_id>/similar - Camps similar to a camp")
+        print("   GET  /geocode - Resolve a zip code or place name offline")
+        print("   GET  /facets - Camp counts by category, grade, price, organization, city and week")
+        print("   GET  /map/clusters - Map marker clusters for a viewport (bbox, zoom, filters)")
+        print("   GET  /catalogs - Region catalog shards and what is loaded")
         print("   POST /reset - Reset conversation")
         print("-" * 50)
         
@@ -0,0 +1,224 @@
+"""
+Admission control for the camp chatbot API
+Token-bucket rate limits per session and per client IP, plus a global cap on in-flight LLM calls
+with a bounded wait queue, so overload is answered with fast 429/503s instead of growing latency
+"""
+import contextlib
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Optional, Iterator
+
+
+class AdmissionRejected(Exception):
+    """A request was turned away; carries the HTTP status and a Retry-After hint in seconds"""
+
+    def __init__(self, status: int, reason: str, retry_after: float):
+        super().__init__(reason)
+        self.status = status
+        self.reason = reason
+        self.retry_after = max(1, math.ceil(retry_after))
+
+
+class RateLimiter:
+    """
+    Token bucket per key: `burst` requests at once, refilled at `rate_per_minute`
+    Only the most recently seen `max_keys` keys are tracked (an idle bucket is full anyway)
+    Not thread-safe on its own; AdmissionController serialises access
+    """
+
+    def __init__(self, rate_per_minute: float, burst: int, max_keys: int = 10000):
+        self.rate = rate_per_minute / 60.0
+        self.burst = max(1, burst)
+        self.max_keys = max_keys
+        self._buckets = OrderedDict()  # key -> [tokens, updated_at]
+
+    def wait_time(self, key: str, now: float) -> float:
+        """Seconds until `key` has a token (0.0 if one is available now)"""
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            return 0.0
+        tokens = min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        if tokens >= 1.0:
+            return 0.0
+        return (1.0 - tokens) / self.rate if self.rate > 0 else float("inf")
+
+    def consume(self, key: str, now: float) -> None:
+        """Take one token (call wait_time first)"""
+        bucket = self._buckets.pop(key, None)
+        tokens = self.burst if bucket is None else min(self.burst, bucket[0] + (now - bucket[1]) * self.rate)
+        self._buckets[key] = [tokens - 1.0, now]
+        while len(self._buckets) > self.max_keys:
+            self._buckets.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+
+class AdmissionController:
+    """
+    Gatekeeper in front of the chat endpoints
+    1. Rate limits: one token from the session's bucket and one from the client IP's bucket, or 429
+    2. Concurrency: at most `max_in_flight` requests hold an LLM slot; up to `max_queue` more wait
+       for one (bounded by `queue_timeout`), anything beyond that is shed with 503
+    Turns that will not reach the LLM (e.g. answered by the local router) skip step 2
+    LLM calls that do not come from a request (batch replay, speculative prefetch) take a slot through
+    hold_slot, so the cap covers every call the process makes
+    The API server runs all /chat turns on one shared conversation, one turn at a time, so there the
+    session key is just the client's label for rate limiting and admitted turns queue for that conversation;
+    the concurrency cap matters for callers with separate conversations (spawn_session)
+    """
+
+    def __init__(self,
+                 session_rate_per_minute: float = 20.0,
+                 session_burst: int = 5,
+                 ip_rate_per_minute: float = 60.0,
+                 ip_burst: int = 20,
+                 max_in_flight: int = 8,
+                 max_queue: int = 16,
+                 queue_timeout: float = 5.0,
+                 max_clients: int = 10000):
+        self.session_limiter = RateLimiter(session_rate_per_minute, session_burst, max_clients)
+        self.ip_limiter = RateLimiter(ip_rate_per_minute, ip_burst, max_clients)
+        self.max_in_flight = max(1, max_in_flight)
+        self.max_queue = max(0, max_queue)
+        self.queue_timeout = queue_timeout
+
+        self._lock = threading.Lock()
+        self._slot_freed = threading.Condition(self._lock)
+        self.in_flight = 0
+        self.queued = 0
+        self._service_seconds = 2.0  # Moving average of slot hold time, for Retry-After hints
+
+        self.stats = {
+            "admitted": 0,
+            "admitted_without_slot": 0,
+            "rate_limited_session": 0,
+            "rate_limited_ip": 0,
+            "shed_queue_full": 0,
+            "shed_queue_timeout": 0,
+            "peak_in_flight": 0,
+            "peak_queued": 0,
+            "queue_waits": 0,
+            "total_queue_wait_ms": 0.0,
+            "background_slots": 0,
+            "background_shed": 0
+        }
+
+    @contextlib.contextmanager
+    def admit(self, session_id: Optional[str], client_ip: Optional[str], needs_llm: bool = True,
+              timeout: Optional[float] = None) -> Iterator[None]:
+        """
+        Hold admission for the duration of a request
+        timeout: longest this request may wait for a slot (capped at queue_timeout)
+        Raises AdmissionRejected (429 rate limited, 503 overloaded)
+        """
+        self._check_rate_limits(session_id, client_ip)
+        if not needs_llm:
+            with self._lock:
+                self.stats["admitted"] += 1
+                self.stats["admitted_without_slot"] += 1
+            yield
+            return
+
+        self._acquire_slot(self.queue_timeout if timeout is None else min(timeout, self.queue_timeout))
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release_slot(time.monotonic() - started)
+
+    @contextlib.contextmanager
+    def hold_slot(self, timeout: Optional[float] = None) -> Iterator[None]:
+        """
+        Hold an LLM slot for work that is not an HTTP request (no rate limits)
+        Waits up to `timeout` seconds (None: until one frees) behind any queued requests, without taking
+        a place in the request queue
+        Raises AdmissionRejected (503) when no slot frees in time
+        """
+        with self._lock:
+            if not self._slot_freed.wait_for(lambda: self.in_flight < self.max_in_flight and not self.queued, timeout):
+                self.stats["background_shed"] += 1
+                raise AdmissionRejected(503, "Server is busy", self._retry_hint())
+            self.in_flight += 1
+            self.stats["background_slots"] += 1
+            self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.in_flight)
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self._release_slot(time.monotonic() - started)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Admission counters and current load"""
+        with self._lock:
+            waits = self.stats["queue_waits"]
+            return {
+                **{key: value for key, value in self.stats.items() if key != "total_queue_wait_ms"},
+                "in_flight": self.in_flight,
+                "queued": self.queued,
+                "max_in_flight": self.max_in_flight,
+                "max_queue": self.max_queue,
+                "avg_queue_wait_ms": round(self.stats["total_queue_wait_ms"] / waits, 2) if waits else 0.0,
+                "avg_service_ms": round(self._service_seconds * 1000, 1),
+                "tracked_sessions": len(self.session_limiter),
+                "tracked_ips": len(self.ip_limiter)
+            }
+
+    def _check_rate_limits(self, session_id: Optional[str], client_ip: Optional[str]) -> None:
+        """Take a token from both buckets, or neither"""
+        now = time.monotonic()
+        with self._lock:
+            session_wait = self.session_limiter.wait_time(session_id, now) if session_id else 0.0
+            ip_wait = self.ip_limiter.wait_time(client_ip, now) if client_ip else 0.0
+            if session_wait > 0:
+                self.stats["rate_limited_session"] += 1
+                raise AdmissionRejected(429, "Too many messages in this conversation", session_wait)
+            if ip_wait > 0:
+                self.stats["rate_limited_ip"] += 1
+                raise AdmissionRejected(429, "Too many requests from this client", ip_wait)
+            if session_id:
+                self.session_limiter.consume(session_id, now)
+            if client_ip:
+                self.ip_limiter.consume(client_ip, now)
+
+    def _acquire_slot(self, timeout: float) -> None:
+        with self._lock:
+            if self.in_flight < self.max_in_flight and not self.queued:
+                self._take_slot()
+                return
+            if self.queued >= self.max_queue:
+                self.stats["shed_queue_full"] += 1
+                raise AdmissionRejected(503, "Server is busy", self._retry_hint())
+
+            self.queued += 1
+            self.stats["peak_queued"] = max(self.stats["peak_queued"], self.queued)
+            started = time.monotonic()
+            try:
+                admitted = self._slot_freed.wait_for(lambda: self.in_flight < self.max_in_flight, timeout)
+            finally:
+                self.queued -= 1
+            waited_ms = (time.monotonic() - started) * 1000
+            self.stats["queue_waits"] += 1
+            self.stats["total_queue_wait_ms"] += waited_ms
+            if not admitted:
+                self.stats["shed_queue_timeout"] += 1
+                raise AdmissionRejected(503, "Server is busy", self._retry_hint())
+            self._take_slot()
+
+    def _take_slot(self) -> None:
+        self.in_flight += 1
+        self.stats["admitted"] += 1
+        self.stats["peak_in_flight"] = max(self.stats["peak_in_flight"], self.in_flight)
+
+    def _release_slot(self, held_seconds: float) -> None:
+        with self._lock:
+            self.in_flight -= 1
+            self._service_seconds = 0.8 * self._service_seconds + 0.2 * held_seconds
+            # Queued requests and hold_slot callers wait on different predicates, so wake them all
+            self._slot_freed.notify_all()
+
+    def _retry_hint(self) -> float:
+        """Rough time for the current backlog to drain (caller holds the lock)"""
+        return self._service_seconds * (self.queued + 1) / self.max_in_flight
@@ -0,0 +1,147 @@
+"""
+Batch replay of recorded conversations for the camp chatbot
+Runs many independent sessions on a worker pool and streams per-turn results as they finish
+"""
+import contextlib
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Callable, ContextManager, Iterator, Optional
+
+_DONE = object()
+
+
+def normalize_sessions(sessions: List[Any]) -> List[Dict[str, Any]]:
+    """
+    Accept [{"session_id": ..., "turns": ["msg", {"message": "msg"}, ...]}, ...]
+    Returns sessions with string turns and a session_id; raises ValueError on malformed input
+    """
+    if not isinstance(sessions, list):
+        raise ValueError("'sessions' must be a list")
+
+    normalized = []
+    for position, session in enumerate(sessions):
+        if not isinstance(session, dict) or not isinstance(session.get('turns'), list):
+            raise ValueError(f"Session {position} must be an object with a 'turns' list")
+        turns = []
+        for turn in session['turns']:
+            message = turn.get('message') if isinstance(turn, dict) else turn
+            if not isinstance(message, str) or not message.strip():
+                raise ValueError(f"Session {position} has an empty or non-text turn")
+            turns.append(message.strip())
+        normalized.append({"session_id": str(session.get('session_id', position)), "turns": turns})
+    return normalized
+
+
+class BatchRunner:
+    """
+    Replays sessions concurrently: one worker per session at a time, turns in order within it
+    Each session gets a fresh chatbot from `spawn_session`, so no state leaks between them
+    Turns that reach the LLM first wait for a global slot from `llm_slot`, so a batch shares the server's
+    in-flight cap instead of adding its workers on top of it
+    """
+
+    def __init__(self, spawn_session: Callable[[], Any], max_workers: int = 4,
+                 llm_slot: Optional[Callable[[Optional[float]], ContextManager]] = None):
+        self.spawn_session = spawn_session
+        self.max_workers = max(1, max_workers)
+        self.llm_slot = llm_slot
+
+    def run(self, sessions: List[Dict[str, Any]]) -> Iterator[Dict[str, Any]]:
+        """
+        Yield one record per turn as it completes, one per finished session, then a summary
+        Records: {"type": "turn" | "session" | "summary", ...}
+        Closing the iterator early cancels sessions that have not started yet
+        """
+        start = time.perf_counter()
+        results = queue.Queue()
+        stop = threading.Event()
+        totals = {"turns": 0, "errors": 0, "degraded": 0, "input_tokens": 0, "output_tokens": 0}
+
+        def replay(session: Dict[str, Any]) -> None:
+            try:
+                self._replay_session(session, results, stop)
+            except Exception as e:
+                results.put({"type": "session", "session_id": session["session_id"], "error": str(e)})
+            finally:
+                results.put(_DONE)
+
+        executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="batch")
+        try:
+            for session in sessions:
+                executor.submit(replay, session)
+
+            remaining = len(sessions)
+            while remaining:
+                record = results.get()
+                if record is _DONE:
+                    remaining -= 1
+                    continue
+                if record["type"] == "turn":
+                    totals["turns"] += 1
+                    totals["errors"] += record["status"] == "error"
+                    totals["degraded"] += record["status"] == "degraded"
+                elif "tokens" in record:
+                    totals["input_tokens"] += record["tokens"].get("total_input_tokens", 0)
+                    totals["output_tokens"] += record["tokens"].get("total_output_tokens", 0)
+                yield record
+        finally:
+            stop.set()
+            executor.shutdown(wait=False, cancel_futures=True)
+
+        elapsed = time.perf_counter() - start
+        yield {
+            "type": "summary",
+            "sessions": len(sessions),
+            "turns": totals["turns"],
+            "errors": totals["errors"],
+            "degraded": totals["degraded"],
+            "total_input_tokens": totals["input_tokens"],
+            "total_output_tokens": totals["output_tokens"],
+            "elapsed_seconds": round(elapsed, 3),
+            "turns_per_second": round(totals["turns"] / elapsed, 2) if elapsed else 0.0,
+            "sessions_per_second": round(len(sessions) / elapsed, 2) if elapsed else 0.0,
+            "max_workers": self.max_workers
+        }
+
+    def _replay_session(self, session: Dict[str, Any], results: queue.Queue, stop: threading.Event) -> None:
+        session_start = time.perf_counter()
+        chatbot = self.spawn_session()
+
+        for turn_index, message in enumerate(session["turns"]):
+            if stop.is_set():
+                return
+            turn_start = time.perf_counter()
+            needs_llm = self.llm_slot and not chatbot.can_answer_locally(message)
+            with self.llm_slot(None) if needs_llm else contextlib.nullcontext():
+                response = chatbot.process_message(message, show_token_details=True)
+            llm_response = chatbot.last_response or {}
+            chatbot.conversation_logger.flush()
+            last_round = chatbot.conversation_logger.last_round()
+            results.put({
+                "type": "turn",
+                "session_id": session["session_id"],
+                "turn_index": turn_index,
+                "message": message,
+                "response": response,
+                "status": self._status(llm_response),
+                "email_draft": llm_response.get("email_draft"),
+                "tokens": last_round["token_summary"] if last_round else {},
+                "latency_ms": round((time.perf_counter() - turn_start) * 1000, 2)
+            })
+
+        results.put({
+            "type": "session",
+            "session_id": session["session_id"],
+            "turns": len(session["turns"]),
+            "tokens": chatbot.conversation_logger.get_session_summary(),
+            "final_state": chatbot.state_manager.get_compact_state(),
+            "elapsed_ms": round((time.perf_counter() - session_start) * 1000, 2)
+        })
+
+    @staticmethod
+    def _status(llm_response: Optional[Dict[str, Any]]) -> str:
+        if not llm_response:
+            return "error"
+        return "degraded" if llm_response.get("degraded") else "success"
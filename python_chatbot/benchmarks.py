@@ -0,0 +1,334 @@
+"""
+Component microbenchmarks for the camp chatbot
+Times each component's hot path on synthetic catalogs scaled from camps_data.csv,
+saves the results as a JSON baseline and flags regressions against a stored one
+
+Usage:
+    python python_chatbot/benchmarks.py run --output benchmark_baseline.json
+    python python_chatbot/benchmarks.py compare --baseline benchmark_baseline.json --threshold 0.25
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+from typing import Dict, Any, List, Callable, Optional
+
+import numpy as np
+import pandas as pd
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+sys.path.append(ROOT_DIR)
+
+from config import Config
+from csv_handler import CSVHandler
+from state_manager import StateManager
+from context_builder import ContextBuilder
+from token_estimator import TokenEstimator
+from catalog_snapshot import compile_snapshot
+from recommender import feature_arrays
+from facets import FacetIndex, generate_suggestions
+from camp_cards import CampCardRenderer, build_card_index
+from dedup import cluster_listings
+from map_clusters import MapClusterEngine, build_cluster_index
+from profile_extractor import ProfileExtractor
+from email_drafts import EmailDraftEngine
+from catalog_payloads import CatalogPayloads, Payload
+
+DEFAULT_SIZES = [1000, 10000, 100000]
+HISTORY_SIZES = [0, 10, 30]  # Messages already in the conversation
+DEFAULT_THRESHOLD = 0.25  # Flag anything more than 25% slower than the baseline
+
+SAMPLE_MESSAGES = [
+    "My daughter Maya is 8 and loves art and swimming",
+    "We live in Frisco and want to stay under $400 a week",
+    "What camps are available in late June?",
+    "Can you compare the two coding camps?",
+    "Please draft an email to the organizer asking about aftercare"
+]
+
+SAMPLE_STATE_UPDATES = {
+    "child_name": "Maya",
+    "child_age": 8,
+    "grade_level": "3rd",
+    "preferred_activities": ["art", "swimming"],
+    "budget_range": "under $400",
+    "location_preference": "Frisco, TX",
+    "scheduling": {"available_dates": ["2025-06-16", "2025-06-23"], "preferred_time_slots": ["morning"]},
+    "session_context": {"current_search_phase": "exploring_options", "camps_being_considered": ["24", "55"]}
+}
+SAMPLE_STATE_OPERATIONS = [
+    {"op": "set", "f": "name", "v": "Maya"},
+    {"op": "set", "f": "age", "v": "8"},
+    {"op": "add", "f": "acts", "v": "art"},
+    {"op": "add", "f": "acts", "v": "swimming"},
+    {"op": "set", "f": "loc", "v": "Frisco, TX"},
+    {"op": "add", "f": "consider", "v": "24"}
+]
+
+
+def synthetic_catalog(rows: int, base_path: Optional[str] = None, seed: int = 0) -> pd.DataFrame:
+    """
+    Scale the real catalog to `rows` rows
+    Replicates camps with fresh ids, numbered names, jittered prices and coordinates
+    """
+    base = pd.read_csv(base_path or os.path.join(ROOT_DIR, Config.CSV_FILE_PATH))
+    random = np.random.RandomState(seed)
+    frame = base.iloc[np.arange(rows) % len(base)].reset_index(drop=True)
+
+    frame['camp_id'] = np.arange(1, rows + 1)
+    frame['camp_name'] = frame['camp_name'].astype(str) + ' #' + (np.arange(rows) // len(base) + 1).astype(str)
+    if 'price' in frame.columns:
+        prices = pd.to_numeric(frame['price'], errors='coerce').fillna(300)
+        frame['price'] = (prices * random.uniform(0.8, 1.2, rows)).round(0)
+    for column in ('latitude', 'longitude'):
+        if column in frame.columns:
+            values = pd.to_numeric(frame[column], errors='coerce')
+            frame[column] = (values + random.uniform(-0.2, 0.2, rows)).round(6)
+    return frame
+
+
+def measure(fn: Callable[[], Any], min_time: float = 0.2, min_batches: int = 3, max_batches: int = 200) -> Dict[str, Any]:
+    """
+    Time fn and summarise per-call times
+    Very fast calls are grouped into batches of at least 1 ms (like timeit's autorange)
+    """
+    def run_batch(number: int) -> float:
+        batch_start = time.perf_counter()
+        for _ in range(number):
+            fn()
+        return time.perf_counter() - batch_start
+
+    number = 1
+    while run_batch(number) < 0.001 and number < 100000:
+        number *= 10
+
+    timings = []
+    started = time.perf_counter()
+    while len(timings) < min_batches or (time.perf_counter() - started < min_time and len(timings) < max_batches):
+        timings.append(run_batch(number) * 1000 / number)
+    return {
+        "calls": len(timings) * number,
+        "min_ms": round(min(timings), 6),
+        "median_ms": round(statistics.median(timings), 6),
+        "mean_ms": round(statistics.fmean(timings), 6)
+    }
+
+
+@contextlib.contextmanager
+def quiet():
+    """Silence component progress prints while timing"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        yield
+
+
+def _fill_history(context_builder: ContextBuilder, messages: int) -> None:
+    context_builder.clear_history()
+    for turn in range(messages):
+        role = "user" if turn % 2 == 0 else "assistant"
+        context_builder.add_to_history(role, SAMPLE_MESSAGES[turn % len(SAMPLE_MESSAGES)])
+
+
+def bench_catalog(rows: int, workdir: str) -> Dict[str, Dict[str, Any]]:
+    """Benchmarks whose cost depends on the catalog size"""
+    results = {}
+    path = os.path.join(workdir, f"camps_{rows}.csv")
+    synthetic_catalog(rows).to_csv(path, index=False)
+
+    snapshot_path = os.path.join(workdir, f"camps_{rows}.snapshot.npz")
+    compile_snapshot(path, snapshot_path)
+
+    with quiet():
+        csv_handler = CSVHandler(path)
+        results["csv_handler.load_csv"] = measure(csv_handler.load_csv)
+        snapshot_handler = CSVHandler(path, snapshot_path=snapshot_path)
+        results["csv_handler.load_csv[source=snapshot]"] = measure(snapshot_handler.load_csv)
+
+        # Cold start: load the catalog and build the recommender's scoring arrays
+        for source, handler in (("csv", csv_handler), ("snapshot", snapshot_handler)):
+            results[f"startup.load_and_index[source={source}]"] = measure(
+                lambda: (handler.load_csv(), feature_arrays(handler))
+            )
+    results["csv_handler.get_csv_as_json_string"] = measure(csv_handler.get_csv_as_json_string)
+    results["csv_handler.search_camps"] = measure(lambda: csv_handler.search_camps("art"))
+
+    profile_extractor = ProfileExtractor(csv_handler)
+    results["profile_extractor.operations"] = measure(
+        lambda: [profile_extractor.operations(message, {}) for message in SAMPLE_MESSAGES]
+    )
+
+    state_manager = StateManager()
+    state_manager.update_state(SAMPLE_STATE_UPDATES)
+    email_drafts = EmailDraftEngine(csv_handler, from_address=Config.EMAIL_FROM_ADDRESS)
+    email_state = {**state_manager.get_state(), "session_context": {"camps_being_considered": ["24"]}}
+    with quiet():
+        results["email_drafts.draft"] = measure(lambda: email_drafts.draft(SAMPLE_MESSAGES[-1], email_state))
+    context_builder = ContextBuilder(csv_handler, state_manager)
+    prompt = ""
+    for history in HISTORY_SIZES:
+        _fill_history(context_builder, history)
+        results[f"context_builder.build_context_prompt[history={history}]"] = measure(
+            lambda: context_builder.build_context_prompt(SAMPLE_MESSAGES[0])
+        )
+        prompt = context_builder.build_context_prompt(SAMPLE_MESSAGES[0])
+
+    features = feature_arrays(csv_handler)
+    results["facets.build"] = measure(lambda: FacetIndex(features))
+    facets = FacetIndex(features)
+    compact = state_manager.get_compact_state()
+    results["facets.counts[empty]"] = measure(facets.counts)
+    results["facets.counts[profile]"] = measure(lambda: facets.counts({"categories": ["Arts & Digital Media"], "grade": 3, "max_price": 400}))
+    results["generate_suggestions[empty]"] = measure(lambda: generate_suggestions(facets, {}))
+    results["generate_suggestions[profile]"] = measure(lambda: generate_suggestions(facets, compact))
+
+    camp_ids = features["camp_ids"][:3]
+    results["camp_cards.build_card_index"] = measure(lambda: build_card_index(csv_handler.csv_data))
+    card_renderer = CampCardRenderer(csv_handler)
+    results["camp_cards.render[cached]"] = measure(lambda: card_renderer.render(camp_ids))
+
+    results["map_clusters.build"] = measure(lambda: build_cluster_index(features))
+    map_engine = MapClusterEngine(csv_handler)
+    viewport = [-97.5, 32.5, -96.3, 33.4]
+    results["map_clusters.clusters[zoom=10]"] = measure(lambda: map_engine.clusters(viewport, 10))
+    results["map_clusters.clusters[zoom=10,filtered]"] = measure(
+        lambda: map_engine.clusters(viewport, 10, {"categories": ["Arts & Digital Media"], "grade": 3})
+    )
+
+    # /camps page: encoding the JSON (and gzip) on every request vs the per-version payload cache
+    payloads = CatalogPayloads(csv_handler)
+    page_size = payloads.page_size
+    results["catalog_payloads.page[serialize_per_request]"] = measure(
+        lambda: Payload(json.dumps({"camps": csv_handler.csv_data.head(page_size).to_dict("records"),
+                                    "total": len(csv_handler.csv_data)}, default=str).encode("utf-8"))
+    )
+    payloads.page()
+    results["catalog_payloads.page[cached]"] = measure(payloads.page)
+    etag = payloads.page().etags["gzip"]
+    results["catalog_payloads.page[not_modified]"] = measure(lambda: payloads.page().matches(etag))
+
+    results["dedup.cluster_listings[cold]"] = measure(lambda: cluster_listings(csv_handler.csv_data))
+    signature_cache = {}
+    cluster_listings(csv_handler.csv_data, signature_cache)
+    results["dedup.cluster_listings[reload]"] = measure(lambda: cluster_listings(csv_handler.csv_data, signature_cache))
+
+    token_estimator = TokenEstimator()
+    results["token_estimator.estimate_prompt_tokens"] = measure(lambda: token_estimator.estimate_prompt_tokens(prompt))
+
+    return {f"{name}[rows={rows}]": result for name, result in results.items()}
+
+
+def bench_state() -> Dict[str, Dict[str, Any]]:
+    """Benchmarks independent of the catalog"""
+    results = {}
+    state_manager = StateManager()
+
+    def update_fresh():
+        state_manager.reset_state()
+        state_manager.update_state(SAMPLE_STATE_UPDATES)
+
+    results["state_manager.update_state"] = measure(update_fresh)
+
+    def apply_fresh():
+        state_manager.reset_state()
+        state_manager.apply_operations(SAMPLE_STATE_OPERATIONS)
+
+    results["state_manager.apply_operations"] = measure(apply_fresh)
+    results["state_manager.get_compact_state"] = measure(state_manager.get_compact_state)
+    return results
+
+
+def run_suite(sizes: List[int]) -> Dict[str, Any]:
+    """Run every benchmark and return a baseline document"""
+    results = {}
+    with quiet():
+        results.update(bench_state())
+    with tempfile.TemporaryDirectory() as workdir:
+        for rows in sizes:
+            print(f"Benchmarking catalog of {rows:,} rows...")
+            results.update(bench_catalog(rows, workdir))
+
+    return {
+        "meta": {
+            "created": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "pandas": pd.__version__,
+            "sizes": sizes
+        },
+        "results": results
+    }
+
+
+def compare(current: Dict[str, Any], baseline: Dict[str, Any], threshold: float = DEFAULT_THRESHOLD) -> List[Dict[str, Any]]:
+    """
+    Compare best-of-run times against a baseline (the minimum is the least noisy statistic)
+    Returns one row per benchmark present in both; 'regression' is set when slower by more than threshold
+    """
+    rows = []
+    for name, result in current["results"].items():
+        previous = baseline.get("results", {}).get(name)
+        if not previous or not previous.get("min_ms"):
+            continue
+        ratio = result["min_ms"] / previous["min_ms"]
+        rows.append({
+            "benchmark": name,
+            "baseline_ms": previous["min_ms"],
+            "current_ms": result["min_ms"],
+            "ratio": round(ratio, 3),
+            "regression": ratio > 1 + threshold
+        })
+    return rows
+
+
+def print_results(document: Dict[str, Any]) -> None:
+    for name, result in document["results"].items():
+        print(f"{name:<75} {result['median_ms']:>12.4f} ms  (min {result['min_ms']:.4f}, {result['calls']} calls)")
+
+
+def print_comparison(rows: List[Dict[str, Any]]) -> None:
+    for row in rows:
+        flag = "  ⚠️  REGRESSION" if row["regression"] else ""
+        print(f"{row['benchmark']:<75} {row['baseline_ms']:>10.4f} → {row['current_ms']:>10.4f} ms  x{row['ratio']:.2f}{flag}")
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Camp chatbot component microbenchmarks")
+    parser.add_argument("mode", choices=["run", "compare"])
+    parser.add_argument("--sizes", default=",".join(str(size) for size in DEFAULT_SIZES),
+                        help="Comma-separated synthetic catalog sizes")
+    parser.add_argument("--output", help="Write results as a JSON baseline")
+    parser.add_argument("--baseline", default="benchmark_baseline.json", help="Baseline to compare against")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                        help="Allowed slowdown before flagging (0.25 = 25%%)")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",") if size.strip()]
+    document = run_suite(sizes)
+
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+        print(f"Saved results to {args.output}")
+
+    if args.mode == "run":
+        print_results(document)
+        return 0
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    rows = compare(document, baseline, args.threshold)
+    print_comparison(rows)
+    regressions = [row for row in rows if row["regression"]]
+    print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%} across {len(rows)} benchmarks")
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,351 @@
+"""
+Offline bulk recommendations for the camp chatbot
+Streams family profiles from a CSV or JSONL file in chunks, ranks the catalog for each chunk in a
+process pool that shares one loaded catalog, and writes ranked results as CSV or JSONL.
+The LLM is only called with --narrate, for a short write-up per profile after ranking
+
+Profile fields (CSV columns or JSONL keys), all optional:
+    profile_id, child_name, child_age, grade_level, budget_range, max_price, preferred_activities,
+    location_preference, latitude, longitude, available_dates, camps_ruled_out
+List fields in CSV cells are separated by ';' or '|'
+
+Usage:
+    python python_chatbot/bulk_recommend.py profiles.csv --output recommendations.csv
+    python python_chatbot/bulk_recommend.py profiles.jsonl --output recommendations.jsonl --k 3 --workers 4
+    python python_chatbot/bulk_recommend.py profiles.csv --output recommendations.jsonl --explain --narrate
+"""
+import argparse
+import contextlib
+import csv
+import io
+import json
+import multiprocessing
+import os
+import re
+import sys
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from itertools import islice
+from typing import Dict, Any, List, Iterator, Optional
+
+import numpy as np
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from config import Config
+from csv_handler import CSVHandler
+from recommender import RecommendationEngine
+
+DEFAULT_CHUNK_SIZE = 2000
+SCORE_BATCH_CELLS = 1 << 21
+CSV_FIELDS = ["profile_id", "rank", "camp_id", "camp_name", "organization_name", "city", "price", "grades", "score"]
+
+_LIST_SEPARATOR = re.compile(r"\s*[;|]\s*")
+_TEXT_FIELDS = ("child_name", "grade_level", "budget_range", "location_preference")
+_NUMBER_FIELDS = ("max_price", "latitude", "longitude")
+
+_engine = None  # Per-process engine; forked workers inherit the parent's already indexed catalog
+_locations = {}  # Location preference -> (lat, lon) or None; families share a handful of towns
+
+
+def load_engine(csv_path: str, snapshot_path: Optional[str] = None) -> RecommendationEngine:
+    """Load the catalog and build the scoring arrays and gazetteer up front"""
+    with contextlib.redirect_stdout(io.StringIO()):
+        csv_handler = CSVHandler(csv_path, snapshot_path=snapshot_path)
+    engine = RecommendationEngine(
+        csv_handler,
+        weights=Config.RECOMMENDATION_WEIGHTS,
+        distance_scale_km=Config.RECOMMENDATION_DISTANCE_SCALE_KM,
+        gazetteer_path=Config.GAZETTEER_TABLE_PATH
+    )
+    engine.features()
+    engine.gazetteer()
+    return engine
+
+
+def _init_worker(csv_path: str, snapshot_path: Optional[str]) -> None:
+    global _engine
+    if _engine is None:
+        _engine = load_engine(csv_path, snapshot_path)
+
+
+def _present(value: Any) -> bool:
+    return value is not None and value == value and str(value).strip() != ""
+
+
+def _as_list(value: Any) -> List[str]:
+    if isinstance(value, list):
+        return [str(item).strip() for item in value if _present(item)]
+    return [item for item in _LIST_SEPARATOR.split(str(value).strip()) if item] if _present(value) else []
+
+
+def profile_state(record: Dict[str, Any]) -> Dict[str, Any]:
+    """StateManager-style state for one input record (unparseable numbers are ignored)"""
+    state = {key: str(record[key]).strip() for key in _TEXT_FIELDS if _present(record.get(key))}
+    if _present(record.get("child_age")):
+        try:
+            state["child_age"] = int(float(record["child_age"]))
+        except (TypeError, ValueError):
+            pass
+    for key in _NUMBER_FIELDS:
+        if _present(record.get(key)):
+            try:
+                state[key] = float(record[key])
+            except (TypeError, ValueError):
+                pass
+    activities = _as_list(record.get("preferred_activities"))
+    if activities:
+        state["preferred_activities"] = activities
+    dates = _as_list(record.get("available_dates"))
+    if dates:
+        state["scheduling"] = {"available_dates": dates}
+    ruled_out = _as_list(record.get("camps_ruled_out"))
+    if ruled_out:
+        state["session_context"] = {"camps_ruled_out": ruled_out}
+    return state
+
+
+def rank_chunk(records: List[Dict[str, Any]], first_index: int, k: int, explain: bool) -> List[Dict[str, Any]]:
+    """
+    Rank the catalog for a chunk of profiles (runs in a worker process)
+    Without `explain` the whole chunk is scored in one batched pass; with it each profile
+    goes through RecommendationEngine.recommend for per-factor reasons
+    """
+    engine = _engine
+    features = engine.features()
+    states = [profile_state(record) for record in records]
+    profile_ids = [
+        str(record["profile_id"]) if _present(record.get("profile_id")) else str(first_index + offset)
+        for offset, record in enumerate(records)
+    ]
+
+    if explain:
+        results = []
+        for profile_id, state in zip(profile_ids, states):
+            ranked = engine.recommend(state, k=k)["recommendations"]
+            for camp in ranked:
+                camp["reasons"] = "; ".join(f"{name}: {factor['detail']}" for name, factor in camp.pop("factors").items())
+            results.append({"profile_id": profile_id, "state": state, "recommendations": ranked})
+        return results
+
+    profiles = [engine.build_profile(state, _location_override(engine, state)) for state in states]
+    # Score in slices of about SCORE_BATCH_CELLS profile x camp cells so the matrices stay cache-sized
+    step = max(1, SCORE_BATCH_CELLS // max(1, features["count"]))
+    tops, scores = [], []
+    for start in range(0, len(profiles), step):
+        totals = engine.score_batch(profiles[start:start + step])
+        top = engine.rank(totals, k)
+        tops.extend(top)
+        scores.extend(np.take_along_axis(totals, top, axis=-1))
+    results = []
+    for profile_id, state, top, top_scores in zip(profile_ids, states, tops, scores):
+        ranked = []
+        for row, score in zip(top, top_scores):
+            if score < 0:
+                continue
+            low, high = int(features["min_grade"][row]), int(features["max_grade"][row])
+            ranked.append({
+                "camp_id": features["camp_ids"][row],
+                "camp_name": features["names"][row],
+                "organization_name": features["organizations"][row],
+                "city": features["cities"][row],
+                "price": float(features["price"][row]),
+                "grades": f"{'K' if low == 0 else low}-{high}",
+                "score": round(float(score), 4)
+            })
+        results.append({"profile_id": profile_id, "state": state, "recommendations": ranked})
+    return results
+
+
+def _location_override(engine: RecommendationEngine, state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+    """Coordinates for the state's location preference, resolved once per distinct text"""
+    location = state.get("location_preference")
+    if not location or "latitude" in state:
+        return None
+    if location not in _locations:
+        _locations[location] = engine.resolve_location(location)
+    coordinates = _locations[location]
+    return {"latitude": coordinates[0], "longitude": coordinates[1]} if coordinates else {"location_preference": ""}
+
+
+def read_profiles(path: str, chunk_size: int) -> Iterator[List[Dict[str, Any]]]:
+    """Input records in chunks, without loading the whole file"""
+    if path.endswith((".jsonl", ".ndjson")):
+        with open(path, encoding="utf-8") as f:
+            lines = (line for line in f if line.strip())
+            while True:
+                chunk = [json.loads(line) for line in islice(lines, chunk_size)]
+                if not chunk:
+                    return
+                yield chunk
+    else:
+        for frame in pd.read_csv(path, dtype=str, keep_default_na=False, chunksize=chunk_size):
+            yield frame.to_dict("records")
+
+
+def narration_prompt(result: Dict[str, Any]) -> str:
+    camps = "\n".join(
+        f"{rank}. {camp['camp_name']} ({camp['organization_name']}, {camp['city']}) - "
+        f"${camp['price']:.0f}/week, grades {camp['grades']}" + (f" - {camp['reasons']}" if camp.get("reasons") else "")
+        for rank, camp in enumerate(result["recommendations"], 1)
+    )
+    return f"""You are an expert Educational Advisor for K-12 summer programs.
+Write 2-3 warm sentences for a parent explaining why these camps suit their child. Mention camps by name and do not invent details.
+
+**LEARNER PROFILE:**
+{json.dumps(result["state"])}
+
+**TOP CAMPS:**
+{camps}
+
+Respond with ONLY a JSON object: {{"r": "your sentences"}}"""
+
+
+class Narrator:
+    """Optional LLM pass: one short write-up per ranked profile, a few calls at a time"""
+
+    def __init__(self, max_workers: int = 4):
+        from llm_handler import LLMHandler  # Only needed (and configured) when narrating
+        self.llm_handler = LLMHandler()
+        self.pool = ThreadPoolExecutor(max_workers=max_workers)
+        self.stats = {"narrated": 0, "failed": 0}
+
+    def narrate(self, results: List[Dict[str, Any]]) -> None:
+        for result, narration in zip(results, self.pool.map(self._narrate_one, results)):
+            result["narration"] = narration
+
+    def _narrate_one(self, result: Dict[str, Any]) -> str:
+        if not result["recommendations"]:
+            return ""
+        try:
+            narration = self.llm_handler.generate_response_raw(narration_prompt(result))["response"]
+            self.stats["narrated"] += 1
+            return narration
+        except Exception as e:
+            self.stats["failed"] += 1
+            print(f"Narration failed for profile {result['profile_id']}: {e}", file=sys.stderr)
+            return ""
+
+
+class ResultWriter:
+    """JSONL: one line per profile. CSV: one row per recommended camp (a blank row if none)"""
+
+    def __init__(self, path: str, explain: bool, narrate: bool):
+        self.file = open(path, "w", encoding="utf-8", newline="")
+        self.jsonl = path.endswith((".jsonl", ".ndjson"))
+        self.csv = None
+        self.camp_fields = CSV_FIELDS[2:] + (["reasons"] if explain else [])
+        self.narrate = narrate
+        if not self.jsonl:
+            self.csv = csv.writer(self.file)
+            self.csv.writerow(CSV_FIELDS[:2] + self.camp_fields + (["narration"] if narrate else []))
+
+    def write(self, results: List[Dict[str, Any]]) -> None:
+        for result in results:
+            if self.jsonl:
+                self.file.write(json.dumps({key: value for key, value in result.items() if key != "state"}) + "\n")
+                continue
+            tail = [result.get("narration", "")] if self.narrate else []
+            rows = [
+                [result["profile_id"], rank] + [camp.get(field, "") for field in self.camp_fields] + tail
+                for rank, camp in enumerate(result["recommendations"], 1)
+            ]
+            self.csv.writerows(rows or [[result["profile_id"], ""] + [""] * len(self.camp_fields) + tail])
+
+    def close(self) -> None:
+        self.file.close()
+
+
+def run(input_path: str, output_path: str, k: int = 5, workers: Optional[int] = None,
+        chunk_size: int = DEFAULT_CHUNK_SIZE, explain: bool = False, narrate: bool = False,
+        csv_path: str = Config.CSV_FILE_PATH, snapshot_path: Optional[str] = Config.CATALOG_SNAPSHOT_PATH) -> Dict[str, Any]:
+    """
+    Rank every profile in `input_path` and write the results to `output_path`
+    workers: processes to score chunks in (default: CPU count; 0 = score in this process)
+    At most 2 chunks per worker are in flight, so memory stays bounded for any input size
+    """
+    global _engine
+    start = time.perf_counter()
+    workers = (os.cpu_count() or 1) if workers is None else workers
+    _engine = load_engine(csv_path, snapshot_path)
+    load_seconds = time.perf_counter() - start
+
+    narrator = Narrator(max_workers=Config.BATCH_MAX_WORKERS) if narrate else None
+    writer = ResultWriter(output_path, explain, narrate)
+    stats = {"profiles": 0, "chunks": 0, "recommendations": 0, "without_results": 0}
+
+    def finish(results: List[Dict[str, Any]]) -> None:
+        if narrator:
+            narrator.narrate(results)
+        writer.write(results)
+        stats["chunks"] += 1
+        stats["profiles"] += len(results)
+        stats["recommendations"] += sum(len(result["recommendations"]) for result in results)
+        stats["without_results"] += sum(1 for result in results if not result["recommendations"])
+
+    chunks = read_profiles(input_path, chunk_size)
+    first_index = 0
+    try:
+        if workers <= 0:
+            for records in chunks:
+                finish(rank_chunk(records, first_index, k, explain))
+                first_index += len(records)
+        else:
+            # fork shares the loaded catalog with the workers; elsewhere each worker loads its own copy
+            context = multiprocessing.get_context("fork" if "fork" in multiprocessing.get_all_start_methods() else None)
+            with ProcessPoolExecutor(max_workers=workers, mp_context=context, initializer=_init_worker,
+                                     initargs=(csv_path, snapshot_path)) as pool:
+                pending = deque()
+                for records in chunks:
+                    pending.append(pool.submit(rank_chunk, records, first_index, k, explain))
+                    first_index += len(records)
+                    if len(pending) >= 2 * workers:
+                        finish(pending.popleft().result())
+                while pending:
+                    finish(pending.popleft().result())
+    finally:
+        writer.close()
+
+    elapsed = time.perf_counter() - start
+    return {
+        **stats,
+        "workers": workers,
+        "catalog_camps": _engine.features()["count"],
+        "catalog_load_seconds": round(load_seconds, 3),
+        "elapsed_seconds": round(elapsed, 3),
+        "profiles_per_second": round(stats["profiles"] / elapsed, 1) if elapsed > 0 else 0.0,
+        **({"narration": narrator.stats} if narrator else {})
+    }
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Rank camps for many family profiles offline")
+    parser.add_argument("input", help="Profiles as .csv or .jsonl")
+    parser.add_argument("--output", required=True, help="Results as .csv (one row per camp) or .jsonl (one line per profile)")
+    parser.add_argument("--k", type=int, default=Config.RECOMMENDATION_DEFAULT_K, help="Camps per profile")
+    parser.add_argument("--workers", type=int, help="Worker processes (default: CPU count; 0 = no pool)")
+    parser.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE, help="Profiles per chunk")
+    parser.add_argument("--explain", action="store_true", help="Add per-factor reasons (slower, profile by profile)")
+    parser.add_argument("--narrate", action="store_true", help="Ask the LLM for a short write-up per profile")
+    parser.add_argument("--catalog", default=Config.CSV_FILE_PATH, help="Catalog CSV")
+    parser.add_argument("--snapshot", default=Config.CATALOG_SNAPSHOT_PATH, help="Compiled catalog snapshot, if any")
+    args = parser.parse_args(argv)
+
+    if args.k > Config.RECOMMENDATION_MAX_K or args.k < 1:
+        parser.error(f"--k must be between 1 and {Config.RECOMMENDATION_MAX_K}")
+    summary = run(args.input, args.output, k=args.k, workers=args.workers, chunk_size=max(1, args.chunk_size),
+                  explain=args.explain, narrate=args.narrate, csv_path=args.catalog, snapshot_path=args.snapshot)
+    print(f"Ranked {summary['profiles']:,} profiles against {summary['catalog_camps']:,} camps in "
+          f"{summary['elapsed_seconds']:.2f}s ({summary['profiles_per_second']:,.0f} profiles/s, "
+          f"{summary['workers']} worker(s)) -> {args.output}")
+    if summary["without_results"]:
+        print(f"{summary['without_results']:,} profile(s) had no matching camps")
+    if "narration" in summary:
+        print(f"Narrated {summary['narration']['narrated']:,} profile(s), {summary['narration']['failed']:,} failed")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
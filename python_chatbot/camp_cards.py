@@ -0,0 +1,198 @@
+"""
+Server-side camp card rendering for the camp chatbot
+In Detailed Mode the model names camps by camp_id (plus an optional one-line highlight) and the
+cards are filled in here from the catalog, so card text never has to be generated token by token
+"""
+import re
+import string
+import time
+from datetime import date
+from typing import Dict, Any, Optional
+
+import pandas as pd
+
+from token_estimator import TokenEstimator
+
+CARD_DIVIDER = "━" * 40
+DESCRIPTION_MAX_CHARS = 280
+SESSIONS_SHOWN = 6
+HIGHLIGHT_MAX_CHARS = 200
+
+_CARD_TEMPLATE = string.Template(
+    CARD_DIVIDER + "\n"
+    "🏕️ **${name}**\n"
+    "🏢 Provider: ${organization}\n"
+    "📍 Location: ${location}\n"
+    "💰 Cost: ${price} per week\n"
+    "👥 Grades: ${grades}\n"
+    "📅 Sessions: ${sessions}\n"
+    "\n"
+    "🎯 **What Your Child Will Do:**\n"
+    "${description}\n"
+    "\n"
+    "🌟 **Focus Areas:**\n"
+    "${categories}"
+)
+_WHITESPACE = re.compile(r"\s+")
+
+
+def build_card_index(frame: pd.DataFrame) -> Dict[str, Any]:
+    """
+    camp_id / lowercased camp_name -> row, plus the per-camp card cache
+    Built once per catalog version via CSVHandler.get_derived, so cached cards die with the catalog
+    """
+    count = len(frame) if frame is not None else 0
+    camp_ids = frame['camp_id'].astype(str).tolist() if frame is not None and 'camp_id' in frame.columns \
+        else [str(row) for row in range(count)]
+    names = frame['camp_name'].astype(str).tolist() if frame is not None and 'camp_name' in frame.columns else []
+    rows_by_name = {}
+    for row, name in enumerate(names):
+        rows_by_name.setdefault(name.lower(), row)
+    return {
+        "rows_by_id": {camp_id: row for row, camp_id in enumerate(camp_ids)},
+        "rows_by_name": rows_by_name,
+        "cards": {}  # row -> (card body, estimated tokens)
+    }
+
+
+def _text(value: Any, default: str = "") -> str:
+    if value is None or (isinstance(value, float) and value != value):
+        return default
+    return _WHITESPACE.sub(" ", str(value)).strip() or default
+
+
+def _excerpt(text: str, limit: int) -> str:
+    if len(text) <= limit:
+        return text
+    cut = text[:limit].rsplit(" ", 1)[0].rstrip(",;:.")
+    return f"{cut}…"
+
+
+def _format_price(value: Any) -> str:
+    try:
+        price = float(value)
+    except (TypeError, ValueError):
+        return "Contact provider"
+    return f"${price:,.0f}" if price == int(price) else f"${price:,.2f}"
+
+
+def _format_grades(low: Any, high: Any) -> str:
+    try:
+        low, high = int(float(low)), int(float(high))
+    except (TypeError, ValueError):
+        return "All grades"
+    return f"{'K' if low == 0 else low}-{high}"
+
+
+def _format_range(start: date, end: date) -> str:
+    if start == end:
+        return f"{start:%b} {start.day}"
+    if start.month == end.month:
+        return f"{start:%b} {start.day}–{end.day}"
+    return f"{start:%b} {start.day}–{end:%b} {end.day}"
+
+
+class CampCardRenderer:
+    """
+    Renders Detailed Mode camp cards from camp ids
+    Card bodies are rendered once per camp and catalog version; highlights are added per response
+    """
+
+    def __init__(self, csv_handler, max_cards: int = 5, token_estimator: Optional[TokenEstimator] = None):
+        self.csv_handler = csv_handler
+        self.max_cards = max_cards
+        self.token_estimator = token_estimator or TokenEstimator()
+        self.stats = {
+            "responses": 0,
+            "cards_rendered": 0,
+            "cache_hits": 0,
+            "unknown_ids": 0,
+            "output_tokens_avoided": 0,
+            "render_ms": 0.0
+        }
+
+    def index(self) -> Dict[str, Any]:
+        return self.csv_handler.get_derived("camp_cards", build_card_index)
+
+    def render(self, camp_ids: Any, highlights: Optional[Dict[str, Any]] = None) -> str:
+        """
+        Cards for the given camp ids, in order (duplicates and unknown ids are skipped)
+        Names are accepted as a fallback for ids; highlights map camp_id -> one short sentence
+        """
+        start = time.perf_counter()
+        if isinstance(camp_ids, (str, int)):
+            camp_ids = [camp_ids]
+        highlights = highlights if isinstance(highlights, dict) else {}
+
+        index = self.index()
+        cards, seen = [], set()
+        for camp_id in list(camp_ids or [])[:self.max_cards]:
+            key = _text(camp_id)
+            row = index["rows_by_id"].get(key)
+            if row is None:
+                row = index["rows_by_name"].get(key.lower())
+            if row is None:
+                self.stats["unknown_ids"] += 1
+                continue
+            if row in seen:
+                continue
+            seen.add(row)
+
+            body, card_tokens = self._card(index, row)
+            highlight = _excerpt(_text(highlights.get(key)), HIGHLIGHT_MAX_CHARS)
+            if highlight:
+                body = f"{body}\n\n✨ **Why it fits:** {highlight}"
+            cards.append(f"{body}\n{CARD_DIVIDER}")
+
+            # The model emitted the id (and highlight) instead of the card text
+            self.stats["output_tokens_avoided"] += max(0, card_tokens - self.token_estimator.estimate_text_tokens(key))
+
+        self.stats["responses"] += 1
+        self.stats["render_ms"] += (time.perf_counter() - start) * 1000
+        return "\n\n".join(cards)
+
+    def get_stats(self) -> Dict[str, Any]:
+        responses = self.stats["responses"]
+        return {
+            **{key: value for key, value in self.stats.items() if key != "render_ms"},
+            "avg_render_ms": round(self.stats["render_ms"] / responses, 3) if responses else 0.0,
+            "cached_cards": len(self.index()["cards"])
+        }
+
+    def _card(self, index: Dict[str, Any], row: int) -> tuple:
+        """Rendered card body for a catalog row (cached), with its estimated token count"""
+        cached = index["cards"].get(row)
+        if cached is not None:
+            self.stats["cache_hits"] += 1
+            return cached
+
+        record = self.csv_handler.csv_json[row]
+        categories = [category.strip() for category in _text(record.get("categories")).split(",") if category.strip()]
+        body = _CARD_TEMPLATE.substitute(
+            name=_text(record.get("camp_name"), "Unnamed camp"),
+            organization=_text(record.get("organization_name"), "Not listed"),
+            location=_text(record.get("formatted_address"), "Not listed"),
+            price=_format_price(record.get("price")),
+            grades=_format_grades(record.get("min_grade"), record.get("max_grade")),
+            sessions=self._sessions(row),
+            description=_excerpt(_text(record.get("description"), "No description provided."), DESCRIPTION_MAX_CHARS),
+            categories="\n".join(f"• {category}" for category in categories) or "• General enrichment"
+        )
+        cached = (body, self.token_estimator.estimate_text_tokens(body))
+        index["cards"][row] = cached
+        self.stats["cards_rendered"] += 1
+        return cached
+
+    def _sessions(self, row: int) -> str:
+        sessions = self.csv_handler.get_session_index()
+        first, last = sessions["indptr"][row], sessions["indptr"][row + 1]
+        ranges = [
+            _format_range(start.item(), end.item())
+            for start, end in sorted(zip(sessions["start"][first:last], sessions["end"][first:last]))
+        ]
+        if not ranges:
+            return "Contact provider for dates"
+        shown = ", ".join(ranges[:SESSIONS_SHOWN])
+        if len(ranges) > SESSIONS_SHOWN:
+            shown += f" (+{len(ranges) - SESSIONS_SHOWN} more)"
+        return shown
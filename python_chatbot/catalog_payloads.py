@@ -0,0 +1,243 @@
+"""
+Pre-serialized catalog payloads for the camp chatbot
+/camps pages and /camps/<id> records are encoded (JSON, gzip and, when installed, brotli) once per
+catalog version and field projection, with a strong ETag each, so repeat loads cost a lookup or a 304
+"""
+import base64
+import gzip
+import hashlib
+import json
+import math
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+import pandas as pd
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+GZIP_LEVEL = 6
+BROTLI_QUALITY = 9
+MIN_COMPRESS_BYTES = 256  # Smaller bodies are sent as they are
+
+
+def _clean(value: Any) -> Any:
+    """JSON-safe cell value (NaN -> null)"""
+    if isinstance(value, float) and math.isnan(value):
+        return None
+    return value
+
+
+def _dumps(value: Any) -> bytes:
+    return json.dumps(value, separators=(",", ":"), ensure_ascii=False, default=str).encode("utf-8")
+
+
+def _record_json(record: Dict[str, Any], fields: Optional[Tuple[str, ...]] = None) -> bytes:
+    return _dumps({key: _clean(record.get(key)) for key in (fields if fields is not None else record)})
+
+
+def encode_cursor(camp_id: str) -> str:
+    return base64.urlsafe_b64encode(camp_id.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        return base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+    except (ValueError, UnicodeDecodeError):
+        raise ValueError(f"invalid cursor: {cursor!r}")
+
+
+class Payload:
+    """One encoded response body with its per-encoding variants and strong ETags"""
+
+    def __init__(self, body: bytes):
+        self.encodings = {"identity": body}
+        if len(body) >= MIN_COMPRESS_BYTES:
+            self.encodings["gzip"] = gzip.compress(body, compresslevel=GZIP_LEVEL, mtime=0)
+            if brotli is not None:
+                self.encodings["br"] = brotli.compress(body, quality=BROTLI_QUALITY)
+        digest = hashlib.blake2b(body, digest_size=16).hexdigest()
+        # Each encoding is its own representation, so it gets its own strong validator
+        self.etags = {
+            encoding: f'"{digest}"' if encoding == "identity" else f'"{digest}-{encoding}"'
+            for encoding in self.encodings
+        }
+
+    def matches(self, if_none_match: Optional[str]) -> bool:
+        """Whether an If-None-Match header names any representation of this body"""
+        if not if_none_match:
+            return False
+        if if_none_match.strip() == "*":
+            return True
+        tags = {tag.strip() for tag in if_none_match.split(",")}
+        return any(etag in tags for etag in self.etags.values())
+
+    def negotiate(self, accept_encoding: Optional[str]) -> str:
+        """Best available encoding for an Accept-Encoding header: br, then gzip, then identity"""
+        accepted = {}
+        for part in (accept_encoding or "").split(","):
+            name, _, params = part.strip().partition(";")
+            quality = 1.0
+            if params.strip().startswith("q="):
+                try:
+                    quality = float(params.strip()[2:])
+                except ValueError:
+                    quality = 0.0
+            if name:
+                accepted[name.strip().lower()] = quality
+        for encoding in ("br", "gzip"):
+            if encoding in self.encodings and accepted.get(encoding, accepted.get("*", 0.0)) > 0:
+                return encoding
+        return "identity"
+
+
+def build_payload_index(frame: pd.DataFrame) -> Dict[str, Any]:
+    """camp_id -> row, plus the per-record JSON cache (each record serialized with all fields on first use)"""
+    count = len(frame) if frame is not None else 0
+    camp_ids = frame['camp_id'].astype(str).tolist() if frame is not None and 'camp_id' in frame.columns \
+        else [str(row) for row in range(count)]
+    return {
+        "count": count,
+        "fields": list(frame.columns) if frame is not None else [],
+        "camp_ids": camp_ids,
+        "rows_by_id": {camp_id: row for row, camp_id in reversed(list(enumerate(camp_ids)))},
+        "record_bytes": [None] * count,
+        "payloads": OrderedDict()  # ("page", fields, filters, cursor, limit) / ("camp", fields, row) -> Payload, LRU
+    }
+
+
+class CatalogPayloads:
+    """
+    Serves /camps and /camps/<id> bodies from a per-catalog-version cache of encoded payloads
+    Pages are keyed by projection, cursor and limit; the cache dies with the catalog on reload
+    """
+
+    def __init__(self, csv_handler, page_size: int = 100, max_page_size: int = 1000, cache_entries: int = 256):
+        self.csv_handler = csv_handler
+        self.page_size = page_size
+        self.max_page_size = max_page_size
+        self.cache_entries = cache_entries
+        self._lock = threading.Lock()
+        self.stats = {
+            "requests": 0,
+            "payloads_built": 0,
+            "cache_hits": 0,
+            "not_modified": 0,
+            "bytes_sent": 0,
+            "bytes_uncompressed": 0,
+            "build_ms": 0.0
+        }
+
+    def index(self) -> Dict[str, Any]:
+        return self.csv_handler.get_derived("catalog_payloads", build_payload_index)
+
+    def parse_fields(self, fields: Optional[str]) -> Optional[Tuple[str, ...]]:
+        """'camp_id,camp_name,price' -> field tuple (camp_id always first); None for all fields"""
+        if not fields:
+            return None
+        known = self.index()["fields"]
+        requested = [field.strip() for field in fields.split(",") if field.strip()]
+        unknown = [field for field in requested if field not in known]
+        if unknown:
+            raise ValueError(f"unknown fields: {', '.join(unknown)}")
+        return tuple(dict.fromkeys(["camp_id"] + requested)) if "camp_id" in known else tuple(dict.fromkeys(requested))
+
+    def page(self, fields: Optional[str] = None, cursor: Optional[str] = None,
+             limit: Optional[int] = None, filters: Optional[Dict[str, Any]] = None) -> Payload:
+        """
+        One page of camps in catalog order: {"camps", "total", "next_cursor"}
+        cursor: the next_cursor of the previous page (an encoded camp_id, so it survives catalog reloads)
+        filters: grade / min_price / max_price / categories / bbox, evaluated by csv_handler.query_camps
+        (in the database for a DatabaseCatalogHandler) only when the page is not cached yet
+        """
+        projection = self.parse_fields(fields)
+        limit = max(1, min(int(limit) if limit else self.page_size, self.max_page_size))
+        after = decode_cursor(cursor) if cursor else None
+        filters = {key: value for key, value in (filters or {}).items() if value is not None and value != []}
+        filter_key = tuple(sorted((key, tuple(value) if isinstance(value, (list, tuple)) else value)
+                                  for key, value in filters.items()))
+        index = self.index()
+
+        def build() -> bytes:
+            rows = range(index["count"])
+            if filters:
+                rows_by_id = index["rows_by_id"]
+                rows = [rows_by_id[str(camp_id)] for camp_id in self.csv_handler.query_camps(**filters)
+                        if str(camp_id) in rows_by_id]
+            start = 0
+            if after is not None:
+                row = index["rows_by_id"].get(after)
+                start = rows.index(row) if row in rows else None
+                if start is None:
+                    raise ValueError(f"cursor does not match a camp in this listing: {cursor!r}")
+            end = min(start + limit, len(rows))
+            items = self._serialized(index, rows[start:end], projection)
+            next_cursor = encode_cursor(index["camp_ids"][rows[end]]) if end < len(rows) else None
+            return (b'{"camps":[' + b",".join(items) + b'],"total":' + str(len(rows)).encode() +
+                    b',"next_cursor":' + _dumps(next_cursor) + b"}")
+        return self._payload(index, ("page", projection, filter_key, after, limit), build)
+
+    def camp(self, camp_id: str, fields: Optional[str] = None) -> Optional[Payload]:
+        """One camp's record, or None for an unknown camp_id"""
+        projection = self.parse_fields(fields)
+        index = self.index()
+        row = index["rows_by_id"].get(str(camp_id))
+        if row is None:
+            return None
+        return self._payload(index, ("camp", projection, row), lambda: self._serialized(index, [row], projection)[0])
+
+    def record_response(self, payload: Payload, encoding: str, not_modified: bool) -> None:
+        """Count what a served payload cost on the wire"""
+        with self._lock:
+            self.stats["requests"] += 1
+            if not_modified:
+                self.stats["not_modified"] += 1
+                return
+            self.stats["bytes_sent"] += len(payload.encodings[encoding])
+            self.stats["bytes_uncompressed"] += len(payload.encodings["identity"])
+
+    def get_stats(self) -> Dict[str, Any]:
+        built = self.stats["payloads_built"]
+        uncompressed = self.stats["bytes_uncompressed"]
+        return {
+            **{key: value for key, value in self.stats.items() if key != "build_ms"},
+            "avg_build_ms": round(self.stats["build_ms"] / built, 3) if built else 0.0,
+            "compression_ratio": round(self.stats["bytes_sent"] / uncompressed, 3) if uncompressed else 0.0,
+            "cached_payloads": len(self.index()["payloads"]),
+            "brotli": brotli is not None
+        }
+
+    def _serialized(self, index: Dict[str, Any], rows, projection: Optional[Tuple[str, ...]]) -> List[bytes]:
+        """Records as JSON: all-field records come from the per-record cache, projections are serialized here"""
+        records = self.csv_handler.csv_json
+        if projection is not None:
+            return [_record_json(records[row], projection) for row in rows]
+        cache = index["record_bytes"]
+        for row in rows:
+            if cache[row] is None:
+                cache[row] = _record_json(records[row])
+        return [cache[row] for row in rows]
+
+    def _payload(self, index: Dict[str, Any], key: tuple, build) -> Payload:
+        """Cached payload for a key, encoding it on first use (LRU over cache_entries)"""
+        payloads = index["payloads"]
+        with self._lock:
+            payload = payloads.get(key)
+            if payload is not None:
+                payloads.move_to_end(key)
+                self.stats["cache_hits"] += 1
+                return payload
+
+        start = time.perf_counter()
+        payload = Payload(build())
+        with self._lock:
+            payloads[key] = payload
+            while len(payloads) > self.cache_entries:
+                payloads.popitem(last=False)
+            self.stats["payloads_built"] += 1
+            self.stats["build_ms"] += (time.perf_counter() - start) * 1000
+        return payload
@@ -0,0 +1,216 @@
+"""
+Region-sharded catalogs for the camp chatbot
+One CSVHandler per region or tenant, loaded on first use and evicted when idle, so memory
+and prompt size follow the regions actually in use rather than the whole dataset
+"""
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional
+
+from csv_handler import CSVHandler
+from db_catalog import DatabaseCatalogHandler
+from slot_extraction import PhraseLexicon
+
+
+def parse_shards(spec: str, default_csv: str, default_snapshot: Optional[str] = None,
+                 default_region: str = "default", default_database: Optional[str] = None) -> Dict[str, Dict[str, Any]]:
+    """
+    Shard definitions from a JSON spec:
+        {"dallas": {"csv": "catalogs/dallas.csv", "snapshot": "catalogs/dallas.snapshot.npz",
+                    "cities": ["Dallas", "Plano", "Frisco"]},
+         "austin": {"database": "postgresql://...", "table": "austin_camps", "cities": ["Austin"]}, ...}
+    An empty spec means a single shard holding the default catalog (the database when one is configured)
+    Raises ValueError for malformed specs
+    """
+    if not spec or not spec.strip():
+        return {default_region: {"csv": default_csv, "snapshot": default_snapshot, "database": default_database,
+                                 "table": None, "cities": []}}
+
+    try:
+        raw = json.loads(spec)
+    except json.JSONDecodeError as e:
+        raise ValueError(f"CATALOG_SHARDS is not valid JSON: {e}")
+    if not isinstance(raw, dict) or not raw:
+        raise ValueError("CATALOG_SHARDS must be a non-empty object of region -> shard")
+
+    shards = {}
+    for region, shard in raw.items():
+        if isinstance(shard, str):
+            shard = {"csv": shard}
+        if not isinstance(shard, dict) or not (shard.get("csv") or shard.get("database")):
+            raise ValueError(f"Shard '{region}' needs a 'csv' path or a 'database' URL")
+        shards[str(region).lower()] = {
+            "csv": shard.get("csv"),
+            "snapshot": shard.get("snapshot"),
+            "database": shard.get("database"),
+            "table": shard.get("table"),
+            "cities": [str(city) for city in shard.get("cities", [])]
+        }
+    return shards
+
+
+class CatalogRegistry:
+    """
+    Lazily loaded catalog shards with LRU / idle eviction
+    Each shard is a CSVHandler, so its indexes and caches (get_derived) live and die with it
+    The default region is the routing fallback and is never evicted
+    """
+
+    def __init__(self, shards: Dict[str, Dict[str, Any]], default_region: Optional[str] = None,
+                 max_loaded: int = 4, idle_seconds: Optional[float] = None,
+                 preloaded: Optional[Dict[str, CSVHandler]] = None,
+                 database_options: Optional[Dict[str, Any]] = None):
+        """database_options: DatabaseCatalogHandler settings for database shards (table, pool_size, sync_seconds)"""
+        self.shards = shards
+        self.database_options = database_options or {}
+        self.default_region = default_region if default_region in shards else next(iter(shards))
+        self.max_loaded = max(1, max_loaded)
+        self.idle_seconds = idle_seconds
+
+        # Region names and their cities route location preferences to a shard without loading it
+        phrases = {}
+        for region, shard in shards.items():
+            phrases[region] = region
+            for city in shard["cities"]:
+                phrases.setdefault(city, region)
+        self.lexicon = PhraseLexicon(phrases)
+
+        self._lock = threading.Lock()
+        self._load_locks = {region: threading.Lock() for region in shards}
+        self._loaded = OrderedDict()  # region -> CSVHandler, least recently used first
+        self._last_used = {}
+        for region, handler in (preloaded or {}).items():
+            self._loaded[region] = handler
+            self._last_used[region] = time.monotonic()
+
+        self.stats = {"loads": 0, "hits": 0, "evictions": 0, "load_ms": 0.0}
+
+    @classmethod
+    def single(cls, csv_handler: CSVHandler, region: str = "default") -> "CatalogRegistry":
+        """Registry wrapping one already loaded catalog"""
+        shard = {"csv": csv_handler.csv_file_path, "snapshot": csv_handler.snapshot_path, "cities": []}
+        return cls({region: shard}, default_region=region, preloaded={region: csv_handler})
+
+    @property
+    def regions(self) -> List[str]:
+        return list(self.shards)
+
+    def route(self, location: Optional[str] = None, region: Optional[str] = None) -> str:
+        """
+        Region for a request: an explicit region wins, then the first region or city named in
+        the location preference, then the default region
+        Raises ValueError for an unknown explicit region
+        """
+        if region:
+            region = str(region).lower()
+            if region not in self.shards:
+                raise ValueError(f"Unknown region '{region}' (available: {', '.join(self.shards)})")
+            return region
+        matches = self.lexicon.find_all(str(location)) if location else []
+        return matches[0] if matches else self.default_region
+
+    def get(self, region: Optional[str] = None) -> CSVHandler:
+        """Catalog for a region, loading it on first use"""
+        region = region or self.default_region
+        if region not in self.shards:
+            raise ValueError(f"Unknown region '{region}'")
+
+        with self._lock:
+            handler = self._touch(region)
+        if handler is not None:
+            return handler
+
+        # Load outside the registry lock so other regions stay available; one loader per region
+        with self._load_locks[region]:
+            with self._lock:
+                handler = self._touch(region)
+            if handler is not None:
+                return handler
+
+            shard = self.shards[region]
+            start = time.perf_counter()
+            if shard.get("database"):
+                options = dict(self.database_options)
+                if shard.get("table"):
+                    options["table"] = shard["table"]
+                handler = DatabaseCatalogHandler(shard["database"], **options)
+            else:
+                if region != self.default_region and not os.path.exists(shard["csv"]):
+                    raise ValueError(f"Catalog for region '{region}' not found: {shard['csv']}")
+                handler = CSVHandler(shard["csv"], snapshot_path=shard.get("snapshot"))
+
+            with self._lock:
+                self.stats["loads"] += 1
+                self.stats["load_ms"] += (time.perf_counter() - start) * 1000
+                self._loaded[region] = handler
+                self._last_used[region] = time.monotonic()
+                self._evict_over_capacity(keep=region)
+        return handler
+
+    def evict(self, region: str) -> bool:
+        """Drop a loaded shard (it reloads on next use); the default region stays loaded"""
+        with self._lock:
+            if region == self.default_region or region not in self._loaded:
+                return False
+            self._drop(region)
+            return True
+
+    def loaded_regions(self) -> List[str]:
+        with self._lock:
+            return list(self._loaded)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Load / eviction counters and what is currently resident"""
+        with self._lock:
+            loaded = {
+                region: {
+                    "camps": len(handler.csv_data) if handler.csv_data is not None else 0,
+                    "loaded_from": handler.loaded_from,
+                    "idle_seconds": round(time.monotonic() - self._last_used[region], 1),
+                    **({"sync": handler.get_sync_stats()} if isinstance(handler, DatabaseCatalogHandler) else {})
+                }
+                for region, handler in self._loaded.items()
+            }
+            return {
+                **{key: round(value, 1) if isinstance(value, float) else value for key, value in self.stats.items()},
+                "regions": self.regions,
+                "default_region": self.default_region,
+                "loaded": loaded,
+                "max_loaded": self.max_loaded
+            }
+
+    def _touch(self, region: str) -> Optional[CSVHandler]:
+        """Mark a loaded shard as just used (caller holds the lock)"""
+        self._evict_idle()
+        handler = self._loaded.get(region)
+        if handler is not None:
+            self._loaded.move_to_end(region)
+            self._last_used[region] = time.monotonic()
+            self.stats["hits"] += 1
+        return handler
+
+    def _evict_idle(self) -> None:
+        if not self.idle_seconds:
+            return
+        now = time.monotonic()
+        for region in list(self._loaded):
+            if region != self.default_region and now - self._last_used[region] > self.idle_seconds:
+                self._drop(region)
+
+    def _evict_over_capacity(self, keep: str) -> None:
+        """Drop least recently used shards beyond max_loaded (never the default or `keep`)"""
+        for region in list(self._loaded):
+            if len(self._loaded) <= self.max_loaded:
+                break
+            if region not in (self.default_region, keep):
+                self._drop(region)
+
+    def _drop(self, region: str) -> None:
+        self._loaded[region].close()
+        del self._loaded[region]
+        del self._last_used[region]
+        self.stats["evictions"] += 1
+        print(f"Evicted catalog shard '{region}'")
@@ -0,0 +1,213 @@
+"""
+Binary catalog snapshots for the camp chatbot
+Compiles camps_data.csv into a typed .npz snapshot (plus pre-split categories and parsed
+session intervals) that loads without CSV parsing, validated against the CSV by content hash
+
+Usage:
+    python python_chatbot/catalog_snapshot.py compile camps_data.csv --output camps_data.snapshot.npz
+"""
+import argparse
+import hashlib
+import json
+import os
+import sys
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from slot_extraction import split_categories, parse_session_dates
+
+SNAPSHOT_FORMAT_VERSION = 1
+_SEPARATOR = '\x00'  # Joins string cells in a column blob; never appears in CSV text
+
+
+def content_hash(path: str) -> str:
+    """SHA-256 of a file's bytes"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def category_index(frame: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Categories pre-split into CSR form
+    Row r has categories vocabulary[indices[indptr[r]:indptr[r + 1]]]; vocabulary is sorted
+    """
+    count = len(frame) if frame is not None else 0
+    values = frame['categories'].tolist() if frame is not None and 'categories' in frame.columns else [""] * count
+    category_lists = [split_categories(value) for value in values]
+    vocabulary = sorted(set().union(*category_lists)) if category_lists else []
+    column = {category: index for index, category in enumerate(vocabulary)}
+    return {
+        "vocabulary": vocabulary,
+        "indptr": np.concatenate(([0], np.cumsum([len(values) for values in category_lists]))).astype(np.int64),
+        "indices": np.array([column[value] for values in category_lists for value in values], dtype=np.int32)
+    }
+
+
+def session_index(frame: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Session date ranges parsed into CSR form
+    Row r has sessions start[indptr[r]:indptr[r + 1]] .. end[...] (datetime64[D])
+    """
+    count = len(frame) if frame is not None else 0
+    values = frame['session_dates'].tolist() if frame is not None and 'session_dates' in frame.columns else [""] * count
+    sessions = [parse_session_dates(value) for value in values]
+    return {
+        "indptr": np.concatenate(([0], np.cumsum([len(row) for row in sessions]))).astype(np.int64),
+        "start": np.array([start for row in sessions for start, _ in row], dtype='datetime64[D]'),
+        "end": np.array([end for row in sessions for _, end in row], dtype='datetime64[D]')
+    }
+
+
+def _encode_strings(values: List[str]) -> np.ndarray:
+    if any(_SEPARATOR in value for value in values):
+        raise ValueError("String cell contains a NUL character")
+    return np.frombuffer(_SEPARATOR.join(values).encode('utf-8'), dtype=np.uint8)
+
+
+def _decode_strings(blob: np.ndarray, count: int) -> List[str]:
+    if count == 0:
+        return []
+    return blob.tobytes().decode('utf-8').split(_SEPARATOR)
+
+
+def _encode_column(series: pd.Series) -> Tuple[str, Dict[str, np.ndarray]]:
+    """Pick a typed representation that round-trips to what CSVHandler.load_csv produces"""
+    if series.dtype.kind in 'iufb':
+        return series.dtype.kind, {"values": series.to_numpy()}
+
+    values = series.tolist()
+    if all(isinstance(value, str) for value in values):
+        # Repetitive columns (organizations, addresses, categories) store each distinct value once
+        codes, uniques = pd.factorize(series)
+        if len(uniques) <= len(values) // 2:
+            return "str_dictionary", {"values": _encode_strings(uniques.tolist()), "codes": codes.astype(np.int32)}
+        return "str", {"values": _encode_strings(values)}
+
+    # Numeric column with blanks (NaN filled with '' on load)
+    if all(value == '' or (isinstance(value, (int, float)) and not isinstance(value, bool)) for value in values):
+        blank = np.array([value == '' for value in values], dtype=bool)
+        numbers = np.array([0.0 if value == '' else value for value in values], dtype=np.float64)
+        return "number_or_blank", {"values": numbers, "blank": blank}
+
+    raise ValueError(f"Column '{series.name}' has mixed types that the snapshot cannot represent")
+
+
+def _decode_column(kind: str, arrays: Dict[str, np.ndarray], count: int) -> Any:
+    if kind == "str":
+        return _decode_strings(arrays["values"], count)
+    if kind == "str_dictionary":
+        codes = arrays["codes"]
+        uniques = np.array(_decode_strings(arrays["values"], int(codes.max()) + 1 if len(codes) else 0), dtype=object)
+        return uniques[codes]
+    if kind == "number_or_blank":
+        values = arrays["values"].astype(object)
+        values[arrays["blank"]] = ''
+        return values
+    return arrays["values"]
+
+
+def compile_snapshot(csv_path: str, snapshot_path: str) -> Dict[str, Any]:
+    """
+    Compile a CSV catalog into a binary snapshot
+    Returns the snapshot metadata; raises ValueError if a column cannot be represented
+    """
+    frame = pd.read_csv(csv_path).fillna('')
+    arrays = {}
+    columns = []
+    for position, name in enumerate(frame.columns):
+        kind, column_arrays = _encode_column(frame[name])
+        columns.append({"name": name, "kind": kind})
+        for key, value in column_arrays.items():
+            arrays[f"column{position}.{key}"] = value
+
+    categories = category_index(frame)
+    arrays["categories.vocabulary"] = _encode_strings(categories["vocabulary"])
+    arrays["categories.indptr"] = categories["indptr"]
+    arrays["categories.indices"] = categories["indices"]
+
+    sessions = session_index(frame)
+    arrays["sessions.indptr"] = sessions["indptr"]
+    arrays["sessions.start"] = sessions["start"]
+    arrays["sessions.end"] = sessions["end"]
+
+    meta = {
+        "format_version": SNAPSHOT_FORMAT_VERSION,
+        "source_hash": content_hash(csv_path),
+        "rows": len(frame),
+        "columns": columns,
+        "category_count": len(categories["vocabulary"])
+    }
+    arrays["meta"] = np.frombuffer(json.dumps(meta).encode('utf-8'), dtype=np.uint8)
+
+    # Write beside the target and swap in, so readers never see a half-written snapshot
+    temporary_path = f"{snapshot_path}.tmp"
+    with open(temporary_path, 'wb') as f:
+        np.savez(f, **arrays)
+    os.replace(temporary_path, snapshot_path)
+    return meta
+
+
+def load_snapshot(snapshot_path: str, csv_path: str) -> Optional[Tuple[pd.DataFrame, Dict[str, Any]]]:
+    """
+    Load a snapshot if it exists and matches the CSV's current content
+    Returns (frame, derived indexes to seed CSVHandler.get_derived with), or None to fall back to the CSV
+    """
+    if not snapshot_path or not os.path.exists(snapshot_path):
+        return None
+
+    try:
+        with np.load(snapshot_path, allow_pickle=False) as data:
+            meta = json.loads(data["meta"].tobytes().decode('utf-8'))
+            if meta.get("format_version") != SNAPSHOT_FORMAT_VERSION:
+                print(f"Catalog snapshot '{snapshot_path}' has an old format; loading CSV instead")
+                return None
+            if meta.get("source_hash") != content_hash(csv_path):
+                print(f"Catalog snapshot '{snapshot_path}' is stale; loading CSV instead")
+                return None
+
+            count = meta["rows"]
+            columns = {}
+            for position, column in enumerate(meta["columns"]):
+                prefix = f"column{position}."
+                arrays = {key[len(prefix):]: data[key] for key in data.files if key.startswith(prefix)}
+                columns[column["name"]] = _decode_column(column["kind"], arrays, count)
+
+            derived = {
+                "category_index": {
+                    "vocabulary": _decode_strings(data["categories.vocabulary"], meta["category_count"]),
+                    "indptr": data["categories.indptr"],
+                    "indices": data["categories.indices"]
+                },
+                "session_index": {
+                    "indptr": data["sessions.indptr"],
+                    "start": data["sessions.start"],
+                    "end": data["sessions.end"]
+                }
+            }
+    except (OSError, KeyError, ValueError) as e:
+        print(f"Could not read catalog snapshot '{snapshot_path}': {e}; loading CSV instead")
+        return None
+
+    return pd.DataFrame(columns, columns=[column["name"] for column in meta["columns"]]), derived
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    parser = argparse.ArgumentParser(description="Compile the camp catalog into a binary snapshot")
+    parser.add_argument("mode", choices=["compile"])
+    parser.add_argument("csv", nargs="?", default="camps_data.csv")
+    parser.add_argument("--output", help="Snapshot path (default: <csv>.snapshot.npz)")
+    args = parser.parse_args(argv)
+
+    output = args.output or f"{os.path.splitext(args.csv)[0]}.snapshot.npz"
+    meta = compile_snapshot(args.csv, output)
+    print(f"Compiled {meta['rows']:,} camps from {args.csv} into {output} ({os.path.getsize(output):,} bytes)")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,9 +1,12 @@
 """
 Main Camp Recommendation Chatbot Application - Enhanced with Token Logging
 """
+import contextlib
 import json
+import os
 import sys
-from typing import Dict, Any
+import threading
+from typing import Dict, Any, List, Optional, Iterator, Callable, ContextManager
 
 from config import Config
 from state_manager import StateManager
@@ -11,21 +14,141 @@ from csv_handler import CSVHandler
 from context_builder import ContextBuilder
 from llm_handler import LLMHandler
 from token_estimator import ConversationLogger
+from round_writer import shared_round_writer
+from speculation import SpeculativeCache
+from intent_router import IntentRouter, merge_profile_filters
+from profile_extractor import ProfileExtractor
+from email_drafts import EmailDraftEngine
+from catalog_payloads import CatalogPayloads
+from llm_resilience import Deadline
+from recommender import RecommendationEngine
+from similarity import SimilarCampEngine
+from camp_cards import CampCardRenderer
+from map_clusters import MapClusterEngine
+from batch_runner import BatchRunner
+from facets import facet_index, generate_suggestions, lookup_filters
+from catalog_registry import CatalogRegistry, parse_shards
+
+class CatalogView:
+    """Read-only engines over one region's catalog shard, used by the catalog endpoints"""
+
+    def __init__(self, csv_handler: CSVHandler):
+        self.csv_handler = csv_handler
+        # Deterministic ranking engine over the catalog
+        self.recommender = RecommendationEngine(
+            csv_handler,
+            weights=Config.RECOMMENDATION_WEIGHTS,
+            distance_scale_km=Config.RECOMMENDATION_DISTANCE_SCALE_KM,
+            gazetteer_path=Config.GAZETTEER_TABLE_PATH
+        )
+        self.similar_camps = SimilarCampEngine(csv_handler, cache_k=Config.SIMILAR_CACHE_K)
+        self.map_clusters = MapClusterEngine(
+            csv_handler,
+            radius_px=Config.MAP_CLUSTER_RADIUS_PX,
+            extent=Config.MAP_TILE_EXTENT,
+            max_zoom=Config.MAP_MAX_ZOOM
+        )
+        self.catalog_payloads = CatalogPayloads(
+            csv_handler,
+            page_size=Config.CATALOG_PAGE_SIZE,
+            max_page_size=Config.CATALOG_MAX_PAGE_SIZE,
+            cache_entries=Config.CATALOG_PAYLOAD_CACHE_ENTRIES
+        )
 
 class CampChatbot:
-    def __init__(self):
-        """Initialize the chatbot with all components"""
-        print("🏕️  Initializing Camp Recommendation Chatbot...")
+    def __init__(self, csv_handler: Optional[CSVHandler] = None, llm_handler: Optional[LLMHandler] = None,
+                 catalogs: Optional[CatalogRegistry] = None,
+                 llm_slot: Optional[Callable[[Optional[float]], ContextManager]] = None):
+        """
+        Initialize the chatbot with all components
+        csv_handler / llm_handler / catalogs: share already loaded catalogs and model (see spawn_session)
+        llm_slot: holds a global LLM slot around calls made outside a request, i.e. batch replay turns and
+        speculative prefetch (AdmissionController.hold_slot; called with a timeout in seconds, None to wait)
+        """
+        shared = llm_handler is not None
+        if not shared:
+            print("🏕️  Initializing Camp Recommendation Chatbot...")
         
         try:
+            # Catalog shards (one per region); this conversation works against one at a time
+            if catalogs is None and csv_handler is not None:
+                catalogs = CatalogRegistry.single(csv_handler)
+            self.catalogs = catalogs or CatalogRegistry(
+                parse_shards(Config.CATALOG_SHARDS, Config.CSV_FILE_PATH, Config.CATALOG_SNAPSHOT_PATH,
+                             default_region=Config.DEFAULT_REGION, default_database=Config.CATALOG_DATABASE_URL or None),
+                default_region=Config.DEFAULT_REGION,
+                max_loaded=Config.CATALOG_MAX_LOADED,
+                idle_seconds=Config.CATALOG_IDLE_SECONDS,
+                database_options={
+                    "table": Config.CATALOG_DB_TABLE,
+                    "pool_size": Config.CATALOG_DB_POOL_SIZE,
+                    "sync_seconds": Config.CATALOG_SYNC_SECONDS
+                }
+            )
+            self.region = self.catalogs.default_region
+            self.region_pinned = False  # Set once a request names its region explicitly
+            
             # Initialize components
-            self.csv_handler = CSVHandler(Config.CSV_FILE_PATH)
+            self.csv_handler = csv_handler or self.catalogs.get(self.region)
             self.state_manager = StateManager()
             self.context_builder = ContextBuilder(self.csv_handler, self.state_manager)
-            self.llm_handler = LLMHandler()
+            self.llm_handler = llm_handler or LLMHandler()
+            self.llm_slot = llm_slot
+            self.last_response = None  # Full response dict of the latest turn in this session
+            # State, history and last_response belong to one conversation, so its turns must not interleave
+            self.turn_lock = threading.RLock()
+            
+            # Initialize token logging (estimation and JSONL records run on a shared background thread)
+            self.conversation_logger = ConversationLogger(
+                writer=shared_round_writer(
+                    os.path.join(Config.CONVERSATION_LOG_DIR, 'conversations.jsonl') if Config.CONVERSATION_LOG_DIR else None,
+                    max_bytes=Config.CONVERSATION_LOG_MAX_BYTES,
+                    backup_count=Config.CONVERSATION_LOG_BACKUPS,
+                    max_queue=Config.CONVERSATION_LOG_QUEUE_SIZE
+                ),
+                recent_rounds=Config.CONVERSATION_RECENT_ROUNDS
+            )
+            
+            # Rule-based slot extraction (pre-LLM profile updates and the local router)
+            self.profile_extractor = ProfileExtractor(self.csv_handler)
             
-            # Initialize token logging
-            self.conversation_logger = ConversationLogger()
+            # Local router for catalog lookups that don't need the LLM
+            self.intent_router = None
+            if Config.LOCAL_ROUTER_ENABLED:
+                self.intent_router = IntentRouter(
+                    self.csv_handler,
+                    min_confidence=Config.LOCAL_ROUTER_MIN_CONFIDENCE,
+                    max_results=Config.LOCAL_ROUTER_MAX_RESULTS,
+                    extractor=self.profile_extractor
+                )
+            
+            # Templated drafts for standard camp inquiries
+            self.email_drafts = None
+            if Config.EMAIL_TEMPLATES_ENABLED:
+                self.email_drafts = EmailDraftEngine(self.csv_handler, from_address=Config.EMAIL_FROM_ADDRESS)
+            
+            self.card_renderer = CampCardRenderer(self.csv_handler, max_cards=Config.CAMP_CARDS_MAX_PER_RESPONSE)
+            
+            # Catalog endpoints name their region explicitly and get their own engines per region
+            # (catalog_view), so they never follow the shard this conversation is routed to
+            self._catalog_views = {}
+            self._catalog_views_lock = threading.Lock()
+            
+            # Optional speculative prefetch of suggestion chip responses
+            self.speculation = None
+            if Config.SPECULATIVE_PREFETCH and not shared:
+                self.speculation = SpeculativeCache(
+                    self._generate_speculative,
+                    prompt_fn=self.context_builder.build_context_prompt,
+                    version_fn=self.get_state_version,
+                    max_workers=Config.SPECULATIVE_MAX_WORKERS,
+                    top_n=Config.SPECULATIVE_TOP_N,
+                    session_budget=Config.SPECULATIVE_SESSION_BUDGET,
+                    global_budget=Config.SPECULATIVE_GLOBAL_BUDGET
+                )
+            
+            if shared:
+                return
             
             print("✅ All components initialized successfully!")
             
@@ -39,28 +162,91 @@ class CampChatbot:
             print(f"❌ Error initializing chatbot: {e}")
             raise
     
-    def process_message(self, user_input: str, show_token_details: bool = True) -> str:
+    def process_message(self, user_input: str, show_token_details: bool = True,
+                        deadline: Optional[Deadline] = None) -> str:
         """
         Process user message and return response with detailed token logging
         Main conversation flow: User Input → Context Builder → LLM → Response + State Update
+        deadline: time budget propagated from the HTTP request
         """
+        self.last_response = None
         try:
             # Capture state before processing
             state_before = self.state_manager.get_compact_state().copy()
+            version_before = self.get_state_version()
+            
+            # Facts the parent states in this message go into the profile before the prompt is built;
+            # a plain lookup ("what's in Plano?") is answered locally and leaves the profile alone
+            local_operations = []
+            if Config.PROFILE_EXTRACTOR_ENABLED and not self.can_answer_locally(user_input):
+                local_operations = self.profile_extractor.apply(self.state_manager, user_input)
+            if not self.region_pinned:
+                self.route_catalog()
+            
+            # Standard email inquiries and plain catalog lookups are answered locally without a prompt
+            local_response = None
+            if self.email_drafts:
+                local_response = self.email_drafts.draft(user_input, self.state_manager.get_state())
+            if self.intent_router and not local_response:
+                local_response = self.intent_router.route(user_input, state_before)
             
-            # Build context prompt
-            prompt = self.context_builder.build_context_prompt(user_input)
+            # Serve a prefetched response if one was speculated for this exact state
+            speculative = None
+            if self.speculation and not local_response:
+                wait_seconds = Config.SPECULATIVE_WAIT_SECONDS
+                if deadline:
+                    wait_seconds = min(wait_seconds, deadline.remaining())
+                # Prefetched from the profile as it was before this message
+                speculative = self.speculation.lookup(version_before, user_input, wait_seconds=wait_seconds)
+            
+            if local_response:
+                prompt, llm_response = "", local_response
+            elif speculative:
+                prompt, llm_response = speculative
+            else:
+                # Build context prompt
+                prompt = self.context_builder.build_context_prompt(user_input)
+                
+                # Get response from LLM, on the model tier this turn needs
+                plan = self.llm_handler.cascade.plan(user_input, self.candidate_count())
+                llm_response = self.llm_handler.generate_response(
+                    prompt, deadline=deadline, card_renderer=self.card_renderer, plan=plan
+                )
+                
+                # Provider failing or out of time: fall back to a local catalog answer if we have one
+                if llm_response.get("degraded") and self.intent_router:
+                    local_response = self.intent_router.answer_degraded(user_input, state_before)
+                    if local_response:
+                        local_response["response"] = (
+                            "I'm having trouble reaching my planning assistant right now, "
+                            "but here's what I found in the catalog.\n" + local_response["response"]
+                        )
+                        local_response["degraded"] = True
+                        llm_response = local_response
             
-            # Get response from LLM
-            llm_response = self.llm_handler.generate_response(prompt)
+            self.last_response = llm_response
             
             # Extract response and state updates
             user_response = llm_response.get("response", "Sorry, I couldn't process that.")
             state_updates = llm_response.get("state_updates", {})
             
-            # Update state
+            # Update state (compact responses send add/set/remove operations instead of a tree)
+            changed = []
+            if llm_response.get("state_operations"):
+                applied = self.state_manager.apply_operations(llm_response["state_operations"])
+                changed = applied["changed"]
+                for operation, reason in applied["rejected"]:
+                    print(f"Rejected state operation {operation}: {reason}")
+                self.llm_handler.response_stats["rejected_operations"] += len(applied["rejected"])
             if state_updates:
                 self.state_manager.update_state(state_updates)
+                changed.extend(state_updates)
+            if local_operations:
+                self.profile_extractor.reconcile(
+                    self.state_manager, local_operations, llm_response.get("state_operations"), state_updates
+                )
+            if 'location_preference' in changed and not self.region_pinned:
+                self.route_catalog()
             
             # Capture state after processing
             state_after = self.state_manager.get_compact_state().copy()
@@ -69,9 +255,9 @@ class CampChatbot:
             self.context_builder.add_to_history("user", user_input)
             self.context_builder.add_to_history("assistant", user_response)
             
-            # Log conversation round with token details
+            # Log conversation round with token details (processed in the background)
             if show_token_details:
-                log_entry = self.conversation_logger.log_conversation_round(
+                self.conversation_logger.log_conversation_round(
                     user_input=user_input,
                     prompt=prompt,
                     llm_response=llm_response,
@@ -86,10 +272,143 @@ class CampChatbot:
             print(f"Error processing message: {e}")
             return error_msg
     
+    def get_state_version(self) -> tuple:
+        """Version of everything the prompt is built from (learner state + history + catalog shard)"""
+        return (self.state_manager.version, self.context_builder.history_version,
+                self.region, self.csv_handler.catalog_version)
+    
+    def route_catalog(self, region: Optional[str] = None) -> str:
+        """
+        Switch to the catalog shard for an explicit region (pinned for the rest of the conversation)
+        or, without one, for the learner's location preference
+        Once pinned, calls without an explicit region keep the pinned shard
+        Raises ValueError for an unknown region
+        """
+        if region:
+            self.region_pinned = True
+        elif self.region_pinned:
+            return self.region
+        location = self.state_manager.get_compact_state().get('location_preference')
+        return self.select_region(self.catalogs.route(location=location, region=region))
+    
+    def select_region(self, region: str) -> str:
+        """Point the conversation's catalog-backed components at a region's shard (loaded on first use)"""
+        handler = self.catalogs.get(region)
+        if handler is not self.csv_handler:
+            self.csv_handler = handler
+            for component in (self.context_builder, self.intent_router, self.card_renderer, self.profile_extractor,
+                              self.email_drafts):
+                if component is not None:
+                    component.csv_handler = handler
+            print(f"📍 Using catalog shard '{region}' ({len(handler.csv_data)} camps)")
+        self.region = region
+        return region
+    
+    def can_answer_locally(self, user_input: str) -> bool:
+        """Whether a message will be answered without an LLM call (local router lookup)"""
+        return bool(self.intent_router) and self.intent_router.can_answer(user_input)
+    
+    def _generate_speculative(self, prompt: str) -> Dict[str, Any]:
+        """Speculative model call; skipped (raises AdmissionRejected) when no LLM slot is free right now"""
+        with self.llm_slot(0) if self.llm_slot else contextlib.nullcontext():
+            return self.llm_handler.generate_response_raw(prompt, card_renderer=self.card_renderer)
+    
+    def speculate(self, suggestions: List[str]) -> int:
+        """
+        Pre-generate responses for likely follow-up messages against the current state
+        Prompts are built on the speculation workers, off the request path; one built after the
+        state moved on is dropped, so every prompt matches the version its speculation is keyed on
+        """
+        if not self.speculation:
+            return 0
+        
+        # Chips the local router answers are already instant
+        if self.intent_router:
+            suggestions = [s for s in suggestions if not self.intent_router.can_answer(s)]
+        
+        return self.speculation.schedule(self.get_state_version(), suggestions[:self.speculation.top_n])
+    
+    def catalog_view(self, region: Optional[str] = None) -> CatalogView:
+        """
+        Read-only engines for a region's shard (the default region when None), independent of the
+        conversation's own region; raises ValueError for an unknown region
+        """
+        region = self.catalogs.route(region=region) if region else self.catalogs.default_region
+        handler = self.catalogs.get(region)
+        with self._catalog_views_lock:
+            view = self._catalog_views.get(region)
+            if view is None or view.csv_handler is not handler:  # First use, or the shard was evicted and loaded again
+                view = self._catalog_views[region] = CatalogView(handler)
+        return view
+    
+    def get_recommendations(self, k: int = Config.RECOMMENDATION_DEFAULT_K,
+                            weights: Optional[Dict[str, float]] = None,
+                            overrides: Optional[Dict[str, Any]] = None,
+                            region: Optional[str] = None) -> Dict[str, Any]:
+        """
+        Top-K camps for the current learner profile (optionally overridden) with explanations
+        Without a region, ranks the shard the profile's location preference routes to
+        """
+        state = self.state_manager.get_compact_state()
+        region = self.catalogs.route(location=state.get('location_preference'), region=region)
+        return self.catalog_view(region).recommender.recommend(state, k=k, weights=weights, overrides=overrides)
+    
+    def resolve_location(self, location: str, region: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Coordinates for a free-text location from the offline gazetteer (None if unknown)"""
+        return self.catalog_view(region).recommender.gazetteer().resolve(location)
+    
+    def get_similar_camps(self, camp_id: str, k: int = Config.SIMILAR_DEFAULT_K, region: Optional[str] = None,
+                          **filters) -> Optional[Dict[str, Any]]:
+        """Camps most like `camp_id` (None if the id is unknown)"""
+        return self.catalog_view(region).similar_camps.similar(camp_id, k=k, **filters)
+    
+    def get_map_clusters(self, bbox: List[float], zoom: float,
+                         filters: Optional[Dict[str, Any]] = None, region: Optional[str] = None) -> Dict[str, Any]:
+        """Map clusters and camps visible in a viewport (raises ValueError for a bad bbox or filter)"""
+        return self.catalog_view(region).map_clusters.clusters(bbox, zoom, filters)
+    
+    def get_suggestions(self, state: Optional[Dict[str, Any]] = None) -> List[str]:
+        """Suggestion chips for a profile (default: the current one), each backed by matching camps"""
+        if state is None:
+            state = self.state_manager.get_compact_state()
+        return generate_suggestions(facet_index(self.csv_handler), state)
+    
+    def get_facets(self, filters: Optional[Dict[str, Any]] = None, limit: Optional[int] = None,
+                   region: Optional[str] = None) -> Dict[str, Any]:
+        """Facet counts for a filter combination (raises ValueError for unknown filters or region)"""
+        return facet_index(self.catalog_view(region).csv_handler).counts(filters, limit=limit)
+    
+    def spawn_session(self) -> "CampChatbot":
+        """Fresh conversation (state, history, token log) sharing this chatbot's catalogs and model"""
+        return CampChatbot(llm_handler=self.llm_handler, catalogs=self.catalogs, llm_slot=self.llm_slot)
+    
+    def run_batch(self, sessions: List[Dict[str, Any]],
+                  max_workers: int = Config.BATCH_MAX_WORKERS) -> Iterator[Dict[str, Any]]:
+        """
+        Replay many independent sessions concurrently, yielding results as they complete
+        sessions: [{"session_id": ..., "turns": ["message", ...]}, ...]
+        """
+        # Build shared catalog indexes once instead of racing to build them in every worker
+        if self.intent_router:
+            self.intent_router.can_answer("")
+        return BatchRunner(self.spawn_session, max_workers=max_workers, llm_slot=self.llm_slot).run(sessions)
+    
+    def candidate_count(self) -> int:
+        """Catalog rows that fit the current profile (grade, budget, city, activities)"""
+        facets = facet_index(self.csv_handler)
+        state = self.state_manager.get_compact_state()
+        filters = merge_profile_filters({}, state, facets.city_lexicon)
+        activities = facets.category_lexicon.find_all(", ".join(map(str, state.get('preferred_activities') or [])))
+        if activities:
+            filters["categories"] = activities
+        return facets.count(lookup_filters(facets, filters))
+    
     def get_status(self) -> Dict[str, Any]:
         """Get current chatbot status and state"""
         base_status = {
             "model_info": self.llm_handler.get_model_info(),
+            "llm_resilience": self.llm_handler.get_resilience_status(),
+            "llm_responses": self.llm_handler.get_response_stats(),
             "csv_summary": self.csv_handler.get_csv_summary(),
             "current_state": self.state_manager.get_compact_state(),
             "state_summary": self.state_manager.get_state_summary(),
@@ -98,6 +417,21 @@ class CampChatbot:
         
         # Add token session summary
         base_status["token_session_summary"] = self.conversation_logger.get_session_summary()
+        base_status["conversation_log_writer"] = self.conversation_logger.writer.get_stats()
+        
+        base_status["profile_extractor"] = self.profile_extractor.get_stats()
+        base_status["model_cascade"] = self.llm_handler.cascade.get_stats()
+        with self._catalog_views_lock:
+            views = dict(self._catalog_views)
+        base_status["catalog_payloads"] = {region: view.catalog_payloads.get_stats() for region, view in views.items()}
+        if self.email_drafts:
+            base_status["email_drafts"] = self.email_drafts.get_stats()
+        if self.intent_router:
+            base_status["local_routing"] = self.intent_router.get_stats()
+        if self.speculation:
+            base_status["speculation"] = self.speculation.get_stats()
+        base_status["camp_cards"] = self.card_renderer.get_stats()
+        base_status["catalogs"] = {"active_region": self.region, **self.catalogs.get_stats()}
         
         return base_status
     
@@ -106,6 +440,10 @@ class CampChatbot:
         self.state_manager.reset_state()
         self.context_builder.clear_history()
         self.conversation_logger.clear_log()
+        if self.speculation:
+            self.speculation.reset_session()
+        self.region_pinned = False
+        self.select_region(self.catalogs.default_region)
         return "Great! I'm ready to help you find the perfect summer program for your child!"
     
     def reload_csv(self) -> str:
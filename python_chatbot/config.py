@@ -14,12 +14,128 @@ class Config:
     # Conversation settings
     MAX_CONVERSATION_HISTORY = 15  # Keep last 15 message pairs
     
+    # Conversation token log: recent rounds in memory, full records spilled to rotating JSONL files
+    CONVERSATION_RECENT_ROUNDS = 50
+    CONVERSATION_LOG_DIR = os.getenv('CONVERSATION_LOG_DIR', '')  # Empty = keep aggregates only, no files
+    CONVERSATION_LOG_MAX_BYTES = int(os.getenv('CONVERSATION_LOG_MAX_BYTES', str(50 * 1024 * 1024)))
+    CONVERSATION_LOG_BACKUPS = int(os.getenv('CONVERSATION_LOG_BACKUPS', '5'))
+    CONVERSATION_LOG_QUEUE_SIZE = 1000  # Rounds (with their prompts) waiting for the writer thread before they are handled inline
+    
     # CSV file path (relative to project root)
     CSV_FILE_PATH = 'camps_data.csv'
+    # Compiled binary snapshot of the CSV (python python_chatbot/catalog_snapshot.py compile); optional
+    CATALOG_SNAPSHOT_PATH = os.getenv('CATALOG_SNAPSHOT_PATH', 'camps_data.snapshot.npz')
+    
+    # Region shards: JSON {"dallas": {"csv": ..., "snapshot": ..., "cities": [...]}, ...}; empty = CSV_FILE_PATH only
+    CATALOG_SHARDS = os.getenv('CATALOG_SHARDS', '')
+    DEFAULT_REGION = os.getenv('DEFAULT_REGION', 'default')  # Fallback shard when no region can be routed
+    CATALOG_MAX_LOADED = int(os.getenv('CATALOG_MAX_LOADED', '4'))  # Shards kept in memory at once
+    CATALOG_IDLE_SECONDS = float(os.getenv('CATALOG_IDLE_SECONDS', '1800'))  # Evict shards unused this long
+    
+    # SQL catalog (sqlite:///camps.db or postgresql://...) instead of CSV_FILE_PATH; empty = CSV
+    CATALOG_DATABASE_URL = os.getenv('CATALOG_DATABASE_URL', '')
+    CATALOG_DB_TABLE = os.getenv('CATALOG_DB_TABLE', 'camps')
+    CATALOG_DB_POOL_SIZE = int(os.getenv('CATALOG_DB_POOL_SIZE', '4'))
+    CATALOG_SYNC_SECONDS = float(os.getenv('CATALOG_SYNC_SECONDS', '60'))  # Incremental sync interval (0 = on reload only)
     
     # LLM settings
     TEMPERATURE = 0.7
     MAX_OUTPUT_TOKENS = 2048
+    # Constrain output to the compact short-key schema (response_schema.RESPONSE_SCHEMA)
+    LLM_ENFORCE_RESPONSE_SCHEMA = os.getenv('LLM_ENFORCE_RESPONSE_SCHEMA', 'true').lower() == 'true'
+    
+    # Model cascade: small talk and short detail requests / questions over a narrow candidate set go to the fast
+    # tier (CHAT_LLM_FAST) with a smaller output cap; email drafts, scheduling and failed fast replies go to CHAT_LLM.
+    # CHAT_LLM_FAST defaults to gemini-2.0-flash-lite, the same model as the default CHAT_LLM, so out of the box
+    # the tiers differ only in their output caps (/status reports model_cascade.model_routing_active: false);
+    # they are different models once CHAT_LLM is set to a larger one (e.g. gemini-2.0-flash) or CHAT_LLM_FAST to a smaller one
+    LLM_CASCADE_ENABLED = os.getenv('LLM_CASCADE_ENABLED', 'true').lower() == 'true'
+    CHAT_LLM_FAST = os.getenv('CHAT_LLM_FAST', 'gemini-2.0-flash-lite')
+    LLM_OUTPUT_CAPS = {  # Max output tokens per turn intent (model_cascade.classify_intent)
+        "small_talk": 256,
+        "detail": 512,
+        "conversation": 1024,
+        "scheduling": MAX_OUTPUT_TOKENS,
+        "email": MAX_OUTPUT_TOKENS
+    }
+    LLM_FAST_MAX_WORDS = int(os.getenv('LLM_FAST_MAX_WORDS', '40'))  # Longer messages go to the main tier
+    LLM_FAST_MAX_CANDIDATES = int(os.getenv('LLM_FAST_MAX_CANDIDATES', '40'))  # Camps fitting the profile
+    
+    # LLM resilience: deadlines, retries and circuit breaker
+    REQUEST_DEADLINE_SECONDS = float(os.getenv('REQUEST_DEADLINE_SECONDS', '25'))  # Default per /chat request
+    MAX_REQUEST_DEADLINE_SECONDS = 60.0  # Upper bound on client-supplied deadlines
+    LLM_DEFAULT_DEADLINE_SECONDS = 30.0  # Calls made outside an HTTP request (tests, prefetch)
+    LLM_MAX_ATTEMPTS = 3
+    LLM_RETRY_BASE_DELAY = 0.5
+    LLM_RETRY_MAX_DELAY = 4.0
+    LLM_CIRCUIT_FAILURE_THRESHOLD = 5  # Consecutive failures before the breaker opens
+    LLM_CIRCUIT_RESET_SECONDS = 30.0
+    LLM_FAULT_INJECTION = os.getenv('LLM_FAULT_INJECTION', '')  # e.g. "failure_rate=0.3,truncate_rate=0.1"
+    
+    # Speculative prefetch of suggestion chip responses (off by default: it spends LLM calls)
+    SPECULATIVE_PREFETCH = os.getenv('SPECULATIVE_PREFETCH', 'false').lower() == 'true'
+    SPECULATIVE_TOP_N = int(os.getenv('SPECULATIVE_TOP_N', '3'))
+    SPECULATIVE_MAX_WORKERS = int(os.getenv('SPECULATIVE_MAX_WORKERS', '2'))
+    SPECULATIVE_SESSION_BUDGET = int(os.getenv('SPECULATIVE_SESSION_BUDGET', '20'))  # Calls per conversation
+    SPECULATIVE_GLOBAL_BUDGET = int(os.getenv('SPECULATIVE_GLOBAL_BUDGET', '200'))  # Calls per hour
+    SPECULATIVE_WAIT_SECONDS = 10.0  # How long a click waits on a speculation still in flight
+    
+    # Local intent router: answer plain catalog lookups without the LLM
+    LOCAL_ROUTER_ENABLED = os.getenv('LOCAL_ROUTER_ENABLED', 'true').lower() == 'true'
+    LOCAL_ROUTER_MIN_CONFIDENCE = float(os.getenv('LOCAL_ROUTER_MIN_CONFIDENCE', '0.8'))
+    LOCAL_ROUTER_MAX_RESULTS = 8
+    
+    # Apply profile facts found in a message (age, budget, activities, location, dates) before the prompt is built
+    PROFILE_EXTRACTOR_ENABLED = os.getenv('PROFILE_EXTRACTOR_ENABLED', 'true').lower() == 'true'
+    
+    # Email drafts: standard camp inquiries are filled from templates without the LLM
+    EMAIL_TEMPLATES_ENABLED = os.getenv('EMAIL_TEMPLATES_ENABLED', 'true').lower() == 'true'
+    EMAIL_FROM_ADDRESS = os.getenv('EMAIL_FROM_ADDRESS', 'brianchow06@gmail.com')  # Sender on every draft
+    
+    # Pre-encoded catalog payloads (/camps, /camps/<id>)
+    CATALOG_PAGE_SIZE = int(os.getenv('CATALOG_PAGE_SIZE', '100'))
+    CATALOG_MAX_PAGE_SIZE = 1000
+    CATALOG_PAYLOAD_CACHE_ENTRIES = 256  # Encoded pages/records kept per catalog version
+    CATALOG_CACHE_MAX_AGE_SECONDS = int(os.getenv('CATALOG_CACHE_MAX_AGE_SECONDS', '60'))  # Then revalidate with the ETag
+    
+    # Deterministic recommendation ranking (/recommendations)
+    RECOMMENDATION_WEIGHTS = {"grade": 3.0, "budget": 2.0, "activities": 2.0, "distance": 1.5, "dates": 1.0}
+    RECOMMENDATION_DISTANCE_SCALE_KM = 15.0  # Distance score halves roughly every 10 km
+    RECOMMENDATION_DEFAULT_K = 5
+    RECOMMENDATION_MAX_K = 50
+    
+    # Offline gazetteer (zipcode table as .sql INSERTs or .csv) for resolving location preferences
+    GAZETTEER_TABLE_PATH = os.getenv('GAZETTEER_TABLE_PATH', 'scripts/create_zipcodes_table.sql')
+    
+    # "More like this" settings
+    SIMILAR_DEFAULT_K = 5
+    SIMILAR_CACHE_K = 20  # Unfiltered neighbor lists kept per camp
+    
+    # Server-side map marker clustering (/map/clusters), supercluster-style defaults
+    MAP_CLUSTER_RADIUS_PX = float(os.getenv('MAP_CLUSTER_RADIUS_PX', '40'))
+    MAP_TILE_EXTENT = 512
+    MAP_MAX_ZOOM = int(os.getenv('MAP_MAX_ZOOM', '16'))  # Deeper zooms show individual camps
+    
+    # Detailed Mode camp cards rendered server-side from the camp_ids the model returns
+    CAMP_CARDS_MAX_PER_RESPONSE = int(os.getenv('CAMP_CARDS_MAX_PER_RESPONSE', '5'))
+    
+    # Batch transcript replay (/chat/batch)
+    BATCH_MAX_WORKERS = int(os.getenv('BATCH_MAX_WORKERS', '4'))
+    BATCH_MAX_WORKERS_LIMIT = 32  # Upper bound on a request's max_workers
+    BATCH_MAX_SESSIONS = 5000
+    
+    # Admission control: per-session / per-IP token buckets and a cap on concurrent LLM calls
+    ADMISSION_CONTROL_ENABLED = os.getenv('ADMISSION_CONTROL_ENABLED', 'true').lower() == 'true'
+    RATE_LIMIT_SESSION_PER_MINUTE = float(os.getenv('RATE_LIMIT_SESSION_PER_MINUTE', '20'))
+    RATE_LIMIT_SESSION_BURST = int(os.getenv('RATE_LIMIT_SESSION_BURST', '5'))
+    RATE_LIMIT_IP_PER_MINUTE = float(os.getenv('RATE_LIMIT_IP_PER_MINUTE', '60'))
+    RATE_LIMIT_IP_BURST = int(os.getenv('RATE_LIMIT_IP_BURST', '20'))
+    RATE_LIMIT_MAX_CLIENTS = 10000  # Buckets kept in memory (least recently seen are dropped)
+    LLM_MAX_IN_FLIGHT = int(os.getenv('LLM_MAX_IN_FLIGHT', '8'))
+    LLM_MAX_QUEUE = int(os.getenv('LLM_MAX_QUEUE', '16'))  # Requests waiting for a slot before shedding
+    LLM_QUEUE_TIMEOUT_SECONDS = float(os.getenv('LLM_QUEUE_TIMEOUT_SECONDS', '5'))
+    CHAT_REPLAY_SECONDS = float(os.getenv('CHAT_REPLAY_SECONDS', '30'))  # Replay window for Idempotency-Key retries
+    TRUST_FORWARDED_FOR = os.getenv('TRUST_FORWARDED_FOR', 'false').lower() == 'true'  # Behind a reverse proxy
     
     @classmethod
     def validate(cls):
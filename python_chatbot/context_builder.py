@@ -12,6 +12,7 @@ class ContextBuilder:
         self.csv_handler = csv_handler
         self.state_manager = state_manager
         self.conversation_history = []
+        self.history_version = 0  # Bumped whenever the history changes
     
     def add_to_history(self, role: str, content: str) -> None:
         """Add message to conversation history"""
@@ -20,6 +21,7 @@ class ContextBuilder:
             "content": content,
             "timestamp": self._get_timestamp()
         })
+        self.history_version += 1
         
         # Keep only recent history (as configured)
         from config import Config
@@ -69,7 +71,8 @@ class ContextBuilder:
 
 2.  **Detailed Mode (On Request):**
     *   You will ONLY enter this mode when the user explicitly asks for details (e.g., "Tell me more about that camp," "Show me the details," "Can you give me the specifics?").
-    *   In this mode, you MUST display the full, detailed camp card using the format provided below.
+    *   In this mode, list the `camp_id` of each camp to show in `ids`; the full camp cards are added automatically from the catalog.
+    *   **Do NOT write the card text yourself.** You may add one short sentence per camp in `hl` saying why it fits this child.
 
 3.  **Scheduling Mode (On Request):**
     *   Triggered when the user asks to "plan a schedule," "organize weeks," or mentions specific months for planning.
@@ -81,20 +84,20 @@ class ContextBuilder:
 4.  **Email Drafting Mode (On Request):**
     *   Triggered when the user asks to "email," "contact," or "draft an email" for a camp.
     *   **When triggered, you MUST immediately draft the email in the same response. Do NOT ask for confirmation.**
-    *   You MUST populate the `email_draft` field in the JSON response.
+    *   You MUST populate the `em` field in the JSON response. The sender address is filled in automatically.
     *   Use a placeholder for the camp email address (e.g., `contact@examplename.com`).
-    *   **Always use "brianchow06@gmail.com" as the "from" email address.**
     *   The subject and body should be based on the user's request and the camp's context.
     *   Example:
         *   User says: "Email the Tech Camp about spots in July"
-        *   Your `conversational_response`: "I have drafted an email to the Tech Camp for you..."
-        *   Your `email_draft` field: `{{ "to": "contact@techcamp.com", "from": "brianchow06@gmail.com", "subject": "Inquiry...", "body": "..." }}`
+        *   Your `r`: "I have drafted an email to the Tech Camp for you..."
+        *   Your `em` field: `{{ "to": "contact@techcamp.com", "subj": "Inquiry...", "body": "..." }}`
 
 **CRITICAL RULES:**
 *   **NEVER show a card unless explicitly asked for details.**
 *   **ONLY use information from the "AVAILABLE SUMMER PROGRAMS" list.** Do not invent camp details.
 *   Refer to camps by their exact `camp_name` from the data.
-*   Update the `camps_being_considered` in the state any camps proposed by the you.
+*   A camp with `listings` is one program run at several sites; use the `camp_id` of the listing that suits the family (e.g. nearest to them).
+*   Add any camps you propose to `consider` with an `ops` entry.
 
 **AVAILABLE SUMMER PROGRAMS:**
 {csv_data}
@@ -107,54 +110,21 @@ class ContextBuilder:
 
 **PARENT/GUARDIAN MESSAGE:** {user_input}
 
----
-**DETAILED CAMP CARD FORMAT (ONLY use when asked for details):**
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
-🏕️ **[Camp Name]**
-📍 Location: [location]
-💰 Cost: $[price] per week
-👥 Age Range: [ages]
-📅 Duration: [duration]
-⏰ Schedule: [schedule]
-
-🎯 **What Your Child Will Do:**
-• [activity 1]
-• [activity 2]
-• [activity 3]
-
-🌟 **Educational Benefits:**
-• [benefit 1]
-• [benefit 2]
-━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━━
 ---
 
 **RESPONSE FORMAT:**
-Please respond with ONLY a valid JSON object in this exact format:
+Respond with ONLY a JSON object using these short keys. Leave out every key you don't need:
 {{
-    "conversational_response": "Your conversational text goes here (2-4 sentences max).",
-    "camp_cards_text": "If you are in Detailed Mode, the full text of the camp card(s) goes here. Otherwise, this is an empty string.",
-    "email_draft": {{
-        "to": "placeholder@example.com",
-        "from": "brianchow06@gmail.com",
-        "subject": "Email subject",
-        "body": "Email body..."
-    }},
-    "state_updates": {{
-        "child_name": "update only if mentioned",
-        "child_age": "update only if mentioned (use number)",
-        "grade_level": "update only if mentioned",
-        "preferred_activities": ["add any new activities mentioned"],
-        "budget_range": "update only if budget/investment mentioned",
-        "location_preference": "update only if location mentioned",
-        "scheduling": {{
-            "available_dates": ["add any dates mentioned"]
-        }},
-        "session_context": {{
-            "camps_being_considered": ["add camps mentioned by name"],
-            "camps_ruled_out": ["add camps dismissed by user"]
-        }}
-    }}
+    "r": "Your conversational text (2-4 sentences max).",
+    "ids": ["Detailed Mode only: camp_id of each camp to show as a card"],
+    "hl": [{{"id": "<camp_id>", "t": "one short sentence on why this camp fits"}}],
+    "em": {{"to": "placeholder@example.com", "subj": "Email subject", "body": "Email body..."}},
+    "ops": [{{"op": "add", "f": "acts", "v": "robotics"}}]
 }}
+`ops` lists state changes, one entry per change, only for what the parent just told you (leave it out when nothing changed):
+*   `op`: "set" (replace), "add" (append to a list) or "remove" (drop a list item, or clear the field)
+*   `f`: name, age (number), grade, acts (activities), budget, loc (location), dates (available dates), blackout (unavailable dates), consider (camps being considered), ruled_out (camps dismissed by the parent)
+*   `v`: the value as a string
 """
 
         return prompt
@@ -162,6 +132,7 @@ Please respond with ONLY a valid JSON object in this exact format:
     def clear_history(self) -> None:
         """Clear conversation history"""
         self.conversation_history = []
+        self.history_version += 1
     
     def get_history_summary(self) -> str:
         """Get a summary of conversation history"""
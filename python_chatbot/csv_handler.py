@@ -3,14 +3,23 @@ CSV data handler for camp information
 """
 import pandas as pd
 import json
-from typing import Dict, Any
+from typing import Dict, Any, Callable, List, Optional, Sequence
 import os
 
+from catalog_snapshot import load_snapshot, category_index, session_index
+from dedup import cluster_listings, canonical_entries
+from slot_extraction import split_categories
+
 class CSVHandler:
-    def __init__(self, csv_file_path: str):
+    def __init__(self, csv_file_path: str, snapshot_path: Optional[str] = None):
         self.csv_file_path = csv_file_path
+        self.snapshot_path = snapshot_path  # Compiled binary catalog, used while it matches the CSV
+        self.loaded_from = None  # "snapshot" or "csv"
         self.csv_data = None
-        self.csv_json = None
+        self._csv_json = None
+        self.catalog_version = 0  # Bumped on every successful load
+        self._derived = {}  # Indexes built from the current catalog version
+        self._signature_cache = {}  # Description MinHash signatures, kept across reloads
         self.load_csv()
     
     def load_csv(self) -> None:
@@ -20,16 +29,28 @@ class CSVHandler:
                 print(f"Warning: CSV file '{self.csv_file_path}' not found. Creating sample file...")
                 self._create_sample_csv()
             
-            # Load CSV
-            self.csv_data = pd.read_csv(self.csv_file_path)
+            # Prefer the compiled snapshot (typed columns and prebuilt indexes) when it is current
+            snapshot = load_snapshot(self.snapshot_path, self.csv_file_path)
+            if snapshot:
+                self.csv_data, derived = snapshot
+                self.loaded_from = "snapshot"
+            else:
+                # Load CSV
+                self.csv_data = pd.read_csv(self.csv_file_path)
+                
+                # Clean data
+                self.csv_data = self.csv_data.fillna('')  # Replace NaN with empty strings
+                derived = {}
+                self.loaded_from = "csv"
             
-            # Clean data
-            self.csv_data = self.csv_data.fillna('')  # Replace NaN with empty strings
+            # JSON records for the LLM are built on first use
+            self._csv_json = None
             
-            # Convert to JSON format for LLM
-            self.csv_json = self.csv_data.to_dict('records')
+            # Anything derived from the previous catalog is now stale
+            self.catalog_version += 1
+            self._derived = derived
             
-            print(f"Successfully loaded {len(self.csv_data)} camps from CSV")
+            print(f"Successfully loaded {len(self.csv_data)} camps from {self.loaded_from.upper()}")
             
         except Exception as e:
             print(f"Error loading CSV: {e}")
@@ -150,21 +171,56 @@ class CSVHandler:
         df.to_csv(self.csv_file_path, index=False)
         print(f"Created sample CSV file: {self.csv_file_path}")
     
+    @property
+    def csv_json(self):
+        """Catalog as a list of records (JSON format for the LLM)"""
+        if self._csv_json is None and self.csv_data is not None:
+            self._csv_json = self.csv_data.to_dict('records')
+        return self._csv_json
+    
     def get_csv_as_json_string(self) -> str:
-        """Get CSV data formatted as JSON string for LLM prompt"""
+        """Get CSV data formatted as JSON string for LLM prompt (repeated listings collapsed)"""
         if self.csv_json is None:
             return "No camp data available"
         
-        return json.dumps(self.csv_json, indent=2)
+        return json.dumps(self.get_listing_clusters()["entries"], indent=2)
+    
+    def get_derived(self, name: str, builder: Callable[[pd.DataFrame], Any]) -> Any:
+        """
+        Get a structure derived from the catalog (index, lexicon, ...)
+        Built on first use and cached until the catalog is reloaded
+        """
+        derived = self._derived
+        if name not in derived:
+            derived[name] = builder(self.csv_data)
+        return derived[name]
+    
+    def get_category_index(self) -> Dict[str, Any]:
+        """Pre-split categories in CSR form (see catalog_snapshot.category_index)"""
+        return self.get_derived("category_index", category_index)
+    
+    def get_session_index(self) -> Dict[str, Any]:
+        """Parsed session date ranges in CSR form (see catalog_snapshot.session_index)"""
+        return self.get_derived("session_index", session_index)
+    
+    def get_listing_clusters(self) -> Dict[str, Any]:
+        """Rows grouped into programs with their canonical entries (see dedup.cluster_listings)"""
+        def build(frame: pd.DataFrame) -> Dict[str, Any]:
+            clusters = cluster_listings(frame, self._signature_cache)
+            clusters["entries"] = canonical_entries(self.csv_json or [], clusters["clusters"])
+            return clusters
+        return self.get_derived("listing_clusters", build)
     
     def get_csv_summary(self) -> str:
         """Get a summary of the CSV data"""
         if self.csv_data is None:
             return "No data loaded"
         
+        collapsed = self.get_listing_clusters()["stats"]["collapsed_listings"]
         return f"""
         CSV Summary:
         - Total camps: {len(self.csv_data)}
+        - Repeated listings collapsed: {collapsed}
         - Columns: {', '.join(self.csv_data.columns.tolist())}
         - Data loaded successfully
         """
@@ -173,6 +229,37 @@ class CSVHandler:
         """Reload CSV data (useful if file is updated)"""
         self.load_csv()
     
+    def close(self) -> None:
+        """Release what the catalog holds open (nothing for a CSV; see DatabaseCatalogHandler)"""
+    
+    def query_camps(self, grade: Optional[int] = None, min_price: Optional[float] = None,
+                    max_price: Optional[float] = None, categories: Optional[Sequence[str]] = None,
+                    bbox: Optional[Sequence[float]] = None) -> List[Any]:
+        """camp_ids matching grade / price / category / bbox filters, in catalog order"""
+        frame = self.csv_data
+        if frame is None:
+            return []
+        mask = pd.Series(True, index=frame.index)
+        
+        def numeric(name: str) -> pd.Series:
+            return pd.to_numeric(frame[name], errors='coerce')
+        
+        if grade is not None:
+            mask &= (numeric('min_grade') <= grade) & (numeric('max_grade') >= grade)
+        if min_price is not None:
+            mask &= numeric('price') >= min_price
+        if max_price is not None:
+            mask &= numeric('price') <= max_price
+        if categories:
+            wanted = set(categories)
+            mask &= frame['categories'].map(lambda value: bool(wanted.intersection(split_categories(value))))
+        if bbox is not None:
+            west, south, east, north = bbox
+            latitude, longitude = numeric('latitude'), numeric('longitude')
+            mask &= (latitude >= south) & (latitude <= north)
+            mask &= ((longitude >= west) & (longitude <= east)) if west <= east else ((longitude >= west) | (longitude <= east))
+        return frame.loc[mask, 'camp_id'].tolist()
+    
     def search_camps(self, query: str) -> Dict[str, Any]:
         """Simple search functionality (for debugging/testing)"""
         if self.csv_data is None:
@@ -183,9 +270,20 @@ class CSVHandler:
             lambda x: x.str.contains(query, case=False, na=False)
         ).any(axis=1)
         
-        results = self.csv_data[mask]
+        # One result per program; matched_listings says which of its sites matched
+        clusters = self.get_listing_clusters()
+        matched = {}
+        for row in mask.to_numpy().nonzero()[0]:
+            matched.setdefault(int(clusters["row_cluster"][row]), []).append(self.csv_json[row].get("camp_id"))
+        results = []
+        for cluster, camp_ids in matched.items():
+            entry = clusters["entries"][cluster]
+            if "listings" in entry:
+                entry = {**entry, "matched_listings": camp_ids}
+            results.append(entry)
         return {
             "query": query,
             "results_count": len(results),
-            "results": results.to_dict('records')
+            "listings_matched": int(mask.sum()),
+            "results": results
         }
@@ -0,0 +1,220 @@
+"""
+Near-duplicate listing clustering for the camp chatbot
+Groups rows that are the same program offered at several sites (same organization, grades, categories
+and description and the same name once the site's city is dropped, or MinHash-similar descriptions at
+the same price and grades) into one canonical entry carrying its locations and sessions, so prompts and
+search list it once
+"""
+import hashlib
+import re
+import time
+import zlib
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from slot_extraction import city_from_address, split_categories
+
+NUM_PERMUTATIONS = 64
+BANDS = 16  # LSH bands of NUM_PERMUTATIONS // BANDS rows: pairs above ~0.5 Jaccard become candidates
+SHINGLE_WORDS = 3
+DESCRIPTION_SIMILARITY = 0.8  # Estimated Jaccard at which two descriptions count as the same program
+LISTING_FIELDS = ("camp_id", "camp_name", "price", "formatted_address", "latitude", "longitude", "session_dates")
+
+_PRIME = np.uint64(4294967311)  # Smallest prime above 2**32, so (a * h + b) fits in 64 bits
+_random = np.random.RandomState(20250601)
+_A = _random.randint(1, 2 ** 31, NUM_PERMUTATIONS).astype(np.uint64)
+_B = _random.randint(0, 2 ** 31, NUM_PERMUTATIONS).astype(np.uint64)
+_WORD_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def _words(text: Any) -> List[str]:
+    return _WORD_PATTERN.findall(str(text).lower())
+
+
+def shingles(text: Any) -> np.ndarray:
+    """crc32 hashes of the distinct word 3-grams in a text (shorter texts give one shingle)"""
+    words = _words(text)
+    if not words:
+        return np.zeros(0, dtype=np.uint64)
+    grams = {" ".join(words[i:i + SHINGLE_WORDS]) for i in range(max(1, len(words) - SHINGLE_WORDS + 1))}
+    return np.array([zlib.crc32(gram.encode("utf-8")) for gram in grams], dtype=np.uint64)
+
+
+def minhash(text: Any) -> Optional[np.ndarray]:
+    """MinHash signature of a text's shingles, or None when it has no words"""
+    hashes = shingles(text)
+    if not len(hashes):
+        return None
+    return ((_A[:, None] * hashes[None, :] + _B[:, None]) % _PRIME).min(axis=1)
+
+
+def similarity(first: np.ndarray, second: np.ndarray) -> float:
+    """Estimated Jaccard similarity of two signatures"""
+    return np.count_nonzero(first == second) / len(first)
+
+
+def _same_description(first: Optional[np.ndarray], second: Optional[np.ndarray]) -> bool:
+    """Both descriptions empty, or similar enough to be the same program's text"""
+    if first is None or second is None:
+        return first is None and second is None
+    return similarity(first, second) >= DESCRIPTION_SIMILARITY
+
+
+class _UnionFind:
+    def __init__(self, size: int):
+        self.parent = list(range(size))
+
+    def find(self, item: int) -> int:
+        while self.parent[item] != item:
+            self.parent[item] = self.parent[self.parent[item]]
+            item = self.parent[item]
+        return item
+
+    def union(self, first: int, second: int) -> None:
+        first, second = self.find(first), self.find(second)
+        if first != second:
+            self.parent[max(first, second)] = min(first, second)
+
+
+def cluster_listings(frame: pd.DataFrame, signature_cache: Optional[Dict[str, np.ndarray]] = None) -> Dict[str, Any]:
+    """
+    Cluster a catalog's rows into programs
+    signature_cache: description digest -> MinHash signature, kept by the caller across reloads so
+    only new or edited descriptions are hashed again (entries for vanished descriptions are dropped)
+    Returns: {"clusters": [[row, ...], ...] (ordered by first row), "row_cluster": array, "stats": {...}}
+    """
+    start = time.perf_counter()
+    count = len(frame) if frame is not None else 0
+
+    def column(name: str) -> List[str]:
+        if frame is None or name not in frame.columns:
+            return [""] * count
+        return frame[name].astype(str).tolist()
+
+    organizations = [" ".join(_words(value)) for value in column("organization_name")]
+    addresses = column("formatted_address")
+    programs = [
+        (low, high, price) for low, high, price in zip(column("min_grade"), column("max_grade"), column("price"))
+    ]
+    categories = [tuple(sorted(split_categories(value))) for value in column("categories")]
+
+    # Site-independent name: the camp name without the words of its own city ("... - Dallas")
+    name_keys = []
+    for name, address in zip(column("camp_name"), addresses):
+        city_words = set(_words(city_from_address(address)))
+        name_keys.append(" ".join(word for word in _words(name) if word not in city_words))
+
+    # MinHash signatures, reusing the previous load's signature for unchanged descriptions
+    cache = signature_cache if signature_cache is not None else {}
+    previous = dict(cache)
+    cache.clear()
+    signatures, reused = [], 0
+    for description in column("description"):
+        digest = hashlib.blake2b(description.encode("utf-8"), digest_size=12).hexdigest()
+        if digest in previous:
+            reused += 1
+            signature = previous[digest]
+        else:
+            signature = minhash(description)
+        cache[digest] = signature
+        signatures.append(signature)
+
+    # Same organization and site-independent name only merges the same program: grades and categories must
+    # match and the descriptions must be near-identical ("Robotics Camp - Plano" for grades 1-3 and
+    # "Robotics Camp - Frisco" for grades 6-8 stay apart)
+    union_find = _UnionFind(count)
+    by_name = {}
+    for row, (organization, name_key) in enumerate(zip(organizations, name_keys)):
+        if not (organization and name_key):
+            continue
+        bucket = by_name.setdefault((organization, name_key, programs[row][:2], categories[row]), [])
+        for anchor in bucket:
+            if _same_description(signatures[anchor], signatures[row]):
+                union_find.union(anchor, row)
+                break
+        else:
+            bucket.append(row)
+
+    # LSH: rows of one organization and program sharing a band are candidates, checked on the full signature.
+    # Each bucket keeps only rows that matched none of its earlier rows, so repeated descriptions stay O(1)
+    band_bytes = NUM_PERMUTATIONS // BANDS * 8
+    anchors, compared, merged_by_description = {}, 0, 0
+    for row, signature in enumerate(signatures):
+        if signature is None or not organizations[row]:
+            continue
+        packed = signature.tobytes()
+        for band in range(BANDS):
+            bucket = anchors.setdefault(
+                (organizations[row], programs[row], band, packed[band * band_bytes:(band + 1) * band_bytes]), []
+            )
+            for anchor in bucket:
+                if union_find.find(anchor) == union_find.find(row):
+                    break
+                compared += 1
+                if similarity(signatures[anchor], signature) >= DESCRIPTION_SIMILARITY:
+                    union_find.union(anchor, row)
+                    merged_by_description += 1
+                    break
+            else:
+                bucket.append(row)
+
+    clusters = {}
+    for row in range(count):
+        clusters.setdefault(union_find.find(row), []).append(row)
+    ordered = sorted(clusters.values(), key=lambda rows: rows[0])
+    row_cluster = np.empty(count, dtype=np.int32)
+    for index, rows in enumerate(ordered):
+        row_cluster[rows] = index
+
+    return {
+        "clusters": ordered,
+        "row_cluster": row_cluster,
+        "stats": {
+            "listings": count,
+            "programs": len(ordered),
+            "collapsed_listings": count - len(ordered),
+            "merged_by_description": merged_by_description,
+            "candidate_pairs": compared,
+            "signatures_reused": reused,
+            "signatures_computed": count - reused,
+            "build_ms": round((time.perf_counter() - start) * 1000, 2)
+        }
+    }
+
+
+def _same_value(first: Any, second: Any) -> bool:
+    """Equal cell values, counting two missing (NaN/None) cells as equal"""
+    if isinstance(first, float) and isinstance(second, float) and np.isnan(first) and np.isnan(second):
+        return True
+    return first == second or (first is None and second is None)
+
+
+def canonical_entries(records: List[Dict[str, Any]], clusters: List[List[int]]) -> List[Dict[str, Any]]:
+    """
+    One record per program
+    Single-listing programs are unchanged; a repeated program keeps its first listing's fields in order,
+    with each site's camp_id plus every field that differs between its listings (address, sessions and any
+    other field, such as a site's own description) moved to "listings", so no listing is misdescribed
+    """
+    entries = []
+    for rows in clusters:
+        first = records[rows[0]]
+        if len(rows) == 1:
+            entries.append(first)
+            continue
+        keys = list(dict.fromkeys(key for row in rows for key in records[row]))
+        varying = {
+            key for key in keys
+            if key == "camp_id" or any(not _same_value(records[row].get(key), first.get(key)) for row in rows[1:])
+        }
+        entry = {key: value for key, value in first.items() if key not in varying or key in ("camp_id", "camp_name")}
+        ordered = [key for key in LISTING_FIELDS if key in varying] + \
+            [key for key in keys if key in varying and key not in LISTING_FIELDS]
+        entry["listings"] = [
+            {key: records[row].get(key) for key in ordered if key in records[row]}
+            for row in rows
+        ]
+        entries.append(entry)
+    return entries
@@ -0,0 +1,299 @@
+"""
+Templated email drafts for the camp chatbot
+Standard inquiries to a camp (availability, before/after care, registration, cost) are filled in from
+the catalog row and the learner profile, so the draft is returned without a model call
+"""
+import re
+import string
+import time
+from collections import Counter, deque
+from typing import Dict, Any, List, Optional
+
+import pandas as pd
+
+from slot_extraction import PhraseLexicon, city_from_address, grade_label, parse_date_mentions
+from profile_extractor import format_date_range
+
+_EMAIL_PATTERN = re.compile(
+    r"\b(?:e-?mail|draft|write (?:to|a (?:note|message))|reach out|contact|send (?:a |them a )?(?:note|message))\b",
+    re.IGNORECASE
+)
+
+# Standard questions, in the order they appear in a draft: (topic, pattern, subject, question)
+_TOPICS = [
+    ("availability",
+     re.compile(r"\b(?:spots?|openings?|availab\w*|space|room left|wait ?list|full)\b", re.IGNORECASE),
+     "Availability",
+     "Are there still spots available${weeks_clause}?"),
+    ("care",
+     re.compile(r"\b(?:after ?-?care|before ?-?care|extended (?:care|day)|early drop[- ]?off|late pick[- ]?up|"
+                r"drop[- ]?off|pick[- ]?up)\b", re.IGNORECASE),
+     "Before/after care",
+     "Do you offer before- or after-care, and what are the drop-off and pick-up times?"),
+    ("registration",
+     re.compile(r"\b(?:regist\w*|sign(?:ing)? up|enroll\w*)\b", re.IGNORECASE),
+     "Registration",
+     "Could you tell me how to register${weeks_clause}, and whether a deposit is required?"),
+    ("cost",
+     re.compile(r"\b(?:price|pricing|costs?|fees?|discounts?|sibling|financial aid|scholarships?|payment plans?)\b",
+                re.IGNORECASE),
+     "Cost",
+     "Could you confirm the cost${price_clause} and whether you offer sibling discounts or payment plans?")
+]
+_GENERAL_QUESTION = "Could you share a little more about the program and what a typical day looks like${weeks_clause}?"
+_QUESTIONS = {topic: string.Template(question) for topic, _, _, question in _TOPICS}
+_QUESTIONS["general"] = string.Template(_GENERAL_QUESTION)
+_SUBJECTS = {topic: subject for topic, _, subject, _ in _TOPICS}
+
+_BODY_TEMPLATE = string.Template(
+    "Hello ${organization} team,\n"
+    "\n"
+    "I'm interested in ${camp_name} for ${child}.${weeks_sentence}\n"
+    "\n"
+    "${questions}\n"
+    "\n"
+    "Thank you, and I look forward to hearing from you.\n"
+    "\n"
+    "Best regards,\n"
+    "[Your name]"
+)
+_REPLY_TEMPLATE = string.Template(
+    "I've drafted an email to ${organization} about ${camp_name}. Take a look and edit anything before you send it."
+)
+
+# A request made only of these words, a camp name, dates and topic phrases is a standard inquiry
+_FILLER_WORDS = {
+    'email', 'e', 'mail', 'draft', 'write', 'send', 'note', 'message', 'contact', 'reach', 'out', 'inquiry',
+    'a', 'an', 'the', 'to', 'for', 'about', 'on', 'in', 'of', 'and', 'or', 'at', 'with', 'regarding', 'if',
+    'please', 'can', 'could', 'would', 'you', 'me', 'us', 'i', 'we', 'my', 'our', 'like', 'want', 'help',
+    'ask', 'asking', 'inquire', 'inquiring', 'find', 'check', 'checking', 'whether', 'they', 'have', 'any',
+    'them', 'it', 'this', 'that', 'these', 'those', 'their', 'camp', 'camps', 'program', 'programs', 'one',
+    'organizer', 'organizers', 'provider', 'director', 'team', 'quick', 'short', 'still', 'there', 'are', 'is',
+    'do', 'does', 'offer', 'offers', 'week', 'weeks', 'session', 'sessions', 'summer', 'child', 'kid', 'son',
+    'daughter', 'year', 'years', 'old', 'grade', 'grader', 'camptok', 'topictok', 'datetok', 'numtok'
+}
+_NUMBER_PATTERN = re.compile(r"\$?\d[\d,]*(?:st|nd|rd|th)?")
+_WORD_PATTERN = re.compile(r"[a-z]+")
+_NAME_CORE_PATTERN = re.compile(r"\s+(?:-|:|\()\s*")
+_LEADING_YEAR_PATTERN = re.compile(r"^\d{4}\s+")
+_SLUG_PATTERN = re.compile(r"[^a-z0-9]+")
+_TOPIC_PATTERN = re.compile("|".join(pattern.pattern for _, pattern, _, _ in _TOPICS), re.IGNORECASE)
+_MONTH_OR_DATE_PATTERN = re.compile(
+    r"\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\.?(?:\s+\d{1,2}(?:st|nd|rd|th)?"
+    r"(?:\s*(?:-|–|to|through)\s*(?:[a-z]+\.?\s+)?\d{1,2}(?:st|nd|rd|th)?)?)?\b|\d{4}-\d{2}-\d{2}",
+    re.IGNORECASE
+)
+
+
+def build_draft_index(frame: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Camp and organization names -> candidate rows, as one phrase lexicon
+    A camp is known by its full name and by its name before any ' - ' / ' : ' / '(' suffix
+    ("Ninja Camp Week"); an organization name stands for all of its camps
+    """
+    count = len(frame) if frame is not None else 0
+
+    def column(name: str) -> List[str]:
+        if frame is None or name not in frame.columns:
+            return [""] * count
+        return frame[name].fillna("").astype(str).tolist()
+
+    candidates = {}
+    for row, (name, organization) in enumerate(zip(column("camp_name"), column("organization_name"))):
+        core = _LEADING_YEAR_PATTERN.sub("", _NAME_CORE_PATTERN.split(name.strip())[0])
+        phrases = {name.strip().lower(), organization.strip().lower()}
+        if not set(_WORD_PATTERN.findall(core.lower())) <= _FILLER_WORDS:
+            phrases.add(core.lower())
+        for phrase in phrases:
+            if len(phrase) >= 4:
+                candidates.setdefault(phrase, []).append(row)
+    return {
+        "lexicon": PhraseLexicon({phrase: phrase for phrase in candidates}),
+        "candidates": candidates,
+        "rows_by_id": {camp_id: row for row, camp_id in enumerate(column("camp_id"))},
+        "rows_by_name": {name.lower(): row for row, name in reversed(list(enumerate(column("camp_name"))))},
+        "cities": [city_from_address(address) for address in column("formatted_address")]
+    }
+
+
+class EmailDraftEngine:
+    """
+    Drafts standard camp inquiries locally; anything non-standard falls through to the model
+    A turn is drafted locally only when it asks for an email, names exactly one camp (or the profile is
+    considering exactly one) and says nothing beyond the camp, dates and the standard topics
+    """
+
+    def __init__(self, csv_handler, from_address: str):
+        self.csv_handler = csv_handler
+        self.from_address = from_address
+        self.stats = Counter()
+        self.latencies_ms = deque(maxlen=1000)
+
+    def index(self) -> Dict[str, Any]:
+        return self.csv_handler.get_derived("email_drafts", build_draft_index)
+
+    def is_email_request(self, user_input: str) -> bool:
+        return bool(_EMAIL_PATTERN.search(user_input or ""))
+
+    def draft(self, user_input: str, state: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        Draft the email for a standard inquiry
+        Returns: Dictionary shaped like LLMHandler.generate_response, or None to fall through to the model
+        """
+        if not self.is_email_request(user_input):
+            return None
+        start = time.perf_counter()
+        self.stats["requests"] += 1
+
+        index = self.index()
+        row, reason = self._resolve_camp(user_input, state, index)
+        if row is None or not self._is_standard(user_input, index):
+            reason = reason or "non_standard"
+            self.stats[f"to_model_{reason}"] += 1
+            return None
+
+        record = self.csv_handler.csv_json[row]
+        camp_name = str(record.get("camp_name") or "the camp").strip()
+        organization = str(record.get("organization_name") or camp_name).strip()
+        topics = [topic for topic, pattern, _, _ in _TOPICS if pattern.search(user_input)] or ["general"]
+        weeks_clause, weeks_sentence = self._weeks(row, state)
+        values = {"weeks_clause": weeks_clause, "price_clause": self._price_clause(record.get("price"))}
+
+        subject = " and ".join(_SUBJECTS[topic].lower() for topic in topics if topic in _SUBJECTS).capitalize()
+        subject = f"{subject or 'Inquiry'} – {camp_name}"
+        body = _BODY_TEMPLATE.substitute(
+            organization=organization,
+            camp_name=camp_name,
+            child=self._child(state),
+            weeks_sentence=weeks_sentence,
+            questions="\n".join(_QUESTIONS[topic].substitute(values) for topic in topics)
+        )
+
+        considered = (state.get("session_context") or {}).get("camps_being_considered") or []
+        operations = []
+        if camp_name not in considered and str(record.get("camp_id")) not in considered:
+            operations.append({"op": "add", "f": "consider", "v": camp_name})
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.stats["drafted_locally"] += 1
+        self.latencies_ms.append(elapsed_ms)
+        print(f"✉️  Drafted email locally ({', '.join(topics)}) in {elapsed_ms:.2f} ms")
+        return {
+            "response": _REPLY_TEMPLATE.substitute(organization=organization, camp_name=camp_name),
+            "email_draft": {
+                "to": f"contact@{_SLUG_PATTERN.sub('', organization.lower()) or 'camp'}.com",
+                "from": self.from_address,
+                "subject": subject,
+                "body": body
+            },
+            "state_updates": {},
+            "state_operations": operations
+        }
+
+    def get_stats(self) -> Dict[str, Any]:
+        """How many email requests were drafted locally (each one an LLM call skipped)"""
+        latencies = sorted(self.latencies_ms)
+        requests = self.stats["requests"]
+        return {
+            "requests": requests,
+            "llm_calls_skipped": self.stats["drafted_locally"],
+            "local_percentage": round(100 * self.stats["drafted_locally"] / requests, 1) if requests else 0.0,
+            "sent_to_model": {
+                key[len("to_model_"):]: value for key, value in self.stats.items() if key.startswith("to_model_")
+            },
+            "avg_draft_ms": round(sum(latencies) / len(latencies), 3) if latencies else 0.0
+        }
+
+    def _resolve_camp(self, user_input: str, state: Dict[str, Any], index: Dict[str, Any]) -> tuple:
+        """(row, None) for the one camp the message is about, or (None, reason)"""
+        considered = []
+        for value in (state.get("session_context") or {}).get("camps_being_considered") or []:
+            row = index["rows_by_id"].get(str(value).strip())
+            if row is None:
+                row = index["rows_by_name"].get(str(value).strip().lower())
+            if row is not None and row not in considered:
+                considered.append(row)
+
+        phrases = index["lexicon"].find_all(user_input)
+        if not phrases:
+            if len(considered) == 1:
+                return considered[0], None
+            return None, "ambiguous_camp" if considered else "no_camp"
+        if len(phrases) > 1 and len({tuple(index["candidates"][phrase]) for phrase in phrases}) > 1:
+            # Two camps, or a camp and its organization: only fine when the camp narrows the organization
+            rows = set.intersection(*(set(index["candidates"][phrase]) for phrase in phrases))
+        else:
+            rows = set(index["candidates"][phrases[0]])
+        if len(rows) > 1:
+            # An organization or a program run at several sites: the camp under consideration, or the family's city
+            narrowed = [row for row in considered if row in rows]
+            if not narrowed and state.get("location_preference"):
+                location = str(state["location_preference"]).lower()
+                narrowed = [row for row in sorted(rows) if index["cities"][row] and index["cities"][row].lower() in location]
+            rows = set(narrowed) if len(narrowed) == 1 else rows
+        if len(rows) != 1:
+            return None, "ambiguous_camp"
+        return rows.pop(), None
+
+    @staticmethod
+    def _is_standard(user_input: str, index: Dict[str, Any]) -> bool:
+        """Nothing in the message beyond the request, camp, dates and standard topics"""
+        text = index["lexicon"].substitute(user_input, " camptok ")
+        text = _TOPIC_PATTERN.sub(" topictok ", text)
+        text = _MONTH_OR_DATE_PATTERN.sub(" datetok ", text)
+        text = _NUMBER_PATTERN.sub(" numtok ", text)
+        return all(word in _FILLER_WORDS for word in _WORD_PATTERN.findall(text.lower()))
+
+    @staticmethod
+    def _child(state: Dict[str, Any]) -> str:
+        """'my child', 'my child Maya (age 8, 3rd grade)'"""
+        child = "my child"
+        if state.get("child_name"):
+            child += f" {state['child_name']}"
+        details = []
+        if isinstance(state.get("child_age"), (int, float)):
+            details.append(f"age {int(state['child_age'])}")
+        grade = str(state.get("grade_level") or "").strip()
+        if grade:
+            details.append(grade if "grade" in grade.lower() or grade == grade_label(0) else f"{grade} grade")
+        return f"{child} ({', '.join(details)})" if details else child
+
+    def _weeks(self, row: int, state: Dict[str, Any]) -> tuple:
+        """
+        (' for the week of June 16-20', ' We're hoping for the week of June 16-20.') from the camp's sessions
+        that fall in the family's available dates; empty when the profile has no dates
+        """
+        available = (state.get("scheduling") or {}).get("available_dates") or []
+        if not available:
+            return "", ""
+        sessions = self.csv_handler.get_session_index()
+        first, last = sessions["indptr"][row], sessions["indptr"][row + 1]
+        camp_sessions = sorted(
+            (start.item(), end.item()) for start, end in zip(sessions["start"][first:last], sessions["end"][first:last])
+        )
+        year = camp_sessions[0][0].year if camp_sessions else None
+        wanted = [
+            (start, end) for value in available if year
+            for start, end in parse_date_mentions(str(value), year)
+        ]
+        matching = [
+            format_date_range(start, end) for start, end in camp_sessions
+            if any(start <= wanted_end and end >= wanted_start for wanted_start, wanted_end in wanted)
+        ]
+        if not matching:
+            dates = ", ".join(str(value) for value in available)
+            return f" during {dates}", f" We're available {dates}; do you have any sessions then?"
+        weeks = ", ".join(matching[:-1]) + (" and " if len(matching) > 1 else "") + matching[-1]
+        label = "weeks" if len(matching) > 1 else "week"
+        return f" for the {label} of {weeks}", f" We're hoping for the {label} of {weeks}."
+
+    @staticmethod
+    def _price_clause(value: Any) -> str:
+        """' (listed at $350 per week)', or empty when the catalog has no price"""
+        try:
+            price = float(value)
+        except (TypeError, ValueError):
+            return ""
+        if price != price:
+            return ""
+        return f" (listed at ${price:,.0f} per week)" if price == int(price) else f" (listed at ${price:,.2f} per week)"
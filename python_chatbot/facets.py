@@ -0,0 +1,273 @@
+"""
+Facet index for the camp chatbot
+Bitsets (Python ints, bit r = catalog row r) per facet value, built once per catalog version,
+so counts for any filter combination are a few big-int ANDs and popcounts
+"""
+from datetime import date
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from recommender import feature_arrays
+from slot_extraction import build_category_lexicon, build_city_lexicon
+from intent_router import merge_profile_filters
+
+GRADE_BANDS = [("K-2", 0, 2), ("3-5", 3, 5), ("6-8", 6, 8), ("9-12", 9, 12)]
+PRICE_BUCKETS = [("Under $200", None, 200), ("$200-$299", 200, 300), ("$300-$399", 300, 400),
+                 ("$400-$499", 400, 500), ("$500+", 500, None)]
+BUDGET_CAPS = [200, 250, 300, 350, 400, 500, 750, 1000]  # Candidate "under $X" suggestions
+
+# Multi-valued facets: a filter on one of these matches camps with ANY of the listed values
+FACET_FIELDS = ("categories", "grade_bands", "price_buckets", "organizations", "cities", "weeks")
+RANGE_FILTERS = ("grade", "min_price", "max_price")
+_ORDERED_FIELDS = {"grade_bands", "price_buckets", "weeks"}  # Listed in natural order, not by count
+
+
+def _bitset(mask: np.ndarray) -> int:
+    """Boolean row mask -> int bitset"""
+    return int.from_bytes(np.packbits(mask, bitorder='little').tobytes(), 'little')
+
+
+def _bitsets_by_code(rows: np.ndarray, codes: np.ndarray, value_count: int, row_count: int,
+                     chunk: int = 256) -> List[int]:
+    """One bitset per value code from (row, code) pairs, packing `chunk` values at a time"""
+    order = np.argsort(codes, kind="stable")
+    rows, codes = rows[order], codes[order]
+    bounds = np.searchsorted(codes, np.arange(value_count + 1))
+    bitsets = []
+    for start in range(0, value_count, chunk):
+        stop = min(start + chunk, value_count)
+        mask = np.zeros((stop - start, row_count), dtype=bool)
+        mask[codes[bounds[start]:bounds[stop]] - start, rows[bounds[start]:bounds[stop]]] = True
+        packed = np.packbits(mask, axis=1, bitorder='little')
+        bitsets.extend(int.from_bytes(row.tobytes(), 'little') for row in packed)
+    return bitsets
+
+
+def _single_valued(values: List[str], row_count: int) -> Dict[str, int]:
+    """Bitsets for a column with one value per row (blank values are not a facet)"""
+    codes, uniques = pd.factorize(pd.Series(values, dtype=object))
+    rows = np.arange(row_count)
+    bitsets = _bitsets_by_code(rows, codes, len(uniques), row_count)
+    return {value: bits for value, bits in zip(uniques, bitsets) if value}
+
+
+def _matrix_columns(matrix: np.ndarray, labels: List[str]) -> Dict[str, int]:
+    """Bitsets for the columns of a multi-hot matrix"""
+    rows, columns = np.nonzero(matrix)
+    bitsets = _bitsets_by_code(rows, columns, len(labels), matrix.shape[0])
+    return dict(zip(labels, bitsets))
+
+
+def week_key(year: int, week: int) -> str:
+    return f"{year}-W{week:02d}"
+
+
+def week_label(year: int, week: int) -> str:
+    monday = date.fromisocalendar(year, week, 1)
+    return f"Week of {monday:%b} {monday.day}"
+
+
+class FacetIndex:
+    """
+    Facet bitsets for one catalog version
+    Filters: {"categories": [...], "organizations": [...], "cities": [...], "weeks": ["2025-W25"],
+              "grade_bands": ["3-5"], "price_buckets": ["$300-$399"], "grade": 3, "min_price": 0, "max_price": 400}
+    """
+
+    def __init__(self, features: Dict[str, Any]):
+        count = features["count"]
+        self.row_count = count
+        self.all_rows = (1 << count) - 1
+        self.price = features["price"]
+        self.min_grade = features["min_grade"]
+        self.max_grade = features["max_grade"]
+
+        self.grade_bits = [
+            _bitset((self.min_grade <= grade) & (self.max_grade >= grade)) for grade in range(13)
+        ]
+        week_keys = [week_key(year, week) for year, week in features["weeks"]]
+        self.week_labels = {week_key(year, week): week_label(year, week) for year, week in features["weeks"]}
+
+        self.values = {
+            "categories": _matrix_columns(features["category_matrix"], features["categories"]),
+            "grade_bands": {label: self._grade_range(low, high) for label, low, high in GRADE_BANDS},
+            "price_buckets": {label: _bitset(self._price_mask(low, high)) for label, low, high in PRICE_BUCKETS},
+            "organizations": _single_valued(features["organizations"], count),
+            "cities": _single_valued(features["cities"], count),
+            "weeks": _matrix_columns(features["week_matrix"], week_keys)
+        }
+        self.category_lexicon = build_category_lexicon(self.values["categories"])
+        self.city_lexicon = build_city_lexicon(self.values["cities"])
+
+    def _grade_range(self, low: int, high: int) -> int:
+        bits = 0
+        for grade in range(low, high + 1):
+            bits |= self.grade_bits[grade]
+        return bits
+
+    def _price_mask(self, low: Optional[float], high: Optional[float]) -> np.ndarray:
+        """Rows priced in [low, high) (either bound optional)"""
+        mask = np.ones(self.row_count, dtype=bool)
+        if low is not None:
+            mask &= self.price >= low
+        if high is not None:
+            mask &= self.price < high
+        return mask
+
+    def bitset(self, filters: Optional[Dict[str, Any]] = None, exclude: Optional[str] = None) -> int:
+        """
+        Rows matching every filter (values within one facet are OR-ed)
+        exclude: leave one facet's filter out (for that facet's own counts)
+        Unknown facet values match nothing; raises ValueError for unknown filter names
+        """
+        bits = self.all_rows
+        for field, value in (filters or {}).items():
+            if field == exclude or value is None or value == []:
+                continue
+            if field in FACET_FIELDS:
+                field_bits = 0
+                for v in ([value] if isinstance(value, str) else value):
+                    field_bits |= self.values[field].get(v, 0)
+                bits &= field_bits
+            elif field == "grade":
+                bits &= self.grade_bits[min(max(int(value), 0), 12)]
+            elif field == "min_price":
+                bits &= _bitset(self.price >= float(value))
+            elif field == "max_price":
+                bits &= _bitset(self.price <= float(value))
+            else:
+                raise ValueError(f"Unknown facet filter: {field}")
+        return bits
+
+    def count(self, filters: Optional[Dict[str, Any]] = None) -> int:
+        return self.bitset(filters).bit_count()
+
+    def rows(self, filters: Optional[Dict[str, Any]] = None) -> np.ndarray:
+        """Row numbers matching the filters"""
+        bits = self.bitset(filters)
+        packed = np.frombuffer(bits.to_bytes((self.row_count + 7) // 8, 'little'), dtype=np.uint8)
+        return np.flatnonzero(np.unpackbits(packed, bitorder='little')[:self.row_count])
+
+    def counts(self, filters: Optional[Dict[str, Any]] = None, limit: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Matching total plus per-value counts for every facet
+        Each facet is counted with its own filter left out, so selecting a value never hides its siblings
+        """
+        filters = {field: value for field, value in (filters or {}).items() if value not in (None, [], "")}
+        facets = {}
+        for field in FACET_FIELDS:
+            base = self.bitset(filters, exclude=field)
+            selected = filters.get(field) or []
+            selected = [selected] if isinstance(selected, str) else selected
+            entries = []
+            for value, bits in self.values[field].items():
+                matches = (bits & base).bit_count()
+                if matches or value in selected:
+                    entries.append({
+                        "value": value,
+                        "label": self.week_labels.get(value, value) if field == "weeks" else value,
+                        "count": matches,
+                        "selected": value in selected
+                    })
+            if field not in _ORDERED_FIELDS:
+                entries.sort(key=lambda entry: (-entry["count"], entry["value"]))
+            if limit:
+                entries = [entry for position, entry in enumerate(entries) if position < limit or entry["selected"]]
+            facets[field] = entries
+        return {"total": self.count(filters), "filters": filters, "facets": facets}
+
+    def top_values(self, field: str, filters: Dict[str, Any], n: int = 1) -> List[str]:
+        """Values of a facet with the most matches under the filters (non-empty only)"""
+        base = self.bitset(filters)
+        ranked = sorted(
+            ((bits & base).bit_count(), value) for value, bits in self.values[field].items()
+        )
+        return [value for matches, value in reversed(ranked) if matches][:n]
+
+
+def facet_index(csv_handler) -> FacetIndex:
+    """Facet index for the handler's current catalog, built once per catalog version"""
+    return csv_handler.get_derived("facets", lambda frame: FacetIndex(feature_arrays(csv_handler)))
+
+
+def lookup_filters(facets: FacetIndex, filters: Dict[str, Any]) -> Dict[str, Any]:
+    """Translate IntentRouter-style filters (categories, city, grade, prices) to facet filters"""
+    translated = {key: filters[key] for key in RANGE_FILTERS if key in filters}
+    if filters.get("categories"):
+        translated["categories"] = filters["categories"]
+    if filters.get("city"):
+        translated["cities"] = [filters["city"]]
+    return translated
+
+
+def generate_suggestions(facets: FacetIndex, state: Optional[Dict[str, Any]] = None,
+                         limit: int = 6) -> List[str]:
+    """
+    Suggestion chips drawn from what the catalog offers the current profile
+    Every lookup chip is counted with the same filters the local router will apply, so it never comes back empty
+    """
+    state = state or {}
+    profile = merge_profile_filters({}, state, facets.city_lexicon)
+    base = lookup_filters(facets, profile)
+    suggestions = []
+
+    def chip(text: str, slots: Dict[str, Any]) -> None:
+        if facets.count(lookup_filters(facets, {**profile, **slots})):
+            suggestions.append(text)
+
+    # Ask for the age the catalog serves best (an age is also a grade filter)
+    if "grade" not in profile:
+        base_bits = facets.bitset(base)
+        grade = max(range(13), key=lambda g: (facets.grade_bits[g] & base_bits).bit_count())
+        chip(f"My child is {grade + 5} years old", {"grade": grade})
+
+    activities = facets.category_lexicon.find_all(", ".join(map(str, state.get('preferred_activities') or [])))
+    if activities:
+        activity = activities[0]
+        with_activity = {**base, "categories": [activity]}
+        if "city" not in profile:
+            for city in facets.top_values("cities", with_activity):
+                chip(f"{activity} camps in {city}", {"categories": [activity], "city": city})
+        if "max_price" not in profile:
+            cap = _budget_cap(facets, with_activity)
+            if cap:
+                chip(f"{activity} camps under ${cap}", {"categories": [activity], "max_price": cap})
+        for other in facets.top_values("categories", base, n=3):
+            if other not in activities:
+                chip(other, {"categories": [other]})
+                break
+    else:
+        for category in facets.top_values("categories", base, n=3):
+            chip(category, {"categories": [category]})
+
+    if "city" not in profile:
+        for city in facets.top_values("cities", base):
+            chip(f"Camps in {city}", {"city": city})
+    if "max_price" not in profile:
+        cap = _budget_cap(facets, base)
+        if cap:
+            chip(f"Camps under ${cap}", {"max_price": cap})
+
+    # Conversation steps rather than catalog lookups
+    phase = (state.get('session_context') or {}).get('current_phase', 'exploring')
+    if phase == 'building_profile':
+        suggestions.extend(['Tell me more about my child', 'What information do you need?'])
+    elif phase == 'exploring_options':
+        suggestions.extend(['Show me recommendations', 'Compare these camps'])
+    elif phase == 'planning_schedule':
+        suggestions.extend(['Available dates', 'How do I register?'])
+
+    return list(dict.fromkeys(suggestions))[:limit]
+
+
+def _budget_cap(facets: FacetIndex, filters: Dict[str, Any], min_results: int = 3) -> Optional[int]:
+    """Lowest round budget that still leaves a few camps (or all of them, if fewer)"""
+    total = facets.count(filters)
+    if not total:
+        return None
+    for cap in BUDGET_CAPS:
+        if facets.count({**filters, "max_price": cap}) >= min(min_results, total):
+            return cap
+    return None
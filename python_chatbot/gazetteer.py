@@ -0,0 +1,206 @@
+"""
+Offline gazetteer for the camp chatbot
+Resolves free-text locations ("Plano", "near 75093", "North Dallas") to coordinates with no network calls,
+from a zipcode table (scripts/create_zipcodes_table.sql or a CSV with the same columns) plus catalog addresses
+"""
+import bisect
+import difflib
+import os
+import re
+from typing import Dict, Any, List, Optional, Iterable
+
+import numpy as np
+import pandas as pd
+
+from slot_extraction import city_from_address, zip_from_address
+
+_SQL_ROW_PATTERN = re.compile(
+    r"\(\s*'(\d{5})'\s*,\s*(-?[\d.]+)\s*,\s*(-?[\d.]+)\s*,\s*'((?:[^']|'')*)'\s*,\s*'([A-Za-z]{2})'"
+)
+_ZIP_PATTERN = re.compile(r'\b(\d{5})(?:-\d{4})?\b')
+_STATE_PATTERN = re.compile(r',\s*([A-Z]{2})(?:\s+\d{5})?\s*(?:,|$)')
+_WORD_PATTERN = re.compile(r"[a-z][a-z.'-]*")
+
+# Words around a place name that are not part of it ("near north Dallas, TX")
+_LOCATION_FILLER = {
+    'near', 'in', 'at', 'around', 'close', 'to', 'by', 'the', 'area', 'of', 'from', 'within', 'miles', 'mile',
+    'north', 'south', 'east', 'west', 'northern', 'southern', 'eastern', 'western', 'central', 'downtown',
+    'uptown', 'suburbs', 'city', 'tx', 'texas', 'usa', 'and', 'or', 'we', 'live', 'are', 'my', 'home'
+}
+MAX_PLACE_WORDS = 3
+MIN_PREFIX_LENGTH = 3
+FUZZY_CUTOFF = 0.8
+
+
+def parse_zipcode_table(path: str) -> List[Dict[str, Any]]:
+    """
+    Rows of a zipcode table: zipcode, latitude, longitude, city, state
+    Reads the INSERT ... VALUES tuples of a .sql script or the columns of a .csv
+    """
+    if not path or not os.path.exists(path):
+        return []
+    if path.endswith('.csv'):
+        frame = pd.read_csv(path, dtype={'zipcode': str}).fillna('')
+        return [
+            {"zipcode": str(row['zipcode']).zfill(5), "latitude": float(row['latitude']),
+             "longitude": float(row['longitude']), "city": str(row.get('city', '')), "state": str(row.get('state', ''))}
+            for row in frame.to_dict('records')
+        ]
+    with open(path, encoding='utf-8') as f:
+        text = f.read()
+    return [
+        {"zipcode": zipcode, "latitude": float(lat), "longitude": float(lon),
+         "city": city.replace("''", "'"), "state": state.upper()}
+        for zipcode, lat, lon, city, state in _SQL_ROW_PATTERN.findall(text)
+    ]
+
+
+def catalog_places(frame: pd.DataFrame) -> List[Dict[str, Any]]:
+    """One row per camp with coordinates: its address zip, city and state"""
+    if frame is None or not {'formatted_address', 'latitude', 'longitude'}.issubset(frame.columns):
+        return []
+    places = []
+    latitude = pd.to_numeric(frame['latitude'], errors='coerce').to_numpy()
+    longitude = pd.to_numeric(frame['longitude'], errors='coerce').to_numpy()
+    for address, lat, lon in zip(frame['formatted_address'].astype(str), latitude, longitude):
+        if np.isnan(lat) or np.isnan(lon):
+            continue
+        state = _STATE_PATTERN.search(address)
+        places.append({
+            "zipcode": zip_from_address(address), "latitude": float(lat), "longitude": float(lon),
+            "city": city_from_address(address), "state": state.group(1) if state else ""
+        })
+    return places
+
+
+class Gazetteer:
+    """
+    Compact place index: sorted zip codes with float32 coordinates, and city centroids
+    keyed by normalised name (sorted for prefix search)
+    Zip table rows are authoritative; catalog addresses fill in zips and cities the table lacks
+    """
+
+    def __init__(self, table_rows: Iterable[Dict[str, Any]], catalog_rows: Iterable[Dict[str, Any]] = ()):
+        zips = {}  # zipcode -> [lat_sum, lon_sum, count, city, state, from_table]
+        cities = {}  # key -> [lat_sum, lon_sum, count, display name, state, from_table]
+
+        for from_table, rows in ((True, table_rows), (False, catalog_rows)):
+            for row in rows:
+                city_key = self.normalize(row.get("city", ""))
+                for key, totals, label in ((row.get("zipcode"), zips, row.get("city", "")),
+                                           (city_key, cities, row.get("city", ""))):
+                    if not key:
+                        continue
+                    entry = totals.get(key)
+                    if entry is None:
+                        entry = totals[key] = [0.0, 0.0, 0, label, row.get("state", ""), from_table]
+                    elif entry[5] and not from_table:
+                        continue  # Already placed by the table
+                    entry[0] += row["latitude"]
+                    entry[1] += row["longitude"]
+                    entry[2] += 1
+
+        zip_codes = sorted(zips)
+        self.zip_codes = np.array([int(code) for code in zip_codes], dtype=np.int32)
+        self.zip_latitude = np.array([zips[code][0] / zips[code][2] for code in zip_codes], dtype=np.float32)
+        self.zip_longitude = np.array([zips[code][1] / zips[code][2] for code in zip_codes], dtype=np.float32)
+        self.zip_city = [zips[code][3] for code in zip_codes]
+        self.zip_state = [zips[code][4] for code in zip_codes]
+
+        self.city_keys = sorted(cities)
+        self.city_names = [cities[key][3] for key in self.city_keys]
+        self.city_state = [cities[key][4] for key in self.city_keys]
+        self.city_latitude = np.array([cities[key][0] / cities[key][2] for key in self.city_keys], dtype=np.float32)
+        self.city_longitude = np.array([cities[key][1] / cities[key][2] for key in self.city_keys], dtype=np.float32)
+        self._city_position = {key: position for position, key in enumerate(self.city_keys)}
+
+    @staticmethod
+    def normalize(name: str) -> str:
+        return " ".join(_WORD_PATTERN.findall(str(name).lower()))
+
+    def __len__(self) -> int:
+        return len(self.zip_codes) + len(self.city_keys)
+
+    def lookup_zip(self, zipcode: str) -> Optional[Dict[str, Any]]:
+        """Exact zip code lookup"""
+        try:
+            code = int(zipcode)
+        except (TypeError, ValueError):
+            return None
+        position = int(np.searchsorted(self.zip_codes, code))
+        if position >= len(self.zip_codes) or self.zip_codes[position] != code:
+            return None
+        return self._place(
+            self.zip_city[position], self.zip_state[position],
+            self.zip_latitude[position], self.zip_longitude[position], "zip", zipcode=f"{code:05d}"
+        )
+
+    def lookup_city(self, name: str) -> Optional[Dict[str, Any]]:
+        """Exact, then prefix ('McKin'), then fuzzy ('Frsico') city match"""
+        key = self.normalize(name)
+        if not key:
+            return None
+        if key in self._city_position:
+            return self._city(self._city_position[key], "city")
+
+        if len(key) >= MIN_PREFIX_LENGTH:
+            position = bisect.bisect_left(self.city_keys, key)
+            if position < len(self.city_keys) and self.city_keys[position].startswith(key):
+                return self._city(position, "prefix")
+
+        close = difflib.get_close_matches(key, self.city_keys, n=1, cutoff=FUZZY_CUTOFF)
+        if close:
+            return self._city(self._city_position[close[0]], "fuzzy")
+        return None
+
+    def resolve(self, text: str) -> Optional[Dict[str, Any]]:
+        """
+        Resolve a free-text location preference
+        Tries a zip code, then known city names anywhere in the text (longest first),
+        then prefix / fuzzy matching of the remaining words
+        Returns: {"name", "city", "state", "zipcode", "latitude", "longitude", "match"} or None
+        """
+        if not text:
+            return None
+
+        for zipcode in _ZIP_PATTERN.findall(text):
+            place = self.lookup_zip(zipcode)
+            if place:
+                return place
+
+        words = _WORD_PATTERN.findall(text.lower())
+        for size in range(min(MAX_PLACE_WORDS, len(words)), 0, -1):
+            for start in range(len(words) - size + 1):
+                key = " ".join(words[start:start + size])
+                if key in self._city_position:
+                    return self._city(self._city_position[key], "city")
+
+        # Whatever is left once filler words are dropped is the best guess at a (misspelt) place name
+        candidate = " ".join(word for word in words if word not in _LOCATION_FILLER)
+        if candidate:
+            return self.lookup_city(candidate)
+        return None
+
+    def _city(self, position: int, match: str) -> Dict[str, Any]:
+        return self._place(
+            self.city_names[position], self.city_state[position],
+            self.city_latitude[position], self.city_longitude[position], match
+        )
+
+    @staticmethod
+    def _place(city: str, state: str, latitude: float, longitude: float, match: str,
+               zipcode: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            "name": f"{city}, {state}" if city and state else (city or zipcode or ""),
+            "city": city,
+            "state": state,
+            "zipcode": zipcode,
+            "latitude": round(float(latitude), 6),
+            "longitude": round(float(longitude), 6),
+            "match": match
+        }
+
+
+def build_gazetteer(frame: pd.DataFrame, table_path: Optional[str] = None) -> Gazetteer:
+    """Gazetteer for one catalog version (zip table + the catalog's own addresses)"""
+    return Gazetteer(parse_zipcode_table(table_path), catalog_places(frame))
@@ -0,0 +1,403 @@
+"""
+Local intent router for the camp chatbot
+Answers filter-style catalog lookups ("camps under $300 for 2nd grade") without calling the LLM
+"""
+import math
+import re
+import time
+from collections import Counter, deque
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from slot_extraction import (
+    parse_grade, age_to_grade, grade_label, parse_price_range, format_price_range, split_categories,
+    city_from_address
+)
+from profile_extractor import ProfileExtractor
+
+# Labelled seed messages the intent classifier is trained on at startup
+SEED_EXAMPLES = [
+    ("camps under $300 for 2nd grade", "lookup"),
+    ("what's in Plano?", "lookup"),
+    ("show me STEM programs", "lookup"),
+    ("list art camps in Frisco", "lookup"),
+    ("any gaming camps?", "lookup"),
+    ("which camps are in McKinney", "lookup"),
+    ("show me camps under $250", "lookup"),
+    ("camps for 5th graders", "lookup"),
+    ("find science camps for 3rd grade", "lookup"),
+    ("what camps are available in Dallas", "lookup"),
+    ("show me sports camps", "lookup"),
+    ("cheap camps under 200", "lookup"),
+    ("any outdoor camps near Prosper", "lookup"),
+    ("list coding camps", "lookup"),
+    ("what robotics camps do you have", "lookup"),
+    ("show all camps in Frisco under $400", "lookup"),
+    ("camps for kindergarten", "lookup"),
+    ("are there any dance camps", "lookup"),
+    ("which programs cost less than $300", "lookup"),
+    ("show me minecraft camps", "lookup"),
+    ("Swimming", "lookup"),
+    ("STEM programs", "lookup"),
+    ("Arts and crafts", "lookup"),
+    ("Sports camps", "lookup"),
+    ("camps in Plano for grade 4", "lookup"),
+    ("what do you have for 7th grade", "lookup"),
+    ("list programs between $200 and $400", "lookup"),
+    ("show writing camps", "lookup"),
+    ("any camps in Dallas under $350", "lookup"),
+    ("give me a list of tech camps", "lookup"),
+    ("what's available in Frisco", "lookup"),
+    ("science camps", "lookup"),
+    ("find swimming camps for my daughter", "lookup"),
+    ("art camps for my 8 year old", "lookup"),
+    ("what coding camps do you have for my son", "lookup"),
+    ("show me camps for my 3rd grader in Plano", "lookup"),
+    ("hi", "chat"),
+    ("hello there", "chat"),
+    ("thanks!", "chat"),
+    ("thank you so much", "chat"),
+    ("my daughter is shy, what do you recommend?", "chat"),
+    ("compare these two camps", "chat"),
+    ("tell me more about the minecraft camp", "chat"),
+    ("can you email the tech camp", "chat"),
+    ("draft an email to club scikidz", "chat"),
+    ("plan a schedule for july", "chat"),
+    ("which one is better for a shy kid", "chat"),
+    ("why do you recommend that one", "chat"),
+    ("what should i look for in a summer camp", "chat"),
+    ("how do i register", "chat"),
+    ("is it safe for a 6 year old to go to overnight camp", "chat"),
+    ("my son loves swimming and art", "chat"),
+    ("we are available in june", "chat"),
+    ("she hates sports", "chat"),
+    ("help me get started", "chat"),
+    ("what information do you need", "chat"),
+    ("show me the details of that camp", "chat"),
+    ("tell me about age-appropriate camps", "chat"),
+    ("how does the refund policy work", "chat"),
+    ("what time does drop off start", "chat"),
+    ("can you organize the weeks for me", "chat"),
+    ("we already did the zoo camp last year", "chat"),
+    ("remove the ninja camp", "chat"),
+    ("my child is 8 years old", "chat"),
+    ("what would you suggest for a kid who likes building things", "chat"),
+    ("ok sounds good", "chat"),
+    ("our budget is about $300 a week", "chat"),
+    ("we live in Plano", "chat"),
+    ("my 8 year old loves swimming, budget $300, near Frisco", "chat"),
+    ("my son is in 3rd grade and likes robotics", "chat"),
+    ("my daughter is 7 and loves art", "chat"),
+    ("she loves dance and music", "chat"),
+    ("he's 9 and into minecraft", "chat"),
+    ("my kids are into coding", "chat"),
+    ("she likes outdoor stuff and we're in McKinney", "chat")
+]
+
+# Messages that need judgement, drafting or scheduling always go to the model
+_ESCALATION_PATTERN = re.compile(
+    r'\b(email|draft|contact|schedule|plan|compare|vs|versus|better|best|why|recommend|suggest|'
+    r'register|sign up|details?|tell me more|more about|refund|remove|rule out|instead)\b',
+    re.IGNORECASE
+)
+# First-person facts about the child or family ("my son is 8 and loves swimming") update the profile, so they
+# go to the model unless the message also asks for a list
+_STATEMENT_PATTERN = re.compile(
+    r"\b(?:(?:my|our)\s+(?:\w+[\s-]+){0,3}?(?:son|daughter|child|kid|kids|boy|girl|twins|old|grader)"
+    r"(?:'s|\s+(?:is|are|was|loves?|likes?|enjoys?|wants?|hates?|has|turns?|into))|"
+    r"(?:she|he|they)(?:'s|'re|\s+(?:is|are|loves?|likes?|enjoys?|hates?|wants?|into))|"
+    r"we(?:'re|\s+(?:are|live|will be))|(?:our|my) budget|budget (?:is|of))\b",
+    re.IGNORECASE
+)
+_LOOKUP_CUE_PATTERN = re.compile(
+    r"\?|\b(?:show|find|list|search|give me|what|which|any|are there|is there|looking for|options)\b",
+    re.IGNORECASE
+)
+# A message made only of slot values and these words ("Swimming", "STEM programs") is a lookup
+_FILLER_WORDS = {
+    'camp', 'camps', 'program', 'programs', 'class', 'classes', 'option', 'options', 'activities',
+    'and', 'or', 'the', 'a', 'for', 'in', 'near', 'around', 'some', 'any', 'all', 'show', 'me', 'list',
+    'grade', 'graders', 'grader', 'under', 'below', 'topictok', 'placetok', 'numtok'
+}
+_NUMBER_PATTERN = re.compile(r'\$?\d[\d,]*(?:st|nd|rd|th)?')
+_WORD_PATTERN = re.compile(r'[a-z]+')
+
+
+class NaiveBayesIntentClassifier:
+    """Multinomial Naive Bayes over word tokens with Laplace smoothing"""
+
+    def __init__(self, alpha: float = 1.0):
+        self.alpha = alpha
+        self.label_counts = Counter()
+        self.token_counts = {}
+        self.token_totals = Counter()
+        self.vocabulary = set()
+
+    def train(self, examples: List[Tuple[List[str], str]]) -> None:
+        """Train on (tokens, label) pairs"""
+        for tokens, label in examples:
+            self.label_counts[label] += 1
+            counts = self.token_counts.setdefault(label, Counter())
+            counts.update(tokens)
+            self.token_totals[label] += len(tokens)
+            self.vocabulary.update(tokens)
+
+    def predict_proba(self, tokens: List[str]) -> Dict[str, float]:
+        """Posterior probability per label"""
+        total_examples = sum(self.label_counts.values())
+        vocabulary_size = len(self.vocabulary) + 1
+        log_scores = {}
+        for label, label_count in self.label_counts.items():
+            score = math.log(label_count / total_examples)
+            counts = self.token_counts[label]
+            denominator = self.token_totals[label] + self.alpha * vocabulary_size
+            for token in tokens:
+                score += math.log((counts.get(token, 0) + self.alpha) / denominator)
+            log_scores[label] = score
+
+        top = max(log_scores.values())
+        exp_scores = {label: math.exp(score - top) for label, score in log_scores.items()}
+        norm = sum(exp_scores.values())
+        return {label: value / norm for label, value in exp_scores.items()}
+
+
+def build_router_index(frame: pd.DataFrame) -> Optional[Dict[str, Any]]:
+    """Precompute filter arrays and lexicons for one catalog version"""
+    required = {'camp_name', 'price', 'min_grade', 'max_grade', 'categories', 'formatted_address'}
+    if frame is None or not required.issubset(frame.columns):
+        return None
+
+    category_sets = [set(split_categories(value)) for value in frame['categories']]
+    all_categories = set().union(*category_sets) if category_sets else set()
+    cities = np.array([city_from_address(address) for address in frame['formatted_address']], dtype=object)
+
+    return {
+        "names": frame['camp_name'].astype(str).tolist(),
+        "organizations": frame['organization_name'].astype(str).tolist()
+        if 'organization_name' in frame.columns else [""] * len(frame),
+        "price": pd.to_numeric(frame['price'], errors='coerce').fillna(0).to_numpy(dtype=float),
+        "min_grade": pd.to_numeric(frame['min_grade'], errors='coerce').fillna(0).to_numpy(dtype=int),
+        "max_grade": pd.to_numeric(frame['max_grade'], errors='coerce').fillna(12).to_numpy(dtype=int),
+        "cities": cities,
+        "category_masks": {
+            category: np.array([category in row for row in category_sets], dtype=bool)
+            for category in all_categories
+        }
+    }
+
+
+def merge_profile_filters(slots: Dict[str, Any], state: Dict[str, Any], city_lexicon) -> Dict[str, Any]:
+    """
+    Lookup filters: the message's own slots, with grade, budget and city filled in from the learner profile
+    Shared with the facet index so suggestion counts match what a lookup returns
+    """
+    filters = dict(slots)
+    if "grade" not in filters:
+        grade = parse_grade(f"{state.get('grade_level', '')} grade") if state.get('grade_level') else None
+        if grade is None and isinstance(state.get('child_age'), (int, float)):
+            grade = age_to_grade(int(state['child_age']))
+        if grade is not None:
+            filters["grade"] = grade
+    if "min_price" not in filters and "max_price" not in filters and state.get('budget_range'):
+        min_price, max_price = parse_price_range(str(state['budget_range']))
+        if min_price is not None:
+            filters["min_price"] = min_price
+        if max_price is not None:
+            filters["max_price"] = max_price
+    if "city" not in filters and state.get('location_preference'):
+        cities = city_lexicon.find_all(str(state['location_preference']))
+        if cities:
+            filters["city"] = cities[0]
+    return filters
+
+
+class IntentRouter:
+    """
+    Routes catalog lookups to a templated local answer and everything else to the LLM
+    A turn is served locally only when rules find filter slots AND the classifier is confident
+    """
+
+    def __init__(self, csv_handler, min_confidence: float = 0.8, max_results: int = 8,
+                 extractor: Optional[ProfileExtractor] = None):
+        self.csv_handler = csv_handler
+        self.extractor = extractor or ProfileExtractor(csv_handler)
+        self.min_confidence = min_confidence
+        self.max_results = max_results
+        self.classifier = NaiveBayesIntentClassifier()
+        self._trained_version = None
+
+        self.turns_seen = 0
+        self.turns_served_locally = 0
+        self.local_latencies_ms = deque(maxlen=1000)
+
+    def route(self, user_input: str, state: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Try to answer a message locally
+        Returns: Dictionary shaped like LLMHandler.generate_response, or None to fall through
+        """
+        start = time.perf_counter()
+        self.turns_seen += 1
+
+        index = self.csv_handler.get_derived("intent_router", build_router_index)
+        slots, confidence = self._classify(user_input, index)
+        if not slots:
+            return None
+
+        filters = self._merge_profile(slots, state or {}, index)
+        response = self._answer(filters, index)
+
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self.turns_served_locally += 1
+        self.local_latencies_ms.append(elapsed_ms)
+        print(f"⚡ Served locally (confidence {confidence:.2f}) in {elapsed_ms:.2f} ms")
+        return response
+
+    def answer_degraded(self, user_input: str, state: Optional[Dict[str, Any]] = None) -> Optional[Dict[str, Any]]:
+        """
+        Best local answer while the LLM is unavailable
+        Uses any filters in the message or profile, skipping the lookup classifier
+        """
+        index = self.csv_handler.get_derived("intent_router", build_router_index)
+        if index is None:
+            return None
+        slots = self.extractor.extract_slots(user_input)
+        filters = self._merge_profile(slots, state or {}, index)
+        if not filters:
+            return None
+        return self._answer(filters, index)
+
+    def can_answer(self, user_input: str) -> bool:
+        """Whether route() would serve this message locally (no side effects)"""
+        index = self.csv_handler.get_derived("intent_router", build_router_index)
+        slots, _ = self._classify(user_input, index)
+        return bool(slots)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Share of turns served locally and their latency"""
+        latencies = sorted(self.local_latencies_ms)
+        return {
+            "turns_seen": self.turns_seen,
+            "turns_served_locally": self.turns_served_locally,
+            "local_percentage": round(100 * self.turns_served_locally / self.turns_seen, 1) if self.turns_seen else 0.0,
+            "local_avg_latency_ms": round(sum(latencies) / len(latencies), 3) if latencies else 0.0,
+            "local_p95_latency_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 3) if latencies else 0.0
+        }
+
+    def _classify(self, user_input: str, index: Optional[Dict[str, Any]]) -> Tuple[Dict[str, Any], float]:
+        """
+        Decide whether a message is a plain catalog lookup
+        Returns: (slots, confidence); slots is empty when the turn should go to the LLM
+        """
+        if index is None or _ESCALATION_PATTERN.search(user_input):
+            return {}, 0.0
+        if _STATEMENT_PATTERN.search(user_input) and not _LOOKUP_CUE_PATTERN.search(user_input):
+            return {}, 0.0
+
+        slots = self.extractor.extract_slots(user_input)
+        if not slots:
+            return {}, 0.0
+
+        tokens = self._tokenize(user_input, index)
+        if all(token in _FILLER_WORDS for token in tokens):
+            return slots, 1.0
+
+        self._ensure_trained(index)
+        confidence = self.classifier.predict_proba(tokens).get("lookup", 0.0)
+        if confidence < self.min_confidence:
+            return {}, confidence
+        return slots, confidence
+
+    def _ensure_trained(self, index: Dict[str, Any]) -> None:
+        """(Re)train the classifier so placeholders match the current catalog lexicons"""
+        version = (id(self.csv_handler), self.csv_handler.catalog_version)  # Shards share version numbers
+        if self._trained_version == version:
+            return
+        self.classifier = NaiveBayesIntentClassifier()
+        self.classifier.train([(self._tokenize(text, index), label) for text, label in SEED_EXAMPLES])
+        self._trained_version = version
+
+    def _tokenize(self, text: str, index: Dict[str, Any]) -> List[str]:
+        """Lowercase word tokens with slot values replaced by placeholder tokens"""
+        lexicons = self.extractor.lexicons()
+        text = lexicons["category_lexicon"].substitute(text, " topictok ")
+        text = lexicons["city_lexicon"].substitute(text, " placetok ")
+        text = _NUMBER_PATTERN.sub(" numtok ", text)
+        return _WORD_PATTERN.findall(text.lower())
+
+    def _merge_profile(self, slots: Dict[str, Any], state: Dict[str, Any], index: Dict[str, Any]) -> Dict[str, Any]:
+        """Fill filters the message left out from the learner profile"""
+        return merge_profile_filters(slots, state, self.extractor.lexicons()["city_lexicon"])
+
+    def _answer(self, filters: Dict[str, Any], index: Dict[str, Any]) -> Dict[str, Any]:
+        """Filter the catalog and render the templated reply"""
+        mask = np.ones(len(index["names"]), dtype=bool)
+        if "grade" in filters:
+            mask &= (index["min_grade"] <= filters["grade"]) & (index["max_grade"] >= filters["grade"])
+        if "max_price" in filters:
+            mask &= index["price"] <= filters["max_price"]
+        if "min_price" in filters:
+            mask &= index["price"] >= filters["min_price"]
+        if "city" in filters:
+            mask &= index["cities"] == filters["city"]
+        if "categories" in filters:
+            category_mask = np.zeros_like(mask)
+            for category in filters["categories"]:
+                category_mask |= index["category_masks"][category]
+            mask &= category_mask
+
+        matches = np.flatnonzero(mask)
+        matches = matches[np.argsort(index["price"][matches], kind="stable")]
+        description = self._describe(filters)
+
+        if len(matches) == 0:
+            text = (f"I couldn't find any {description} right now. Would you like me to widen the search, "
+                    f"for example a higher budget or a nearby city?")
+        else:
+            shown = matches[:self.max_results]
+            lead = "Here they are" if len(matches) <= self.max_results else f"Here are the {len(shown)} most affordable"
+            if len(matches) == 1:
+                description = description.replace("camps", "camp", 1)
+                lead = "Here it is"
+            lines = [f"I found {len(matches)} {description}. {lead}:"]
+            for row in shown:
+                lines.append(self._format_row(row, index))
+            lines.append("Would you like details on any of these, or should I narrow it down further?")
+            text = "\n".join(lines)
+
+        # A lookup is a question, not a profile fact, so the answer leaves the profile as it was
+        return {
+            "response": text,
+            "email_draft": None,
+            "state_updates": {}
+        }
+
+    @staticmethod
+    def _describe(filters: Dict[str, Any]) -> str:
+        """Describe the active filters, e.g. 'Gaming camps for 2nd grade under $300 in Plano'"""
+        subject = f"{' / '.join(filters['categories'])} camps" if filters.get("categories") else "camps"
+        parts = [subject]
+        if "grade" in filters:
+            parts.append(f"for {grade_label(filters['grade'])}" + (" grade" if filters["grade"] else ""))
+        price_text = format_price_range(filters.get("min_price"), filters.get("max_price"))
+        if price_text:
+            parts.append(price_text)
+        if "city" in filters:
+            parts.append(f"in {filters['city']}")
+        return " ".join(parts)
+
+    @staticmethod
+    def _format_row(row: int, index: Dict[str, Any]) -> str:
+        """One bullet line per camp"""
+        low, high = index["min_grade"][row], index["max_grade"][row]
+        grades = f"grades {'K' if low == 0 else low}-{high}"
+        city = index["cities"][row]
+        organization = index["organizations"][row]
+        line = f"• {index['names'][row]}"
+        if organization:
+            line += f" ({organization})"
+        line += f" — ${index['price'][row]:.0f}, {grades}"
+        if city:
+            line += f", {city}"
+        return line
@@ -3,14 +3,64 @@ Google LLM integration for the camp chatbot
 """
 import google.generativeai as genai
 import json
-from typing import Dict, Any, Optional
+import time
+from typing import Dict, Any, Optional, Callable
 from config import Config
+from camp_cards import CampCardRenderer
+from response_schema import RESPONSE_SCHEMA, expand_response, is_compact
+from model_cascade import ModelCascade, FAST_TIER, MAIN_TIER, current_plan
+from token_estimator import TokenEstimator
+from llm_resilience import (
+    Deadline, DeadlineExceeded, CircuitBreaker, CircuitOpenError, FaultInjectingBackend,
+    retry_call, repair_json, is_transient
+)
 
 class LLMHandler:
-    def __init__(self):
+    def __init__(self, backend: Optional[Callable[[str, float], str]] = None):
+        """
+        backend: optional callable (prompt, timeout_seconds) -> raw text, used instead of Gemini
+        (e.g. a FaultInjectingBackend for local resilience testing)
+        """
         self.model = None
-        self.last_response = None
-        self.initialize_llm()
+        self._models = {}  # Extra cascade tiers' models, by name (created on first use)
+        self.backend = backend
+        self.circuit_breaker = CircuitBreaker(
+            failure_threshold=Config.LLM_CIRCUIT_FAILURE_THRESHOLD,
+            reset_timeout=Config.LLM_CIRCUIT_RESET_SECONDS
+        )
+        self.resilience_stats = {
+            "calls": 0,
+            "retries": 0,
+            "json_repaired": 0,
+            "parse_failures": 0,
+            "deadline_exceeded": 0,
+            "circuit_rejections": 0,
+            "degraded_responses": 0
+        }
+        # Output size and format of parsed responses (compact schema vs legacy long keys)
+        self.token_estimator = TokenEstimator()
+        self.response_stats = {
+            "responses": 0,
+            "compact_responses": 0,
+            "legacy_responses": 0,
+            "output_tokens": 0,
+            "rejected_operations": 0
+        }
+        # Per-turn model tier and output cap
+        self.cascade = ModelCascade(
+            tiers={FAST_TIER: Config.CHAT_LLM_FAST, MAIN_TIER: Config.CHAT_LLM},
+            output_caps=Config.LLM_OUTPUT_CAPS,
+            default_cap=Config.MAX_OUTPUT_TOKENS,
+            fast_max_words=Config.LLM_FAST_MAX_WORDS,
+            fast_max_candidates=Config.LLM_FAST_MAX_CANDIDATES,
+            enabled=Config.LLM_CASCADE_ENABLED
+        )
+        if self.backend is None:
+            self.initialize_llm()
+            self.backend = self._gemini_backend
+            if Config.LLM_FAULT_INJECTION:
+                self.backend = FaultInjectingBackend.from_spec(Config.LLM_FAULT_INJECTION, inner=self._gemini_backend)
+                print(f"⚠️  LLM fault injection enabled: {Config.LLM_FAULT_INJECTION}")
     
     def initialize_llm(self) -> None:
         """Initialize Google Generative AI"""
@@ -22,14 +72,7 @@ class LLMHandler:
             genai.configure(api_key=Config.GOOGLE_API_KEY)
             
             # Initialize the model
-            self.model = genai.GenerativeModel(
-                model_name=Config.CHAT_LLM,
-                generation_config=genai.GenerationConfig(
-                    temperature=Config.TEMPERATURE,
-                    max_output_tokens=Config.MAX_OUTPUT_TOKENS,
-                    response_mime_type="application/json"  # Request JSON response
-                )
-            )
+            self.model = self._create_model(Config.CHAT_LLM)
             
             print(f"Successfully initialized {Config.CHAT_LLM}")
             
@@ -37,83 +80,243 @@ class LLMHandler:
             print(f"Error initializing LLM: {e}")
             raise
     
-    def generate_response(self, prompt: str) -> Dict[str, Any]:
+    def _create_model(self, model_name: str):
+        return genai.GenerativeModel(
+            model_name=model_name,
+            generation_config=genai.GenerationConfig(
+                temperature=Config.TEMPERATURE,
+                max_output_tokens=Config.MAX_OUTPUT_TOKENS,
+                response_mime_type="application/json",  # Request JSON response
+                response_schema=RESPONSE_SCHEMA if Config.LLM_ENFORCE_RESPONSE_SCHEMA else None
+            )
+        )
+    
+    def _model_for(self, model_name: str):
+        """The main model, or another cascade tier's model (created once)"""
+        if model_name == Config.CHAT_LLM:
+            return self.model
+        if model_name not in self._models:
+            self._models[model_name] = self._create_model(model_name)
+        return self._models[model_name]
+    
+    def _gemini_backend(self, prompt: str, timeout: float) -> str:
+        """Call Gemini with a per-call timeout taken from the request deadline, on the turn's tier"""
+        if not self.model:
+            raise ValueError("LLM model not initialized")
+        
+        plan = current_plan.get()
+        if plan:
+            response = self._model_for(plan["model"]).generate_content(
+                prompt,
+                generation_config={"max_output_tokens": plan["max_output_tokens"]},
+                request_options={"timeout": timeout}
+            )
+        else:
+            response = self.model.generate_content(prompt, request_options={"timeout": timeout})
+        if not response or not response.text:
+            raise ValueError("Empty response from LLM")
+        return response.text
+    
+    def generate_response(self, prompt: str, deadline: Optional[Deadline] = None,
+                          card_renderer: Optional[CampCardRenderer] = None,
+                          plan: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
         """
         Generate response from LLM
+        card_renderer: renders Detailed Mode cards for the camp_ids the model returns
+        plan: model tier and output cap from ModelCascade.plan (default: main model, full cap)
         Returns: Dictionary with 'response' and 'state_updates' keys
+        ('degraded': True when the provider could not answer in time)
         """
         try:
-            if not self.model:
-                raise ValueError("LLM model not initialized")
-            
-            # Generate response
-            response = self.model.generate_content(prompt)
-            
-            if not response or not response.text:
-                raise ValueError("Empty response from LLM")
-            
-            # Parse JSON response
-            try:
-                parsed_response = json.loads(response.text)
-            except json.JSONDecodeError as e:
-                print(f"JSON decode error: {e}")
-                print(f"Raw response: {response.text}")
-                # Fallback response
-                return {
-                    "response": "I apologize, but I encountered an error processing your request. Could you please try rephrasing your question?",
-                    "state_updates": {}
-                }
-            
-            # Validate response structure and combine conversational text with cards
-            if not isinstance(parsed_response, dict):
-                raise ValueError("Response is not a valid dictionary")
-            
-            conversational_text = parsed_response.get("conversational_response", "")
-            cards_text = parsed_response.get("camp_cards_text", "")
-            
-            if not conversational_text:
-                raise ValueError("Response missing 'conversational_response' field")
-            
-            # Combine the parts into a single response string for downstream processing
-            combined_response = f"{conversational_text}\n\n{cards_text}".strip()
-            
-            # Reconstruct the response object for the chatbot
-            email_draft = parsed_response.get("email_draft")
-            if email_draft and email_draft.get("subject"):
-                # Ensure from field is always present
-                if not email_draft.get("from"):
-                    email_draft["from"] = "brianchow06@gmail.com"
-                final_email_draft = email_draft
-            else:
-                final_email_draft = None
-                
-            final_response = {
-                "response": combined_response,
-                "email_draft": final_email_draft,
-                "state_updates": parsed_response.get("state_updates", {})
+            final_response = self.generate_response_raw(prompt, deadline, card_renderer=card_renderer, plan=plan)
+        except json.JSONDecodeError:
+            # Fallback response
+            return {
+                "response": "I apologize, but I encountered an error processing your request. Could you please try rephrasing your question?",
+                "state_updates": {}
             }
-            
-            self.last_response = final_response
-            return final_response
-            
+        except (CircuitOpenError, DeadlineExceeded) as e:
+            print(f"LLM unavailable, degrading: {e}")
+            return self._degraded_response()
         except Exception as e:
             print(f"Error generating response: {e}")
+            if is_transient(e):
+                return self._degraded_response()
             # Return error response
             return {
                 "response": f"I'm sorry, I encountered an error: {str(e)}. Please try again.",
                 "state_updates": {}
             }
+        
+        return final_response
+    
+    def generate_response_raw(self, prompt: str, deadline: Optional[Deadline] = None,
+                              card_renderer: Optional[CampCardRenderer] = None,
+                              plan: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Generate and parse a response without fallbacks or side effects
+        A fast-tier reply that fails validation is retried once on the main model
+        Raises on any failure so callers (e.g. speculative prefetch) can discard it
+        """
+        deadline = deadline or Deadline(Config.LLM_DEFAULT_DEADLINE_SECONDS)
+        plan = plan or self.cascade.main_plan()
+        while True:
+            try:
+                parsed_response = self._generate_validated(prompt, deadline, plan)
+                break
+            except (json.JSONDecodeError, ValueError) as e:
+                escalation = self.cascade.escalation(plan)
+                if escalation is None or deadline.expired():
+                    raise
+                print(f"{plan['model']} ({plan['tier']} tier) reply failed validation ({e}); "
+                      f"escalating to {escalation['model']}")
+                plan = escalation
+        
+        conversational_text = parsed_response["conversational_response"]
+        cards_text = parsed_response.get("camp_cards_text", "")
+        
+        # Detailed Mode: the model names camps by id and the cards are rendered from the catalog
+        camp_ids = parsed_response.get("camp_ids") or []
+        rendered_cards = ""
+        if camp_ids and card_renderer is not None:
+            rendered_cards = card_renderer.render(camp_ids, parsed_response.get("card_highlights"))
+            cards_text = rendered_cards or cards_text
+        
+        # Combine the parts into a single response string for downstream processing
+        combined_response = f"{conversational_text}\n\n{cards_text or ''}".strip()
+        
+        # Reconstruct the response object for the chatbot
+        email_draft = parsed_response.get("email_draft")
+        if isinstance(email_draft, dict) and email_draft.get("subject"):
+            # Ensure from field is always present
+            if not email_draft.get("from"):
+                email_draft["from"] = Config.EMAIL_FROM_ADDRESS
+            final_email_draft = email_draft
+        else:
+            final_email_draft = None
+            
+        return {
+            "response": combined_response,
+            "email_draft": final_email_draft,
+            "state_updates": parsed_response.get("state_updates") or {},
+            "state_operations": parsed_response.get("state_operations") or [],
+            "camp_ids": camp_ids,
+            "rendered_cards": rendered_cards,
+            "model_tier": plan["tier"]
+        }
+    
+    def _generate_validated(self, prompt: str, deadline: Deadline, plan: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        One model call on the plan's tier, parsed and expanded to long field names
+        Raises JSONDecodeError / ValueError when the reply fails validation
+        """
+        token = current_plan.set(plan)
+        start = time.perf_counter()
+        try:
+            raw_text = self._call_with_resilience(prompt, deadline)
+        finally:
+            current_plan.reset(token)
+        latency_ms = (time.perf_counter() - start) * 1000
+        output_tokens = self.token_estimator.estimate_text_tokens(raw_text)
+        
+        def record(failed: bool) -> None:
+            self.cascade.record(plan, latency_ms, self.token_estimator.estimate_text_tokens(prompt), output_tokens,
+                                failed=failed)
+        
+        # Parse JSON response, repairing fenced or truncated output before giving up
+        try:
+            parsed_response = json.loads(raw_text)
+        except json.JSONDecodeError as e:
+            parsed_response = repair_json(raw_text) if plan["tier"] == MAIN_TIER else None
+            if parsed_response is None:
+                # Fast-tier replies cut off at their small output cap are escalated rather than patched up
+                self.resilience_stats["parse_failures"] += 1
+                record(failed=True)
+                print(f"JSON decode error: {e}")
+                print(f"Raw response: {raw_text}")
+                raise
+            self.resilience_stats["json_repaired"] += 1
+            print(f"Repaired malformed JSON response ({e})")
+        
+        # Validate response structure
+        if not isinstance(parsed_response, dict):
+            record(failed=True)
+            raise ValueError("Response is not a valid dictionary")
+        compact = is_compact(parsed_response)
+        parsed_response = expand_response(parsed_response)
+        if not parsed_response.get("conversational_response"):
+            record(failed=True)
+            raise ValueError("Response missing 'conversational_response' field")
+        
+        record(failed=False)
+        self.response_stats["responses"] += 1
+        self.response_stats["output_tokens"] += output_tokens
+        self.response_stats["compact_responses" if compact else "legacy_responses"] += 1
+        return parsed_response
+    
+    def _call_with_resilience(self, prompt: str, deadline: Deadline) -> str:
+        """Breaker check, then bounded jittered retries within the deadline"""
+        if not self.circuit_breaker.allow_request():
+            self.resilience_stats["circuit_rejections"] += 1
+            raise CircuitOpenError("LLM provider circuit is open")
+        
+        def on_retry(attempt: int, error: Exception) -> None:
+            self.resilience_stats["retries"] += 1
+            print(f"Transient LLM error (attempt {attempt}), retrying: {error}")
+        
+        self.resilience_stats["calls"] += 1
+        try:
+            raw_text = retry_call(
+                lambda: self.backend(prompt, deadline.check()),
+                deadline,
+                max_attempts=Config.LLM_MAX_ATTEMPTS,
+                base_delay=Config.LLM_RETRY_BASE_DELAY,
+                max_delay=Config.LLM_RETRY_MAX_DELAY,
+                on_retry=on_retry
+            )
+        except Exception as e:
+            if isinstance(e, DeadlineExceeded) or deadline.expired():
+                self.resilience_stats["deadline_exceeded"] += 1
+            if isinstance(e, DeadlineExceeded) or is_transient(e):
+                self.circuit_breaker.record_failure()
+            else:
+                self.circuit_breaker.release_probe()
+            raise
+        
+        self.circuit_breaker.record_success()
+        return raw_text
+    
+    def _degraded_response(self) -> Dict[str, Any]:
+        """Bounded-latency answer used while the provider is failing"""
+        self.resilience_stats["degraded_responses"] += 1
+        return {
+            "response": "I'm having trouble reaching my planning assistant right now. "
+                        "I can still look up camps by activity, grade, budget or city — or please try again in a moment.",
+            "state_updates": {},
+            "degraded": True
+        }
+    
+    def get_resilience_status(self) -> Dict[str, Any]:
+        """Counters for retries, JSON repair, deadlines and the circuit breaker"""
+        return {**self.resilience_stats, "circuit_breaker": self.circuit_breaker.get_status()}
+    
+    def get_response_stats(self) -> Dict[str, Any]:
+        """Response format counters, average output size and parse failure rate"""
+        responses = self.response_stats["responses"]
+        attempts = responses + self.resilience_stats["parse_failures"]
+        return {
+            **self.response_stats,
+            "schema_enforced": Config.LLM_ENFORCE_RESPONSE_SCHEMA,
+            "avg_output_tokens": round(self.response_stats["output_tokens"] / responses, 1) if responses else 0.0,
+            "parse_failures": self.resilience_stats["parse_failures"],
+            "parse_failure_rate": round(self.resilience_stats["parse_failures"] / attempts, 4) if attempts else 0.0
+        }
     
     def test_connection(self) -> bool:
         """Test LLM connection with a simple prompt"""
         try:
             test_prompt = '''Please respond with this exact JSON format:
-            {{
-                "conversational_response": "Connection test successful!",
-                "camp_cards_text": "",
-                "email_draft": null,
-                "state_updates": {{}}
-            }}'''
+            {"r": "Connection test successful!"}'''
             
             result = self.generate_response(test_prompt)
             
@@ -132,6 +335,7 @@ class LLMHandler:
         """Get information about the current model"""
         return {
             "model_name": Config.CHAT_LLM,
+            "fast_model_name": Config.CHAT_LLM_FAST if Config.LLM_CASCADE_ENABLED else "",
             "temperature": str(Config.TEMPERATURE),
             "max_tokens": str(Config.MAX_OUTPUT_TOKENS),
             "api_configured": "Yes" if Config.GOOGLE_API_KEY else "No"
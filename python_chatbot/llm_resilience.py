@@ -0,0 +1,286 @@
+"""
+Resilience helpers for LLM calls
+Deadlines, jittered retries, tolerant JSON repair, a circuit breaker and a fault-injecting backend
+"""
+import json
+import random
+import re
+import threading
+import time
+from typing import Dict, Any, Optional, Callable, List
+
+try:
+    from google.api_core import exceptions as google_exceptions
+    _TRANSIENT_GOOGLE_ERRORS = (
+        google_exceptions.ServiceUnavailable,
+        google_exceptions.TooManyRequests,
+        google_exceptions.ResourceExhausted,
+        google_exceptions.InternalServerError,
+        google_exceptions.DeadlineExceeded,
+        google_exceptions.GatewayTimeout
+    )
+except ImportError:
+    _TRANSIENT_GOOGLE_ERRORS = ()
+
+
+class DeadlineExceeded(Exception):
+    """The request ran out of time before the LLM answered"""
+
+
+class CircuitOpenError(Exception):
+    """The circuit breaker is rejecting calls because the provider is failing"""
+
+
+class TransientLLMError(Exception):
+    """A provider error that is worth retrying"""
+
+
+def is_transient(error: Exception) -> bool:
+    """Whether an error is likely to succeed on retry"""
+    return isinstance(error, (TransientLLMError, TimeoutError, ConnectionError) + _TRANSIENT_GOOGLE_ERRORS)
+
+
+class Deadline:
+    """Absolute point in time a request must finish by, propagated down the call chain"""
+
+    def __init__(self, timeout_seconds: float):
+        self.timeout_seconds = timeout_seconds
+        self.expires_at = time.monotonic() + timeout_seconds
+
+    def remaining(self) -> float:
+        """Seconds left (never negative)"""
+        return max(0.0, self.expires_at - time.monotonic())
+
+    def expired(self) -> bool:
+        return self.remaining() <= 0.0
+
+    def check(self) -> float:
+        """Return the seconds left or raise DeadlineExceeded"""
+        remaining = self.remaining()
+        if remaining <= 0.0:
+            raise DeadlineExceeded(f"Deadline of {self.timeout_seconds:.1f}s exceeded")
+        return remaining
+
+
+def retry_call(fn: Callable[[], Any],
+               deadline: Deadline,
+               max_attempts: int = 3,
+               base_delay: float = 0.5,
+               max_delay: float = 4.0,
+               on_retry: Optional[Callable[[int, Exception], None]] = None) -> Any:
+    """
+    Call fn with bounded retries on transient errors
+    Uses full-jitter exponential backoff and never sleeps past the deadline
+    """
+    attempt = 0
+    while True:
+        attempt += 1
+        deadline.check()
+        try:
+            return fn()
+        except Exception as e:
+            if not is_transient(e) or attempt >= max_attempts:
+                raise
+            delay = random.uniform(0, min(max_delay, base_delay * (2 ** (attempt - 1))))
+            if delay >= deadline.remaining():
+                raise
+            if on_retry:
+                on_retry(attempt, e)
+            time.sleep(delay)
+
+
+_FENCE_PATTERN = re.compile(r'^\s*```(?:json|JSON)?\s*|\s*```\s*$')
+_TRAILING_COMMA_PATTERN = re.compile(r',\s*([}\]])')
+
+
+def repair_json(text: str) -> Optional[Any]:
+    """
+    Best-effort recovery of a JSON object from fenced, prefixed or truncated model output
+    Returns the parsed value, or None if nothing usable could be recovered
+    """
+    if not text:
+        return None
+
+    candidate = _FENCE_PATTERN.sub('', text.strip())
+    start = candidate.find('{')
+    if start < 0:
+        return None
+    candidate = candidate[start:]
+
+    # Complete output wrapped in chatter, or with trailing commas
+    end = candidate.rfind('}')
+    if end >= 0:
+        try:
+            return json.loads(_TRAILING_COMMA_PATTERN.sub(r'\1', candidate[:end + 1]))
+        except json.JSONDecodeError:
+            pass
+
+    # Truncated output: close what is open, backing off to earlier value boundaries
+    for attempt in _truncation_candidates(candidate):
+        try:
+            return json.loads(_TRAILING_COMMA_PATTERN.sub(r'\1', attempt))
+        except json.JSONDecodeError:
+            continue
+    return None
+
+
+def _truncation_candidates(text: str, max_candidates: int = 8) -> List[str]:
+    """Closed-off prefixes of a truncated JSON document, longest first"""
+    closers = {'{': '}', '[': ']'}
+    stack = []
+    boundaries = []  # (position, open brackets) at each structural comma
+    in_string = escaped = False
+
+    for index, char in enumerate(text):
+        if in_string:
+            if escaped:
+                escaped = False
+            elif char == '\\':
+                escaped = True
+            elif char == '"':
+                in_string = False
+            continue
+        if char == '"':
+            in_string = True
+        elif char in closers:
+            stack.append(char)
+        elif char in '}]':
+            if stack:
+                stack.pop()
+        elif char == ',':
+            boundaries.append((index, list(stack)))
+
+    candidates = []
+    tail = text.rstrip()
+    if escaped:
+        tail = tail[:-1]
+    if in_string:
+        tail += '"'
+    if tail.endswith(':'):
+        tail += ' null'
+    candidates.append(tail + ''.join(closers[c] for c in reversed(stack)))
+
+    for position, open_brackets in reversed(boundaries[-max_candidates:]):
+        candidates.append(text[:position] + ''.join(closers[c] for c in reversed(open_brackets)))
+    return candidates
+
+
+class CircuitBreaker:
+    """
+    Classic closed / open / half-open breaker
+    Opens after `failure_threshold` consecutive failures and lets a single probe
+    through once `reset_timeout` has passed
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.times_opened = 0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self) -> bool:
+        """Whether a call may go to the provider right now"""
+        with self._lock:
+            if self.state == self.CLOSED:
+                return True
+            if self.state == self.OPEN and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = self.HALF_OPEN
+            if self.state == self.HALF_OPEN and not self._probe_in_flight:
+                self._probe_in_flight = True
+                return True
+            return False
+
+    def record_success(self) -> None:
+        with self._lock:
+            self.state = self.CLOSED
+            self.consecutive_failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self.consecutive_failures += 1
+            self._probe_in_flight = False
+            if self.state == self.HALF_OPEN or self.consecutive_failures >= self.failure_threshold:
+                if self.state != self.OPEN:
+                    self.times_opened += 1
+                self.state = self.OPEN
+                self.opened_at = time.monotonic()
+
+    def release_probe(self) -> None:
+        """Free the half-open probe slot after a call that said nothing about provider health"""
+        with self._lock:
+            self._probe_in_flight = False
+
+    def get_status(self) -> Dict[str, Any]:
+        return {
+            "state": self.state,
+            "consecutive_failures": self.consecutive_failures,
+            "times_opened": self.times_opened
+        }
+
+
+def canned_backend(prompt: str, timeout: float) -> str:
+    """Local stand-in for the model that always answers with a valid response"""
+    return json.dumps({"r": "Connection test successful! This is a canned local response."})
+
+
+class FaultInjectingBackend:
+    """
+    Wraps a backend and injects provider faults for local testing
+    Faults: transient errors, latency (honouring the timeout), truncated output and code fences
+    """
+
+    def __init__(self,
+                 inner: Callable[[str, float], str] = canned_backend,
+                 failure_rate: float = 0.0,
+                 latency: float = 0.0,
+                 hang_rate: float = 0.0,
+                 truncate_rate: float = 0.0,
+                 fence_rate: float = 0.0,
+                 seed: Optional[int] = None):
+        self.inner = inner
+        self.failure_rate = failure_rate
+        self.latency = latency
+        self.hang_rate = hang_rate
+        self.truncate_rate = truncate_rate
+        self.fence_rate = fence_rate
+        self.random = random.Random(seed)
+        self.calls = 0
+
+    @classmethod
+    def from_spec(cls, spec: str, inner: Callable[[str, float], str] = canned_backend) -> "FaultInjectingBackend":
+        """Build from a spec such as 'failure_rate=0.3,latency=0.2,truncate_rate=0.1'"""
+        options = {}
+        for part in spec.split(','):
+            if '=' in part:
+                key, value = part.split('=', 1)
+                options[key.strip()] = int(value) if key.strip() == 'seed' else float(value)
+        return cls(inner=inner, **options)
+
+    def __call__(self, prompt: str, timeout: float) -> str:
+        self.calls += 1
+        if self.random.random() < self.hang_rate:
+            time.sleep(timeout)
+            raise TimeoutError("Injected hang")
+        if self.latency:
+            if self.latency >= timeout:
+                time.sleep(timeout)
+                raise TimeoutError("Injected latency exceeded timeout")
+            time.sleep(self.latency)
+        if self.random.random() < self.failure_rate:
+            raise TransientLLMError("Injected 503 Service Unavailable")
+
+        text = self.inner(prompt, timeout)
+        if self.random.random() < self.truncate_rate:
+            text = text[:self.random.randint(len(text) // 2, len(text) - 1)]
+        if self.random.random() < self.fence_rate:
+            text = f"```json\n{text}\n```"
+        return text
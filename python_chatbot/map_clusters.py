@@ -0,0 +1,281 @@
+"""
+Server-side map marker clustering for the camp chatbot
+A supercluster-style zoom hierarchy (greedy radius clustering in Web Mercator, level by level) built
+once per catalog version; viewport queries are a range lookup on one level plus, for filtered views,
+prefix sums over the facet mask, since every cluster covers a contiguous run of leaves
+"""
+import json
+import math
+import time
+from collections import OrderedDict
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+
+from recommender import feature_arrays
+from facets import facet_index
+
+FILTER_CACHE_SIZE = 32  # Filter combinations whose leaf prefix sums are kept per catalog version
+_CELL_STRIDE = 1 << 32
+
+
+def mercator_x(longitude: np.ndarray) -> np.ndarray:
+    return np.asarray(longitude, dtype=np.float64) / 360.0 + 0.5
+
+
+def mercator_y(latitude: np.ndarray) -> np.ndarray:
+    sin = np.sin(np.radians(np.asarray(latitude, dtype=np.float64)))
+    with np.errstate(divide="ignore"):
+        y = 0.5 - 0.25 * np.log((1 + sin) / (1 - sin)) / math.pi
+    return np.clip(y, 0.0, 1.0)
+
+
+def _neighbourhood_counts(keys: np.ndarray) -> np.ndarray:
+    """Nodes in the 3x3 grid cells around each node's cell (itself included)"""
+    order = np.argsort(keys, kind="stable")
+    sorted_keys = keys[order]  # Sorted needles keep the searchsorted calls cache-friendly
+    cells, cell_counts = np.unique(sorted_keys, return_counts=True)
+    totals = np.zeros(len(keys), dtype=np.int64)
+    for dx in (-1, 0, 1):
+        for dy in (-1, 0, 1):
+            shifted = sorted_keys + dx * _CELL_STRIDE + dy
+            positions = np.minimum(np.searchsorted(cells, shifted), len(cells) - 1)
+            found = cells[positions] == shifted
+            totals[order[found]] += cell_counts[positions[found]]
+    return totals
+
+
+def _cluster_level(x: np.ndarray, y: np.ndarray, radius: float) -> np.ndarray:
+    """
+    Greedy radius clustering of one level's nodes (in node order, like supercluster)
+    Returns each node's parent on the next level up; nodes with no neighbour pass through alone
+    """
+    count = len(x)
+    cell_x = np.floor(x / radius).astype(np.int64)
+    cell_y = np.floor(y / radius).astype(np.int64)
+    keys = cell_x * _CELL_STRIDE + cell_y
+    representative = np.arange(count)
+
+    # Grid cells are one radius wide, so a node alone in its 3x3 block has no neighbour within the radius
+    crowded = np.flatnonzero(_neighbourhood_counts(keys) > 1)
+    grid = {}
+    for node in crowded.tolist():
+        grid.setdefault(int(keys[node]), []).append(node)
+    assigned = np.zeros(count, dtype=bool)
+    radius_squared = radius * radius
+    for node in crowded.tolist():
+        if assigned[node]:
+            continue
+        candidates = []
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                candidates.extend(grid.get(int(keys[node]) + dx * _CELL_STRIDE + dy, ()))
+        candidates = np.array(candidates)
+        candidates = candidates[~assigned[candidates]]
+        near = candidates[(x[candidates] - x[node]) ** 2 + (y[candidates] - y[node]) ** 2 <= radius_squared]
+        representative[near] = node
+        assigned[near] = True
+
+    _, parents = np.unique(representative, return_inverse=True)
+    return parents
+
+
+def build_cluster_index(features: Dict[str, Any], radius_px: float = 40, extent: int = 512,
+                        min_zoom: int = 0, max_zoom: int = 16) -> Dict[str, Any]:
+    """
+    Cluster hierarchy for zoom levels min_zoom..max_zoom (level max_zoom + 1 holds the camps themselves)
+    Leaves are stored in an order where each cluster's camps are contiguous, so a cluster is a
+    [start, end) leaf range and any filter's counts and centroids are prefix-sum differences
+    """
+    rows = np.flatnonzero(features["has_location"])
+    latitude = np.degrees(features["lat_rad"][rows].astype(np.float64))
+    longitude = np.degrees(features["lon_rad"][rows].astype(np.float64))
+    x, y = mercator_x(longitude), mercator_y(latitude)
+
+    # Bottom-up: parents[z] maps level z + 1 nodes to level z nodes
+    parents = {}
+    level_x, level_y, level_weight = x, y, np.ones(len(rows))
+    for zoom in range(max_zoom, min_zoom - 1, -1):
+        parent = _cluster_level(level_x, level_y, radius_px / (extent * 2 ** zoom)) \
+            if len(level_x) else np.zeros(0, dtype=np.int64)
+        parents[zoom] = parent
+        size = int(parent.max()) + 1 if len(parent) else 0
+        weight = np.bincount(parent, weights=level_weight, minlength=size)
+        level_x = np.bincount(parent, weights=level_x * level_weight, minlength=size) / np.maximum(weight, 1)
+        level_y = np.bincount(parent, weights=level_y * level_weight, minlength=size) / np.maximum(weight, 1)
+        level_weight = weight
+
+    # Each leaf's ancestor on every level; sorting by them top-down makes every cluster contiguous
+    ancestors = {max_zoom + 1: np.arange(len(rows))}
+    for zoom in range(max_zoom, min_zoom - 1, -1):
+        ancestors[zoom] = parents[zoom][ancestors[zoom + 1]]
+    order = np.lexsort(tuple(ancestors[zoom] for zoom in range(max_zoom + 1, min_zoom - 1, -1)))
+
+    leaf_x, leaf_y = x[order], y[order]
+    index = {
+        "min_zoom": min_zoom,
+        "max_zoom": max_zoom,
+        "radius": {zoom: radius_px / (extent * 2 ** zoom) for zoom in range(min_zoom, max_zoom + 2)},
+        "leaf_rows": rows[order],
+        "leaf_latitude": latitude[order],
+        "leaf_longitude": longitude[order],
+        "prefix": _prefix_sums(np.ones(len(rows), dtype=bool), leaf_x, leaf_y),
+        "leaf_x": leaf_x,
+        "leaf_y": leaf_y,
+        "levels": {},
+        "filter_cache": OrderedDict()
+    }
+
+    # Zoom at which each node first splits (supercluster's expansion zoom), walked top-down from the leaves
+    expansion = np.full(len(rows), max_zoom + 1)
+    for zoom in range(max_zoom + 1, min_zoom - 1, -1):
+        sorted_ancestors = ancestors[zoom][order]
+        nodes, start, sizes = np.unique(sorted_ancestors, return_index=True, return_counts=True)
+        if zoom <= max_zoom:
+            parent = parents[zoom]
+            children = np.bincount(parent, minlength=len(nodes))
+            only_child = np.zeros(len(nodes), dtype=np.int64)
+            only_child[parent] = np.arange(len(parent))
+            expansion = np.where(children > 1, zoom + 1, expansion[only_child])
+        index["levels"][zoom] = _level(index, start, start + sizes, expansion)
+    return index
+
+
+def _prefix_sums(mask: np.ndarray, leaf_x: np.ndarray, leaf_y: np.ndarray) -> Tuple[np.ndarray, ...]:
+    def prefix(values: np.ndarray) -> np.ndarray:
+        return np.concatenate(([0.0], np.cumsum(values, dtype=np.float64)))
+    return prefix(mask), prefix(np.where(mask, leaf_x, 0.0)), prefix(np.where(mask, leaf_y, 0.0))
+
+
+def _level(index: Dict[str, Any], start: np.ndarray, end: np.ndarray, expansion: np.ndarray) -> Dict[str, Any]:
+    """One zoom level's nodes, sorted by x for viewport range lookups"""
+    counts, sum_x, sum_y = index["prefix"]
+    x = (sum_x[end] - sum_x[start]) / (end - start)
+    y = (sum_y[end] - sum_y[start]) / (end - start)
+    order = np.argsort(x, kind="stable")
+    return {
+        "x": x[order], "y": y[order],
+        "start": start[order], "end": end[order],
+        "expansion_zoom": expansion[order],
+        "ids": order
+    }
+
+
+class MapClusterEngine:
+    """
+    Answers /map/clusters viewport queries from the per-catalog cluster hierarchy
+    Filters use the facet index's precomputed bitsets (see facets.FacetIndex.bitset)
+    """
+
+    def __init__(self, csv_handler, radius_px: float = 40, extent: int = 512, max_zoom: int = 16):
+        self.csv_handler = csv_handler
+        self.radius_px = radius_px
+        self.extent = extent
+        self.max_zoom = max_zoom
+
+    def index(self) -> Dict[str, Any]:
+        return self.csv_handler.get_derived("map_clusters", lambda frame: build_cluster_index(
+            feature_arrays(self.csv_handler), radius_px=self.radius_px, extent=self.extent, max_zoom=self.max_zoom
+        ))
+
+    def clusters(self, bbox: List[float], zoom: float, filters: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Clusters and single camps visible in bbox = [west, south, east, north] (degrees) at a zoom
+        filters: facet filters as for /facets (categories, grade, max_price, ...); raises ValueError if invalid
+        """
+        start_time = time.perf_counter()
+        if len(bbox) != 4:
+            raise ValueError("bbox must be west,south,east,north")
+        west, south, east, north = (float(value) for value in bbox)
+        if south > north:
+            raise ValueError("bbox south is above north")
+        index = self.index()
+        level_zoom = min(max(int(math.floor(float(zoom))), index["min_zoom"]), index["max_zoom"] + 1)
+        filters = {field: value for field, value in (filters or {}).items() if value not in (None, [], "")}
+        prefix = self._prefix(index, filters) if filters else index["prefix"]
+
+        # A viewport across the antimeridian is two ranges
+        if east - west >= 360:
+            spans = [(-180.0, 180.0)]
+        else:
+            west, east = (west + 180) % 360 - 180, (east + 180) % 360 - 180
+            spans = [(west, east)] if west <= east else [(west, 180.0), (-180.0, east)]
+
+        features = []
+        for span_west, span_east in spans:
+            features.extend(self._query(index, level_zoom, prefix, bool(filters),
+                                        (float(mercator_x(span_west)), float(mercator_y(north)),
+                                         float(mercator_x(span_east)), float(mercator_y(south)))))
+        return {
+            "zoom": level_zoom,
+            "total": int(prefix[0][-1]),
+            "clusters": sum(1 for feature in features if feature["type"] == "cluster"),
+            "points": sum(1 for feature in features if feature["type"] == "point"),
+            "features": features,
+            "elapsed_ms": round((time.perf_counter() - start_time) * 1000, 3)
+        }
+
+    def _prefix(self, index: Dict[str, Any], filters: Dict[str, Any]) -> Tuple[np.ndarray, ...]:
+        """Leaf-order prefix sums of the filter's mask (cached per filter combination)"""
+        key = json.dumps(filters, sort_keys=True, default=str)
+        cache = index["filter_cache"]
+        if key in cache:
+            cache.move_to_end(key)
+            return cache[key]
+        facets = facet_index(self.csv_handler)
+        mask = np.zeros(facets.row_count, dtype=bool)
+        mask[facets.rows(filters)] = True
+        prefix = _prefix_sums(mask[index["leaf_rows"]], index["leaf_x"], index["leaf_y"])
+        cache[key] = prefix
+        if len(cache) > FILTER_CACHE_SIZE:
+            cache.popitem(last=False)
+        return prefix
+
+    def _query(self, index: Dict[str, Any], zoom: int, prefix: Tuple[np.ndarray, ...], filtered: bool,
+               bounds: Tuple[float, float, float, float]) -> List[Dict[str, Any]]:
+        level = index["levels"][zoom]
+        min_x, min_y, max_x, max_y = bounds
+        # A filtered cluster's centroid moves within its radius, so look a radius beyond the viewport
+        pad = index["radius"][zoom] if filtered else 0.0
+        low = np.searchsorted(level["x"], min_x - pad, side="left")
+        high = np.searchsorted(level["x"], max_x + pad, side="right")
+        ys = level["y"][low:high]
+        selected = low + np.flatnonzero((ys >= min_y - pad) & (ys <= max_y + pad))
+
+        start, end = level["start"][selected], level["end"][selected]
+        counts, sum_x, sum_y = prefix
+        matches = (counts[end] - counts[start]).astype(np.int64)
+        if filtered:
+            keep = matches > 0
+            selected, start, end, matches = selected[keep], start[keep], end[keep], matches[keep]
+            x = (sum_x[end] - sum_x[start]) / matches
+            y = (sum_y[end] - sum_y[start]) / matches
+            keep = (x >= min_x) & (x <= max_x) & (y >= min_y) & (y <= max_y)
+            selected, start, matches, x, y = selected[keep], start[keep], matches[keep], x[keep], y[keep]
+        else:
+            x, y = level["x"][selected], level["y"][selected]
+
+        # Clusters reduced to one matching camp are returned as that camp
+        single = matches == 1
+        leaves = start[single]
+        if filtered:
+            leaves = np.searchsorted(counts, counts[leaves] + 1, side="left") - 1
+        catalog = feature_arrays(self.csv_handler)
+        features = [
+            {"type": "point", "camp_id": catalog["camp_ids"][row], "camp_name": catalog["names"][row],
+             "lat": lat, "lon": lon}
+            for row, lat, lon in zip(index["leaf_rows"][leaves].tolist(),
+                                     np.round(index["leaf_latitude"][leaves], 6).tolist(),
+                                     np.round(index["leaf_longitude"][leaves], 6).tolist())
+        ]
+        grouped = selected[~single]
+        latitude = np.degrees(np.arctan(np.sinh(np.pi * (1 - 2 * y[~single]))))
+        features.extend(
+            {"type": "cluster", "cluster_id": cluster_id, "count": count, "lat": lat, "lon": lon,
+             "expansion_zoom": expansion_zoom}
+            for cluster_id, count, lat, lon, expansion_zoom in zip(
+                ((level["ids"][grouped] << 5) | zoom).tolist(), matches[~single].tolist(),
+                np.round(latitude, 6).tolist(), np.round(x[~single] * 360.0 - 180.0, 6).tolist(),
+                level["expansion_zoom"][grouped].tolist())
+        )
+        return features
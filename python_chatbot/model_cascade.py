@@ -0,0 +1,145 @@
+"""
+Model cascade for the camp chatbot
+Picks a model tier and output-token cap per turn from local signals (intent, message length, how many
+camps fit the profile); light turns go to the fast tier and escalate to the main model if its reply fails validation
+"""
+import contextvars
+import re
+import threading
+from collections import deque
+from typing import Dict, Any, Optional
+
+FAST_TIER = "fast"
+MAIN_TIER = "main"
+
+# Checked in order: the first intent whose pattern matches wins
+_INTENT_PATTERNS = [
+    ("email", re.compile(r"\b(?:e-?mail|draft|write (?:to|a (?:note|message))|reach out|contact the)\b", re.IGNORECASE)),
+    ("scheduling", re.compile(
+        r"\b(?:schedule|plan(?:ning)?|calendar|week[- ]by[- ]week|organi[sz]e (?:the |our )?weeks|"
+        r"which weeks|fit (?:it|them|these) in)\b", re.IGNORECASE
+    )),
+    ("detail", re.compile(
+        r"\b(?:tell me more|more (?:about|info|details)|details?|specifics|show me (?:the )?(?:card|details))\b",
+        re.IGNORECASE
+    )),
+    ("small_talk", re.compile(
+        r"^\s*(?:hi|hello|hey|thanks?(?: you)?|thank you(?: so much)?|ok(?:ay)?|cool|great|perfect|got it|"
+        r"sounds good|bye|goodbye|yes|no|sure|awesome)\b[\s!.?,]*(?:(?:so much|again|a lot)[\s!.]*)?$",
+        re.IGNORECASE
+    ))
+]
+_WORD_PATTERN = re.compile(r"\S+")
+
+# Tier plan for the call in progress, read by the Gemini backend (keeps the (prompt, timeout) backend signature)
+current_plan = contextvars.ContextVar("current_plan", default=None)
+
+
+def classify_intent(text: str) -> str:
+    """small_talk, detail, scheduling, email or conversation"""
+    for intent, pattern in _INTENT_PATTERNS:
+        if pattern.search(text or ""):
+            return intent
+    return "conversation"
+
+
+class ModelCascade:
+    """
+    Turn routing between a fast and a main model tier, with per-tier latency and token counters
+    tiers: {"fast": model name, "main": model name}; output_caps: max output tokens per intent
+    """
+
+    def __init__(self, tiers: Dict[str, str], output_caps: Dict[str, int], default_cap: int = 2048,
+                 fast_max_words: int = 40, fast_max_candidates: int = 40, enabled: bool = True):
+        self.tiers = tiers
+        self.output_caps = output_caps
+        self.default_cap = default_cap
+        self.fast_max_words = fast_max_words
+        self.fast_max_candidates = fast_max_candidates
+        self.enabled = enabled
+        self._lock = threading.Lock()
+        self.intents = {}
+        self.tier_stats = {
+            tier: {"calls": 0, "failures": 0, "escalations": 0, "input_tokens": 0, "output_tokens": 0,
+                   "latencies_ms": deque(maxlen=1000)}
+            for tier in tiers
+        }
+
+    def plan(self, user_input: str, candidate_count: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Tier and output cap for a turn
+        Email drafting and scheduling always get the main model and the full cap; small talk gets the fast tier,
+        and so do detail requests (cards are rendered server-side) and other questions when they are short and
+        the candidate set is narrow. A long or broad turn goes to the main model with at least the conversation cap
+        """
+        intent = classify_intent(user_input)
+        with self._lock:
+            self.intents[intent] = self.intents.get(intent, 0) + 1
+        max_output_tokens = self.output_caps.get(intent, self.default_cap)
+        if not self.enabled:
+            return self.main_plan(intent, reason="cascade disabled")
+
+        words = len(_WORD_PATTERN.findall(user_input or ""))
+        if intent in ("email", "scheduling"):
+            return self.main_plan(intent, max_output_tokens, reason=intent)
+        if intent == "small_talk":
+            return {"tier": FAST_TIER, "model": self.tiers[FAST_TIER], "max_output_tokens": max_output_tokens,
+                    "intent": intent, "reason": intent}
+        broad_cap = max(max_output_tokens, self.output_caps.get("conversation", self.default_cap))
+        if words > self.fast_max_words:
+            return self.main_plan(intent, broad_cap, reason=f"{words} words")
+        if candidate_count is not None and candidate_count > self.fast_max_candidates:
+            return self.main_plan(intent, broad_cap, reason=f"{candidate_count} candidate camps")
+        return {"tier": FAST_TIER, "model": self.tiers[FAST_TIER], "max_output_tokens": max_output_tokens,
+                "intent": intent, "reason": intent if intent == "detail" else "short question, narrow candidate set"}
+
+    def main_plan(self, intent: str = "conversation", max_output_tokens: Optional[int] = None,
+                  reason: str = "default") -> Dict[str, Any]:
+        return {"tier": MAIN_TIER, "model": self.tiers[MAIN_TIER],
+                "max_output_tokens": max_output_tokens or self.default_cap, "intent": intent, "reason": reason}
+
+    def escalation(self, plan: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Plan to retry a failed fast-tier reply with (None once already on the main tier)"""
+        if plan["tier"] == MAIN_TIER:
+            return None
+        return self.main_plan(plan["intent"], self.default_cap, reason=f"escalated from {plan['tier']}")
+
+    def record(self, plan: Dict[str, Any], latency_ms: float, input_tokens: int, output_tokens: int,
+               failed: bool = False) -> None:
+        """Count one model call; a failed fast-tier call counts as an escalation"""
+        with self._lock:
+            stats = self.tier_stats[plan["tier"]]
+            stats["calls"] += 1
+            stats["input_tokens"] += input_tokens
+            stats["output_tokens"] += output_tokens
+            stats["latencies_ms"].append(latency_ms)
+            if failed:
+                stats["failures"] += 1
+                if plan["tier"] != MAIN_TIER:
+                    stats["escalations"] += 1
+
+    def get_stats(self) -> Dict[str, Any]:
+        """
+        Per-tier calls, escalations, latency and estimated token usage, plus the intent mix
+        model_routing_active is False when both tiers resolve to the same model: light turns then only get
+        the smaller output caps, not a faster model
+        """
+        tiers = {}
+        with self._lock:
+            for tier, stats in self.tier_stats.items():
+                latencies = sorted(stats["latencies_ms"])
+                calls = stats["calls"]
+                tiers[tier] = {
+                    "model": self.tiers[tier],
+                    **{key: value for key, value in stats.items() if key != "latencies_ms"},
+                    "avg_output_tokens": round(stats["output_tokens"] / calls, 1) if calls else 0.0,
+                    "avg_latency_ms": round(sum(latencies) / len(latencies), 1) if latencies else 0.0,
+                    "p95_latency_ms": round(latencies[int(0.95 * (len(latencies) - 1))], 1) if latencies else 0.0
+                }
+            intents = dict(self.intents)
+        return {
+            "enabled": self.enabled,
+            "model_routing_active": self.enabled and self.tiers.get(FAST_TIER) != self.tiers.get(MAIN_TIER),
+            "tiers": tiers,
+            "intents": intents
+        }
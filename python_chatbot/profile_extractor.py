@@ -0,0 +1,287 @@
+"""
+Local profile extractor for the camp chatbot
+Pulls age/grade, budget, activities, location and date mentions out of a parent's message with
+regexes and the catalog's own lexicons, so the learner profile is current before the prompt is built
+"""
+import re
+import time
+from datetime import date
+from typing import Dict, Any, List, Optional, Tuple
+
+import pandas as pd
+
+from slot_extraction import (
+    parse_grade, parse_age, age_to_grade, grade_label, parse_price_range, format_price_range,
+    split_categories, city_from_address, build_category_lexicon, build_city_lexicon, parse_date_mentions,
+    PhraseLexicon
+)
+from state_manager import STATE_FIELDS
+
+# A clause with one of these around its dates is about when the child can NOT go
+_BLACKOUT_PATTERN = re.compile(
+    r"\b(?:away|vacation|travel(?:l?ing)?|out of town|not available|unavailable|can'?t|cannot|busy|"
+    r"except|excluding|skip|no camps?)\b",
+    re.IGNORECASE
+)
+_CLAUSE_PATTERN = re.compile(r"[.;!?\n]+|\bbut\b", re.IGNORECASE)
+# Only a clause stating when the family is free records available dates ("we're free in July"),
+# not one that merely mentions a month in a request ("email the camp about July availability")
+_AVAILABLE_PATTERN = re.compile(
+    r"\b(?:available|free (?:in|during|from|on|the|all|for|after|before|until)|in town|around (?:in|during|from)|"
+    r"off (?:in|during|from)|(?:can|could) (?:go|attend|do|make)|works? for (?:us|me|him|her|them)|"
+    r"(?:looking|planning|hoping|thinking) (?:at|of|about|for|to)|prefer\w*)\b",
+    re.IGNORECASE
+)
+_REQUEST_PATTERN = re.compile(
+    r"\b(?:e-?mail|draft|write|reach out|contact|send|ask|find|show|search|list|tell me|are there|is there|"
+    r"what|which|any)\b",
+    re.IGNORECASE
+)
+# Activities in a clause like these are what the child does NOT want ("she hates swimming")
+_NEGATION_PATTERN = re.compile(
+    r"\b(?:hates?|hated|dislikes?|disliked|not|no|never|nothing|doesn'?t|don'?t|isn'?t|aren'?t|won'?t|"
+    r"avoid|afraid of|scared of|can'?t stand|rather not|tired of|bored (?:of|by|with))\b",
+    re.IGNORECASE
+)
+_ACTIVITY_CLAUSE_PATTERN = re.compile(r"[.;!?,\n]+|\b(?:but|and|while|though|although|whereas)\b", re.IGNORECASE)
+_NAME_CORE_PATTERN = re.compile(r"\s+(?:-|:|\()\s*")
+_WORD_PATTERN = re.compile(r"[a-z]+")
+# Words that say nothing about which camp is meant; a name made only of these and activity words
+# ("Robotics Camp", "Art and Drama Camp") is how parents describe what they want, so it is not masked
+_GENERIC_NAME_WORDS = {
+    'camp', 'camps', 'summer', 'week', 'weeks', 'day', 'half', 'full', 'kids', 'kid', 'and', 'the', 'of',
+    'for', 'in', 'a', 'an', 'with', 'at', 'program', 'programs', 'class', 'classes', 'session', 'club'
+}
+# Cheap pre-check so messages without a month name or ISO date skip the per-clause date parsing
+_DATE_HINT_PATTERN = re.compile(
+    r"\b(?:jan|feb|mar|apr|may|jun|jul|aug|sep|oct|nov|dec)[a-z]*\b|\d{4}-\d{2}-\d{2}", re.IGNORECASE
+)
+
+
+def build_profile_lexicons(frame: pd.DataFrame) -> Dict[str, Any]:
+    """Category, city and camp name lexicons for one catalog version"""
+    count = len(frame) if frame is not None else 0
+    categories = frame['categories'].tolist() if frame is not None and 'categories' in frame.columns else [""] * count
+    addresses = frame['formatted_address'].tolist() \
+        if frame is not None and 'formatted_address' in frame.columns else [""] * count
+    names = frame['camp_name'].fillna("").astype(str).tolist() \
+        if frame is not None and 'camp_name' in frame.columns else []
+    category_lexicon = build_category_lexicon({name for value in categories for name in split_categories(value)})
+    return {
+        "category_lexicon": category_lexicon,
+        "city_lexicon": build_city_lexicon(city_from_address(address) for address in addresses),
+        "camp_name_lexicon": build_camp_name_lexicon(names, category_lexicon)
+    }
+
+
+def build_camp_name_lexicon(names: List[str], category_lexicon: PhraseLexicon) -> PhraseLexicon:
+    """
+    Camp names (and their part before any ' - ' / ' : ' / '(' suffix) that identify a camp, so a message
+    naming "Adventures in Minecraft Game" is not read as the child liking Gaming
+    """
+    common = {word for phrase in category_lexicon.phrases for word in _WORD_PATTERN.findall(phrase)}
+    common |= _GENERIC_NAME_WORDS
+    phrases = {}
+    for name in names:
+        name = name.strip()
+        for phrase in (name, _NAME_CORE_PATTERN.split(name)[0]):
+            words = _WORD_PATTERN.findall(phrase.lower())
+            if len(words) >= 2 and not set(words) <= common:
+                phrases[phrase] = phrase
+    return PhraseLexicon(phrases)
+
+
+def format_date_range(start: date, end: date) -> str:
+    """A date range the way parse_date_mentions reads it back ('July', 'June 16-20', 'June 30-July 3')"""
+    next_day = date.fromordinal(end.toordinal() + 1)
+    if start.day == 1 and next_day.day == 1 and start.month == end.month:
+        return f"{start:%B}"
+    if start == end:
+        return f"{start:%B} {start.day}"
+    if start.month == end.month:
+        return f"{start:%B} {start.day}-{end.day}"
+    return f"{start:%B} {start.day}-{end:%B} {end.day}"
+
+
+class ProfileExtractor:
+    """
+    Rule-based slot extraction shared by the pre-LLM profile update and the local intent router
+    Profile changes are expressed as StateManager add/set operations, only for values that are new
+    """
+
+    def __init__(self, csv_handler):
+        self.csv_handler = csv_handler
+        self.stats = {
+            "messages": 0,
+            "messages_with_facts": 0,
+            "operations_applied": 0,
+            "overridden_by_model": 0,
+            "extract_us": 0.0
+        }
+
+    def lexicons(self) -> Dict[str, Any]:
+        """Category/city lexicons and the catalog's session year, built once per catalog version"""
+        def build(frame: pd.DataFrame) -> Dict[str, Any]:
+            starts = self.csv_handler.get_session_index()["start"]
+            year = int(starts.min().astype('datetime64[Y]').astype(int)) + 1970 if len(starts) else date.today().year
+            return {**build_profile_lexicons(frame), "year": year}
+        return self.csv_handler.get_derived("profile_extractor", build)
+
+    def extract_slots(self, text: str) -> Dict[str, Any]:
+        """Filter slots mentioned in a message: grade (or child_age), min/max_price, categories, city"""
+        lexicons = self.lexicons()
+        slots = {}
+        grade = parse_grade(text)
+        if grade is None:
+            age = parse_age(text)
+            if age is not None:
+                slots["child_age"] = age
+                grade = age_to_grade(age)
+        if grade is not None:
+            slots["grade"] = grade
+
+        min_price, max_price = parse_price_range(text)
+        if min_price is not None:
+            slots["min_price"] = min_price
+        if max_price is not None:
+            slots["max_price"] = max_price
+
+        categories = lexicons["category_lexicon"].find_all(text)
+        if categories:
+            slots["categories"] = categories
+
+        cities = lexicons["city_lexicon"].find_all(text)
+        if cities:
+            slots["city"] = cities[0]
+        return slots
+
+    def extract_dates(self, text: str) -> Tuple[List[str], List[str]]:
+        """
+        Date mentions in a message, split into (available, blackout) by the wording of their clause
+        A date counts as available only in a clause stating availability; dates in requests are skipped
+        """
+        available, blackout = [], []
+        if not _DATE_HINT_PATTERN.search(text or ""):
+            return available, blackout
+        year = self.lexicons()["year"]
+        for clause in _CLAUSE_PATTERN.split(text or ""):
+            if _BLACKOUT_PATTERN.search(clause):
+                target = blackout
+            elif _AVAILABLE_PATTERN.search(clause) and not _REQUEST_PATTERN.search(clause):
+                target = available
+            else:
+                continue
+            mentions = [format_date_range(start, end) for start, end in parse_date_mentions(clause, year)]
+            target.extend(mention for mention in mentions if mention not in target)
+        return available, blackout
+
+    def extract_activities(self, text: str) -> List[str]:
+        """Catalog categories the message says the child likes: negated clauses ("hates swimming") are skipped"""
+        category_lexicon = self.lexicons()["category_lexicon"]
+        found = []
+        for clause in _ACTIVITY_CLAUSE_PATTERN.split(text or ""):
+            if _NEGATION_PATTERN.search(clause):
+                continue
+            found.extend(category for category in category_lexicon.find_all(clause) if category not in found)
+        return found
+
+    def profile_text(self, text: str) -> str:
+        """The message with camp names masked out, so a named camp's words are not read as profile facts"""
+        return self.lexicons()["camp_name_lexicon"].substitute(text or "", " ")
+
+    def operations(self, text: str, state: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """
+        add/set operations for facts in the message that the (compact) state does not already hold
+        Camp names are masked first, activities in negated clauses are dropped and dates are taken only
+        from availability statements, since a turn answered locally has no model reply to correct them
+        """
+        start = time.perf_counter()
+        text = self.profile_text(text)
+        slots = self.extract_slots(text)
+        slots["categories"] = self.extract_activities(text)
+        available, blackout = self.extract_dates(text)
+        scheduling = state.get("scheduling") or {}
+
+        operations = []
+        for field, value in (
+            ("age", slots.get("child_age")),
+            ("grade", grade_label(slots["grade"]) if "grade" in slots and "child_age" not in slots else None),
+            ("budget", format_price_range(slots.get("min_price"), slots.get("max_price")) or None),
+            ("loc", slots.get("city"))
+        ):
+            current = state.get(STATE_FIELDS[field][0])
+            if value is None or current == value:
+                continue
+            if field == "loc" and value.lower() in str(current or "").lower():
+                continue  # "Frisco" when the profile already says "Frisco, TX"
+            operations.append({"op": "set", "f": field, "v": value})
+        # Activities already in the profile count by their catalog category ("swimming" covers Sports & Fitness)
+        activities = state.get("preferred_activities") or []
+        activities = activities + self.lexicons()["category_lexicon"].find_all(", ".join(map(str, activities)))
+        for field, values, current in (
+            ("acts", slots.get("categories") or [], activities),
+            ("dates", available, scheduling.get("available_dates") or []),
+            ("blackout", blackout, scheduling.get("blackout_dates") or [])
+        ):
+            operations.extend({"op": "add", "f": field, "v": value} for value in values if value not in current)
+
+        self.stats["messages"] += 1
+        self.stats["messages_with_facts"] += bool(operations)
+        self.stats["extract_us"] += (time.perf_counter() - start) * 1e6
+        return operations
+
+    def apply(self, state_manager, text: str) -> List[Dict[str, Any]]:
+        """Apply the message's new facts to the learner state; returns the operations applied"""
+        operations = self.operations(text, state_manager.get_compact_state())
+        if operations:
+            state_manager.apply_operations(operations)
+            self.stats["operations_applied"] += len(operations)
+        return operations
+
+    def reconcile(self, state_manager, applied: List[Dict[str, Any]], model_operations: List[Dict[str, Any]],
+                  model_updates: Optional[Dict[str, Any]] = None) -> None:
+        """
+        Settle this turn's local operations against the model's, which are applied after them and win:
+        a field the model set or removed keeps the model's value, and a locally added activity the model
+        re-stated in its own words (same catalog category) is dropped in favour of the model's wording
+        """
+        model_fields = {operation.get("f") for operation in model_operations or [] if isinstance(operation, dict)}
+        model_fields.update(field for field, path in STATE_FIELDS.items() if path[0] in (model_updates or {}))
+        if not model_fields:
+            return
+
+        category_lexicon = self.lexicons()["category_lexicon"]
+        model_activities = [
+            str(operation.get("v")) for operation in model_operations or []
+            if isinstance(operation, dict) and operation.get("f") == "acts" and operation.get("op") in ("add", "set")
+        ] + [str(value) for value in (model_updates or {}).get("preferred_activities") or []]
+        restated = set(category_lexicon.find_all(", ".join(model_activities)))
+
+        removals = []
+        for operation in applied:
+            if operation["f"] not in model_fields:
+                continue
+            if operation["f"] == "acts" and operation["v"] in restated and operation["v"] not in model_activities:
+                removals.append({"op": "remove", "f": "acts", "v": operation["v"]})
+            elif self._holds(state_manager.get_state(), operation):
+                continue  # The model touched the field but agreed with the local value
+            self.stats["overridden_by_model"] += 1
+        if removals:
+            state_manager.apply_operations(removals)
+
+    @staticmethod
+    def _holds(state: Dict[str, Any], operation: Dict[str, Any]) -> bool:
+        """Whether the profile still holds a local operation's value"""
+        value = state
+        for key in STATE_FIELDS[operation["f"]]:
+            value = (value or {}).get(key)
+        if isinstance(value, list):
+            return operation["v"] in value
+        return str(value).strip().lower() == str(operation["v"]).strip().lower()
+
+    def get_stats(self) -> Dict[str, Any]:
+        messages = self.stats["messages"]
+        return {
+            **{key: value for key, value in self.stats.items() if key != "extract_us"},
+            "avg_extract_us": round(self.stats["extract_us"] / messages, 1) if messages else 0.0
+        }
@@ -0,0 +1,455 @@
+"""
+Deterministic recommendation ranking for the camp chatbot
+Scores every camp against the learner profile in one vectorized NumPy pass
+"""
+import time
+from typing import Dict, Any, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from slot_extraction import (
+    parse_grade, age_to_grade, grade_label, parse_price_range, parse_date_mentions, weeks_in_range,
+    city_from_address, build_category_lexicon
+)
+from catalog_snapshot import category_index, session_index
+from gazetteer import Gazetteer, build_gazetteer
+
+FACTORS = ("grade", "budget", "activities", "distance", "dates")
+DEFAULT_WEIGHTS = {"grade": 3.0, "budget": 2.0, "activities": 2.0, "distance": 1.5, "dates": 1.0}
+EARTH_RADIUS_KM = 6371.0
+# Profile fields a caller may override, by expected type ("number", "text" or "list" of text)
+PROFILE_OVERRIDES = {
+    "grade": "number", "max_price": "number", "categories": "list", "latitude": "number", "longitude": "number",
+    "grade_level": "text", "child_age": "number", "budget_range": "text", "location_preference": "text",
+    "preferred_activities": "list", "available_dates": "list"
+}
+
+
+def validate_overrides(overrides: Any) -> Dict[str, Any]:
+    """
+    Check caller-supplied profile overrides against PROFILE_OVERRIDES
+    Raises ValueError for a wrong type, a value out of range, or latitude without longitude
+    """
+    if not isinstance(overrides, dict):
+        raise ValueError("profile must be an object")
+    for name, value in overrides.items():
+        expected = PROFILE_OVERRIDES[name]
+        if expected == "number" and (isinstance(value, bool) or not isinstance(value, (int, float))):
+            raise ValueError(f"profile.{name} must be a number")
+        if expected == "text" and not isinstance(value, str):
+            raise ValueError(f"profile.{name} must be a string")
+        if expected == "list" and not (isinstance(value, list) and all(isinstance(item, str) for item in value)):
+            raise ValueError(f"profile.{name} must be a list of strings")
+    if "grade" in overrides and not 0 <= overrides["grade"] <= 12:
+        raise ValueError("profile.grade must be between 0 (kindergarten) and 12")
+    if "max_price" in overrides and overrides["max_price"] < 0:
+        raise ValueError("profile.max_price must not be negative")
+    if ("latitude" in overrides) != ("longitude" in overrides):
+        raise ValueError("profile.latitude and profile.longitude must be given together")
+    if "latitude" in overrides and not (-90 <= overrides["latitude"] <= 90 and -180 <= overrides["longitude"] <= 180):
+        raise ValueError("profile.latitude / profile.longitude out of range")
+    return overrides
+
+
+def feature_arrays(csv_handler) -> Dict[str, Any]:
+    """Scoring arrays for the handler's current catalog, built once per catalog version"""
+    return csv_handler.get_derived("recommender", lambda frame: build_feature_arrays(
+        frame, csv_handler.get_category_index(), csv_handler.get_session_index()
+    ))
+
+
+def build_feature_arrays(frame: pd.DataFrame,
+                         categories_csr: Optional[Dict[str, Any]] = None,
+                         sessions_csr: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+    """
+    Turn the catalog into column arrays for scoring
+    categories_csr / sessions_csr: pre-split columns (e.g. from a catalog snapshot); parsed here if omitted
+    """
+    count = len(frame) if frame is not None else 0
+    categories_csr = categories_csr or category_index(frame)
+    sessions_csr = sessions_csr or session_index(frame)
+
+    def numeric(column: str, default: float) -> np.ndarray:
+        if frame is None or column not in frame.columns:
+            return np.full(count, default, dtype=np.float32)
+        return pd.to_numeric(frame[column], errors='coerce').fillna(default).to_numpy(dtype=np.float32)
+
+    def text(column: str) -> List[str]:
+        if frame is None or column not in frame.columns:
+            return [""] * count
+        return frame[column].astype(str).tolist()
+
+    # Category multi-hot matrix
+    categories = categories_csr["vocabulary"]
+    category_matrix = np.zeros((count, len(categories)), dtype=np.float32)
+    category_matrix[_csr_rows(categories_csr["indptr"]), categories_csr["indices"]] = 1.0
+
+    # Session week multi-hot matrix over the ISO weeks the catalog covers
+    session_rows, week_keys = _session_weeks(sessions_csr)
+    week_keys, week_columns = np.unique(week_keys, return_inverse=True)
+    weeks = [(int(key) // 100, int(key) % 100) for key in week_keys]
+    week_column = {week: index for index, week in enumerate(weeks)}
+    week_matrix = np.zeros((count, len(weeks)), dtype=np.float32)
+    week_matrix[session_rows, week_columns] = 1.0
+
+    latitude = numeric('latitude', np.nan)
+    longitude = numeric('longitude', np.nan)
+    has_location = ~(np.isnan(latitude) | np.isnan(longitude))
+    cities = [city_from_address(address) for address in text('formatted_address')]
+
+    return {
+        "count": count,
+        "camp_ids": text('camp_id') if frame is not None and 'camp_id' in frame.columns else [str(i) for i in range(count)],
+        "names": text('camp_name'),
+        "rows_by_name": _rows_by_key(text('camp_name')),
+        "organizations": text('organization_name'),
+        "cities": cities,
+        "min_grade": numeric('min_grade', 0),
+        "max_grade": numeric('max_grade', 12),
+        "price": numeric('price', 0),
+        "categories": categories,
+        "category_matrix": category_matrix,
+        "category_lexicon": build_category_lexicon(categories),
+        "weeks": weeks,
+        "week_column": week_column,
+        "week_matrix": week_matrix,
+        "default_year": weeks[0][0] if weeks else time.localtime().tm_year,
+        "has_location": has_location,
+        "lat_rad": np.radians(np.nan_to_num(latitude)).astype(np.float32),
+        "lon_rad": np.radians(np.nan_to_num(longitude)).astype(np.float32),
+        "cos_lat": np.cos(np.radians(np.nan_to_num(latitude))).astype(np.float32)
+    }
+
+
+def _csr_rows(indptr: np.ndarray) -> np.ndarray:
+    """Row number of every entry in a CSR structure"""
+    return np.repeat(np.arange(len(indptr) - 1), np.diff(indptr))
+
+
+def _session_weeks(sessions_csr: Dict[str, Any]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Expand session date ranges into (row, ISO year * 100 + week) pairs, like weeks_in_range, without a Python loop
+    """
+    rows = _csr_rows(sessions_csr["indptr"])
+    start = sessions_csr["start"].astype(np.int64)  # Days since 1970-01-01, a Thursday
+    end = sessions_csr["end"].astype(np.int64)
+    first_monday = start - (start + 3) % 7
+    week_counts = np.maximum(0, (end - first_monday) // 7 + 1)
+
+    offsets = np.arange(week_counts.sum()) - np.repeat(np.cumsum(week_counts) - week_counts, week_counts)
+    mondays = np.repeat(first_monday, week_counts) + 7 * offsets
+
+    # The ISO year and week of a Monday are those of its Thursday
+    thursdays = (mondays + 3).astype('datetime64[D]')
+    years = thursdays.astype('datetime64[Y]')
+    week_numbers = (thursdays - years.astype('datetime64[D]')).astype(np.int64) // 7 + 1
+    iso_years = years.astype(np.int64) + 1970
+    return np.repeat(rows, week_counts), iso_years * 100 + week_numbers
+
+
+def distances_km(features: Dict[str, Any], location: Tuple[float, float], rows: Any = slice(None)) -> np.ndarray:
+    """Haversine distance from a (lat, lon) point to every camp (or just `rows`)"""
+    lat = np.float32(np.radians(location[0]))
+    lon = np.float32(np.radians(location[1]))
+    half_dlat = (features["lat_rad"][rows] - lat) / 2
+    half_dlon = (features["lon_rad"][rows] - lon) / 2
+    a = np.sin(half_dlat) ** 2 + np.float32(np.cos(lat)) * features["cos_lat"][rows] * np.sin(half_dlon) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+# Factor scores (0-1) for every camp. Profile values may be scalars, or (profiles, 1) columns
+# (rows of `wanted` for the multi-hot factors) to score a whole batch of profiles at once
+
+def grade_factor(features: Dict[str, Any], grade: Any) -> np.ndarray:
+    outside = np.maximum(features["min_grade"] - grade, 0) + np.maximum(grade - features["max_grade"], 0)
+    return np.clip(1.0 - outside / 2.0, 0.0, 1.0)
+
+
+def budget_factor(features: Dict[str, Any], max_price: Any) -> np.ndarray:
+    budget = np.maximum(max_price, 1.0)
+    over = np.maximum(features["price"] - budget, 0)
+    return np.clip(1.0 - over / (0.5 * budget), 0.0, 1.0)
+
+
+def activity_factor(features: Dict[str, Any], wanted: np.ndarray) -> np.ndarray:
+    """Share of the wanted categories each camp offers"""
+    return wanted @ features["category_matrix"].T / wanted.sum(axis=-1, keepdims=True)
+
+
+def distance_factor(features: Dict[str, Any], location: Tuple[Any, Any], scale_km: float) -> np.ndarray:
+    distance = distances_km(features, location)
+    return np.where(features["has_location"], np.exp(-distance / scale_km), 0.0)
+
+
+def date_factor(features: Dict[str, Any], wanted: np.ndarray) -> np.ndarray:
+    """1 when a camp has a session in any wanted week"""
+    return np.minimum(wanted @ features["week_matrix"].T, 1.0)
+
+
+def _rows_by_key(values: List[str]) -> Dict[str, np.ndarray]:
+    """Lowercased value -> row indices"""
+    rows = {}
+    for row, value in enumerate(values):
+        rows.setdefault(value.lower(), []).append(row)
+    return {key: np.array(indices, dtype=np.int64) for key, indices in rows.items()}
+
+
+class RecommendationEngine:
+    """
+    Ranks the catalog for a learner profile
+    Factors: grade fit, budget fit, activity overlap, distance and date overlap
+    Each factor scores 0-1; the total is the weighted mean over factors the profile specifies
+    """
+
+    def __init__(self, csv_handler, weights: Optional[Dict[str, float]] = None, distance_scale_km: float = 15.0,
+                 gazetteer_path: Optional[str] = None):
+        """gazetteer_path: zipcode table (.sql or .csv) for placing location preferences"""
+        self.csv_handler = csv_handler
+        self.weights = {**DEFAULT_WEIGHTS, **(weights or {})}
+        self.distance_scale_km = distance_scale_km
+        self.gazetteer_path = gazetteer_path
+
+    def features(self) -> Dict[str, Any]:
+        return feature_arrays(self.csv_handler)
+
+    def gazetteer(self) -> Gazetteer:
+        return self.csv_handler.get_derived("gazetteer", lambda frame: build_gazetteer(frame, self.gazetteer_path))
+
+    def resolve_location(self, location: str) -> Optional[Tuple[float, float]]:
+        """Place a free-text location (city, zip, misspelling) using the offline gazetteer"""
+        place = self.gazetteer().resolve(location)
+        return (place["latitude"], place["longitude"]) if place else None
+
+    def build_profile(self, state: Dict[str, Any], overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """
+        Turn StateManager-style fields into numeric scoring targets
+        overrides (see PROFILE_OVERRIDES) may set grade, max_price, categories or latitude/longitude directly,
+        or replace state fields such as budget_range or available_dates
+        """
+        features = self.features()
+        state = {**(state or {}), **(overrides or {})}
+        profile = {}
+
+        grade = state.get("grade")
+        if grade is None and state.get("grade_level"):
+            grade = parse_grade(f"{state['grade_level']} grade")
+        if grade is None and isinstance(state.get("child_age"), (int, float)):
+            grade = age_to_grade(int(state["child_age"]))
+        if grade is not None:
+            profile["grade"] = int(grade)
+
+        max_price = state.get("max_price")
+        if max_price is None and state.get("budget_range"):
+            max_price = parse_price_range(str(state["budget_range"]))[1]
+        if max_price is not None:
+            profile["max_price"] = float(max_price)
+
+        categories = state.get("categories")
+        if categories is None and state.get("preferred_activities"):
+            categories = features["category_lexicon"].find_all(", ".join(map(str, state["preferred_activities"])))
+        if categories:
+            profile["categories"] = [c for c in categories if c in features["categories"]]
+
+        if state.get("latitude") is not None and state.get("longitude") is not None:
+            profile["location"] = (float(state["latitude"]), float(state["longitude"]))
+        elif state.get("location_preference"):
+            location = self.resolve_location(str(state["location_preference"]))
+            if location:
+                profile["location"] = location
+                profile["location_name"] = state["location_preference"]
+
+        available = (state.get("scheduling") or {}).get("available_dates") or state.get("available_dates") or []
+        weeks = set()
+        for mention in available:
+            for start, end in parse_date_mentions(str(mention), features["default_year"]):
+                weeks.update(weeks_in_range(start, end))
+        if weeks:
+            profile["weeks"] = sorted(weeks)
+
+        ruled_out = (state.get("session_context") or {}).get("camps_ruled_out") or []
+        if ruled_out:
+            profile["exclude"] = [str(name) for name in ruled_out]
+        return profile
+
+    def score(self, profile: Dict[str, Any], weights: Optional[Dict[str, float]] = None) -> Tuple[np.ndarray, Dict[str, np.ndarray]]:
+        """
+        Score every camp in one vectorized pass
+        Returns: (total scores, per-factor score arrays for the factors in use)
+        """
+        features = self.features()
+        weights = {**self.weights, **(weights or {})}
+        factors = {}
+
+        if "grade" in profile:
+            factors["grade"] = grade_factor(features, profile["grade"])
+        if "max_price" in profile:
+            factors["budget"] = budget_factor(features, profile["max_price"])
+        if profile.get("categories"):
+            factors["activities"] = activity_factor(features, self._wanted(features, [profile["categories"]])[0])
+        if "location" in profile:
+            factors["distance"] = distance_factor(features, profile["location"], self.distance_scale_km)
+        if profile.get("weeks"):
+            factors["dates"] = date_factor(features, self._wanted_weeks(features, [profile["weeks"]])[0])
+
+        total_weight = sum(weights[name] for name in factors)
+        if total_weight > 0:
+            total = sum(weights[name] * values for name, values in factors.items()) / total_weight
+        else:
+            total = np.zeros(features["count"], dtype=np.float32)
+
+        total = np.asarray(total, dtype=np.float32)
+        self._exclude(features, total, profile)
+        return total, factors
+
+    def score_batch(self, profiles: List[Dict[str, Any]], weights: Optional[Dict[str, float]] = None) -> np.ndarray:
+        """
+        Total scores for many profiles at once, shape (profiles, camps)
+        Same factors and weighting as score(), evaluated as matrix operations over the whole batch
+        """
+        features = self.features()
+        weights = {**self.weights, **(weights or {})}
+        weighted = np.zeros((len(profiles), features["count"]), dtype=np.float32)
+        total_weight = np.zeros((len(profiles), 1), dtype=np.float32)
+
+        def add(name: str, selected: List[int], values: np.ndarray) -> None:
+            rows = slice(None) if len(selected) == len(profiles) else selected
+            weighted[rows] += weights[name] * values
+            total_weight[rows] += weights[name]
+
+        def column(selected: List[int], key: str) -> np.ndarray:
+            return np.array([profiles[i][key] for i in selected], dtype=np.float32)[:, None]
+
+        selected = [i for i, profile in enumerate(profiles) if "grade" in profile]
+        if selected:
+            add("grade", selected, grade_factor(features, column(selected, "grade")))
+        selected = [i for i, profile in enumerate(profiles) if "max_price" in profile]
+        if selected:
+            add("budget", selected, budget_factor(features, column(selected, "max_price")))
+        selected = [i for i, profile in enumerate(profiles) if profile.get("categories")]
+        if selected:
+            wanted = self._wanted(features, [profiles[i]["categories"] for i in selected])
+            add("activities", selected, activity_factor(features, wanted))
+        selected = [i for i, profile in enumerate(profiles) if "location" in profile]
+        if selected:
+            location = np.array([profiles[i]["location"] for i in selected], dtype=np.float64)
+            add("distance", selected, distance_factor(features, (location[:, :1], location[:, 1:]), self.distance_scale_km))
+        selected = [i for i, profile in enumerate(profiles) if profile.get("weeks")]
+        if selected:
+            add("dates", selected, date_factor(features, self._wanted_weeks(features, [profiles[i]["weeks"] for i in selected])))
+
+        total = weighted / np.maximum(total_weight, 1e-9)
+        for row, profile in enumerate(profiles):
+            self._exclude(features, total[row], profile)
+        return total
+
+    def rank(self, total: np.ndarray, k: int) -> np.ndarray:
+        """
+        Rows of the top-k camps by score, cheaper first among (near-)ties
+        total may be one profile's scores or a (profiles, camps) batch; excluded camps are not filtered here
+        """
+        features = self.features()
+        key = np.round(total.astype(np.float64), 4) * 1e9 - features["price"]
+        k = max(0, min(k, features["count"]))
+        if k == 0:
+            return np.zeros(key.shape[:-1] + (0,), dtype=np.int64)
+        top = np.argpartition(-key, k - 1, axis=-1)[..., :k] if k < features["count"] \
+            else np.broadcast_to(np.arange(features["count"]), key.shape).copy()
+        order = np.argsort(-np.take_along_axis(key, top, axis=-1), axis=-1, kind="stable")
+        return np.take_along_axis(top, order, axis=-1)
+
+    @staticmethod
+    def _wanted(features: Dict[str, Any], category_lists: List[List[str]]) -> np.ndarray:
+        wanted = np.zeros((len(category_lists), len(features["categories"])), dtype=np.float32)
+        for row, categories in enumerate(category_lists):
+            for category in categories:
+                wanted[row, features["categories"].index(category)] = 1.0
+        return wanted
+
+    @staticmethod
+    def _wanted_weeks(features: Dict[str, Any], week_lists: List[List[Tuple[int, int]]]) -> np.ndarray:
+        wanted = np.zeros((len(week_lists), len(features["weeks"])), dtype=np.float32)
+        for row, weeks in enumerate(week_lists):
+            columns = [features["week_column"][week] for week in weeks if week in features["week_column"]]
+            wanted[row, columns] = 1.0
+        return wanted
+
+    @staticmethod
+    def _exclude(features: Dict[str, Any], total: np.ndarray, profile: Dict[str, Any]) -> None:
+        """Mark ruled-out camps (and their other listings) with -1"""
+        for name in profile.get("exclude", []):
+            rows = features["rows_by_name"].get(name.lower())
+            if rows is not None:
+                total[rows] = -1.0
+
+    def recommend(self, state: Dict[str, Any], k: int = 5,
+                  weights: Optional[Dict[str, float]] = None,
+                  overrides: Optional[Dict[str, Any]] = None) -> Dict[str, Any]:
+        """Top-K camps for a profile with per-factor explanations"""
+        start = time.perf_counter()
+        features = self.features()
+        profile = self.build_profile(state, overrides)
+        total, factors = self.score(profile, weights)
+
+        top = [int(row) for row in self.rank(total, k) if total[row] >= 0]
+
+        return {
+            "recommendations": [self._explain(row, total, factors, profile) for row in top],
+            "profile": {key: value for key, value in profile.items() if key != "exclude"},
+            "weights": {name: {**self.weights, **(weights or {})}[name] for name in FACTORS},
+            "factors_used": list(factors),
+            "elapsed_ms": round((time.perf_counter() - start) * 1000, 3)
+        }
+
+    def _explain(self, row: int, total: np.ndarray, factors: Dict[str, np.ndarray],
+                 profile: Dict[str, Any]) -> Dict[str, Any]:
+        """Per-factor scores and a short reason for one camp"""
+        features = self.features()
+        low, high = int(features["min_grade"][row]), int(features["max_grade"][row])
+        price = float(features["price"][row])
+        explanation = {}
+
+        if "grade" in factors:
+            fits = low <= profile["grade"] <= high
+            explanation["grade"] = {
+                "score": round(float(factors["grade"][row]), 3),
+                "detail": f"grades {'K' if low == 0 else low}-{high} "
+                          f"{'include' if fits else 'do not include'} {grade_label(profile['grade'])}"
+            }
+        if "budget" in factors:
+            explanation["budget"] = {
+                "score": round(float(factors["budget"][row]), 3),
+                "detail": f"${price:.0f} vs budget ${profile['max_price']:.0f}"
+            }
+        if "activities" in factors:
+            matched = [c for c in profile["categories"]
+                       if features["category_matrix"][row, features["categories"].index(c)]]
+            explanation["activities"] = {
+                "score": round(float(factors["activities"][row]), 3),
+                "detail": f"matches {', '.join(matched)}" if matched else "no matching activities"
+            }
+        if "distance" in factors:
+            if features["has_location"][row]:
+                distance = float(distances_km(features, profile["location"], [row])[0])
+                detail = f"{distance:.1f} km from {profile.get('location_name', 'your location')}"
+            else:
+                detail = "location unknown"
+            explanation["distance"] = {"score": round(float(factors["distance"][row]), 3), "detail": detail}
+        if "dates" in factors:
+            covered = [features["weeks"][column] for column in np.flatnonzero(features["week_matrix"][row])]
+            fitting = len([week for week in covered if week in set(profile["weeks"])])
+            explanation["dates"] = {
+                "score": round(float(factors["dates"][row]), 3),
+                "detail": f"{fitting} of {len(covered)} session weeks fall in your available dates"
+            }
+
+        return {
+            "camp_id": features["camp_ids"][row],
+            "camp_name": features["names"][row],
+            "organization_name": features["organizations"][row],
+            "city": features["cities"][row],
+            "price": price,
+            "grades": f"{'K' if low == 0 else low}-{high}",
+            "score": round(float(total[row]), 4),
+            "factors": explanation
+        }
@@ -0,0 +1,75 @@
+"""
+Compact LLM response format for the camp chatbot
+Short keys, optional fields left out, and state changes as a list of add/set/remove operations,
+enforced through Gemini's structured output (response_schema) so nothing has to be echoed back
+"""
+from typing import Dict, Any
+
+from state_manager import STATE_FIELDS, STATE_OPERATIONS
+
+# OpenAPI-subset schema accepted by GenerationConfig(response_schema=...)
+RESPONSE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "r": {"type": "string"},
+        "ids": {"type": "array", "items": {"type": "string"}},
+        "hl": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {"id": {"type": "string"}, "t": {"type": "string"}},
+                "required": ["id", "t"]
+            }
+        },
+        "em": {
+            "type": "object",
+            "properties": {"to": {"type": "string"}, "subj": {"type": "string"}, "body": {"type": "string"}},
+            "required": ["subj", "body"]
+        },
+        "ops": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "op": {"type": "string", "enum": list(STATE_OPERATIONS)},
+                    "f": {"type": "string", "enum": list(STATE_FIELDS)},
+                    "v": {"type": "string"}
+                },
+                "required": ["op", "f"]
+            }
+        }
+    },
+    "required": ["r"]
+}
+
+
+def is_compact(parsed: Dict[str, Any]) -> bool:
+    return "r" in parsed and "conversational_response" not in parsed
+
+
+def expand_response(parsed: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    Map a compact response onto the long field names LLMHandler assembles replies from
+    Legacy (long-key) responses pass through unchanged
+    """
+    if not is_compact(parsed):
+        return parsed
+
+    highlights = {}
+    for entry in parsed.get("hl") or []:
+        if isinstance(entry, dict) and entry.get("id") and entry.get("t"):
+            highlights[str(entry["id"])] = entry["t"]
+
+    email = parsed.get("em")
+    if isinstance(email, dict):
+        email = {"to": email.get("to") or "", "subject": email.get("subj") or "", "body": email.get("body") or ""}
+
+    operations = parsed.get("ops")
+    return {
+        "conversational_response": parsed.get("r") or "",
+        "camp_ids": parsed.get("ids") or [],
+        "card_highlights": highlights,
+        "email_draft": email,
+        "state_operations": operations if isinstance(operations, list) else []
+    }
+
@@ -0,0 +1,108 @@
+"""
+Background conversation-round writer for the camp chatbot
+One daemon thread takes logged rounds off the request path: it runs token estimation,
+feeds each session's rolling aggregates and appends full records to rotating JSON-lines files
+"""
+import json
+import os
+import queue
+import threading
+from typing import Dict, Any, Callable, Optional
+
+_writers = {}
+_writers_lock = threading.Lock()
+
+
+class RoundWriter:
+    """
+    Bounded work queue drained by a single daemon thread
+    submit never blocks a request: when the queue is full it refuses the work (counted as queue_full)
+    and the caller runs it itself (ConversationLogger then processes the round inline, without a file record)
+    path: JSONL file to append records to (rotated at max_bytes, keeping backup_count old files); None = no file
+    """
+
+    def __init__(self, path: Optional[str] = None, max_bytes: int = 50 * 1024 * 1024,
+                 backup_count: int = 5, max_queue: int = 1000):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.backup_count = backup_count
+        self._queue = queue.Queue(maxsize=max_queue)
+        self._file = None
+        self._stats_lock = threading.Lock()  # stats are updated by request threads and the writer thread
+        self.stats = {"submitted": 0, "processed": 0, "queue_full": 0, "written": 0, "rotations": 0, "errors": 0}
+        self._thread = threading.Thread(target=self._run, name="round-writer", daemon=True)
+        self._thread.start()
+
+    def submit(self, process: Callable[[], Optional[Dict[str, Any]]]) -> bool:
+        """
+        Queue work for the writer thread; `process` returns the record to write (or None)
+        Returns False, without queueing it, if the queue is full
+        """
+        try:
+            self._queue.put_nowait(process)
+        except queue.Full:
+            self._count("queue_full")
+            return False
+        self._count("submitted")
+        return True
+
+    def flush(self) -> None:
+        """Block until everything queued so far is processed and written"""
+        self._queue.join()
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self.stats)
+        return {**stats, "queued": self._queue.qsize(), "path": self.path}
+
+    def _count(self, key: str) -> None:
+        with self._stats_lock:
+            self.stats[key] += 1
+
+    def _run(self) -> None:
+        while True:
+            process = self._queue.get()
+            try:
+                record = process()
+                self._count("processed")
+                if record is not None and self.path:
+                    self._write(json.dumps(record, default=str) + "\n")
+            except Exception as e:
+                self._count("errors")
+                print(f"Conversation log writer error: {e}")
+            finally:
+                self._queue.task_done()
+
+    def _write(self, line: str) -> None:
+        if self._file is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            self._file = open(self.path, "a", encoding="utf-8")
+        if self.max_bytes and self._file.tell() + len(line) > self.max_bytes and self._file.tell() > 0:
+            self._rotate()
+        self._file.write(line)
+        self._count("written")
+        if self._queue.empty():
+            self._file.flush()
+
+    def _rotate(self) -> None:
+        """conversations.jsonl -> .1 -> .2 ... (oldest beyond backup_count is deleted)"""
+        self._file.close()
+        for index in range(self.backup_count - 1, 0, -1):
+            source = f"{self.path}.{index}"
+            if os.path.exists(source):
+                os.replace(source, f"{self.path}.{index + 1}")
+        if self.backup_count > 0:
+            os.replace(self.path, f"{self.path}.1")
+        else:
+            os.remove(self.path)
+        self._file = open(self.path, "a", encoding="utf-8")
+        self._count("rotations")
+
+
+def shared_round_writer(path: Optional[str] = None, max_bytes: int = 50 * 1024 * 1024,
+                        backup_count: int = 5, max_queue: int = 1000) -> RoundWriter:
+    """Process-wide writer for a path, so every session's logger shares one thread and file"""
+    with _writers_lock:
+        if path not in _writers:
+            _writers[path] = RoundWriter(path, max_bytes=max_bytes, backup_count=backup_count, max_queue=max_queue)
+        return _writers[path]
@@ -0,0 +1,197 @@
+"""
+"More like this" similar-camp engine for the camp chatbot
+Cosine similarity over a hashed n-gram TF-IDF matrix built once per catalog version, fully local
+"""
+import re
+import time
+import zlib
+from typing import Dict, Any, List, Optional
+
+import numpy as np
+import pandas as pd
+
+from recommender import feature_arrays, distances_km
+from slot_extraction import split_categories
+
+HASH_DIMENSIONS = 1 << 18
+NAME_WEIGHT = 2  # Title words count twice as much as description words
+
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+_STOPWORDS = {
+    'a', 'an', 'and', 'are', 'as', 'at', 'be', 'by', 'for', 'from', 'has', 'have', 'in', 'into', 'is', 'it',
+    'its', 'of', 'on', 'or', 'our', 'that', 'the', 'their', 'this', 'to', 'will', 'with', 'you', 'your',
+    'camp', 'camps', 'campers', 'summer', 'day', 'week', 'ages', 'new', '2025'
+}
+
+
+def _terms(text: str) -> List[str]:
+    """Unigrams and bigrams of non-stopword tokens"""
+    words = [word for word in _TOKEN_PATTERN.findall(text.lower()) if word not in _STOPWORDS]
+    return words + [f"{first} {second}" for first, second in zip(words, words[1:])]
+
+
+def _feature(term: str) -> int:
+    return zlib.crc32(term.encode('utf-8')) % HASH_DIMENSIONS
+
+
+def build_similarity_index(frame: pd.DataFrame) -> Dict[str, Any]:
+    """
+    Sparse L2-normalised TF-IDF rows (CSR) plus the same matrix by column (CSC) for fast queries
+    Built once per catalog version via CSVHandler.get_derived
+    """
+    count = len(frame) if frame is not None else 0
+
+    def column(name: str) -> List[str]:
+        if frame is None or name not in frame.columns:
+            return [""] * count
+        return frame[name].astype(str).tolist()
+
+    has_ids = frame is not None and 'camp_id' in frame.columns
+    camp_ids = column('camp_id') if has_ids else [str(row) for row in range(count)]
+
+    rows, features, counts = [], [], []
+    for row, (name, description, categories) in enumerate(
+            zip(column('camp_name'), column('description'), column('categories'))):
+        term_counts = {}
+        for term in _terms(name) * NAME_WEIGHT + _terms(description):
+            feature = _feature(term)
+            term_counts[feature] = term_counts.get(feature, 0) + 1
+        for category in split_categories(categories):
+            feature = _feature(f"category:{category.lower()}")
+            term_counts[feature] = term_counts.get(feature, 0) + 1
+        rows.extend([row] * len(term_counts))
+        features.extend(term_counts.keys())
+        counts.extend(term_counts.values())
+
+    rows = np.array(rows, dtype=np.int32)
+    features = np.array(features, dtype=np.int32)
+    tf = 1.0 + np.log(np.array(counts, dtype=np.float32))
+
+    # Smoothed idf, then L2-normalise each row
+    document_frequency = np.bincount(features, minlength=HASH_DIMENSIONS)
+    idf = np.log((1.0 + count) / (1.0 + document_frequency)).astype(np.float32) + 1.0
+    weights = tf * idf[features]
+    norms = np.sqrt(np.bincount(rows, weights=weights ** 2, minlength=count)).astype(np.float32)
+    weights = weights / np.maximum(norms[rows], 1e-12)
+
+    # CSR (by camp) — entries are already grouped by row in insertion order
+    row_pointer = np.concatenate(([0], np.cumsum(np.bincount(rows, minlength=count)))).astype(np.int64)
+
+    # CSC (by feature) for scoring one camp against all others
+    order = np.argsort(features, kind="stable")
+    column_rows = rows[order]
+    column_weights = weights[order]
+    used_features, first_index, feature_counts = np.unique(features[order], return_index=True, return_counts=True)
+
+    return {
+        "count": count,
+        "row_pointer": row_pointer,
+        "row_features": features,
+        "row_weights": weights,
+        "column_rows": column_rows,
+        "column_weights": column_weights,
+        "column_start": dict(zip(used_features.tolist(), first_index.tolist())),
+        "column_count": dict(zip(used_features.tolist(), feature_counts.tolist())),
+        "rows_by_id": {camp_id: row for row, camp_id in enumerate(camp_ids)},
+        "neighbor_cache": {}
+    }
+
+
+class SimilarCampEngine:
+    """
+    Finds camps similar to a given camp by cosine similarity of their TF-IDF rows
+    Unfiltered neighbor lists are cached per camp until the catalog is reloaded
+    """
+
+    def __init__(self, csv_handler, cache_k: int = 20):
+        self.csv_handler = csv_handler
+        self.cache_k = cache_k
+
+    def index(self) -> Dict[str, Any]:
+        return self.csv_handler.get_derived("similarity", build_similarity_index)
+
+    def similarities(self, row: int) -> np.ndarray:
+        """Cosine similarity of one camp against every camp"""
+        index = self.index()
+        start, end = index["row_pointer"][row], index["row_pointer"][row + 1]
+        postings_rows, postings_weights = [], []
+        for feature, weight in zip(index["row_features"][start:end], index["row_weights"][start:end]):
+            first = index["column_start"][int(feature)]
+            last = first + index["column_count"][int(feature)]
+            postings_rows.append(index["column_rows"][first:last])
+            postings_weights.append(index["column_weights"][first:last] * weight)
+        if not postings_rows:
+            return np.zeros(index["count"], dtype=np.float32)
+        return np.bincount(
+            np.concatenate(postings_rows), weights=np.concatenate(postings_weights), minlength=index["count"]
+        ).astype(np.float32)
+
+    def similar(self, camp_id: str, k: int = 5,
+                grade: Optional[int] = None,
+                max_price: Optional[float] = None,
+                max_distance_km: Optional[float] = None,
+                origin: Optional[tuple] = None) -> Optional[Dict[str, Any]]:
+        """
+        Top-K camps most like `camp_id`, optionally restricted by grade, price and distance
+        Distance is measured from `origin` (lat, lon) or, if omitted, from the camp itself
+        Returns None when the camp id is unknown
+        """
+        start_time = time.perf_counter()
+        index = self.index()
+        row = index["rows_by_id"].get(str(camp_id))
+        if row is None:
+            return None
+        features = feature_arrays(self.csv_handler)
+        filtered = grade is not None or max_price is not None or max_distance_km is not None
+
+        cache = index["neighbor_cache"]
+        if not filtered and k <= self.cache_k and row in cache:
+            neighbors = cache[row][:k]
+        else:
+            scores = self.similarities(row)
+            # The camp itself and its other listings (same name) are not "similar camps"
+            same_name = features["rows_by_name"].get(features["names"][row].lower())
+            scores[same_name if same_name is not None else row] = -1.0
+
+            mask = scores > 0
+            if grade is not None:
+                mask &= (features["min_grade"] <= grade) & (features["max_grade"] >= grade)
+            if max_price is not None:
+                mask &= features["price"] <= max_price
+            if max_distance_km is not None:
+                origin = origin or (float(np.degrees(features["lat_rad"][row])),
+                                    float(np.degrees(features["lon_rad"][row])))
+                mask &= features["has_location"] & (distances_km(features, origin) <= max_distance_km)
+
+            candidates = np.flatnonzero(mask)
+            limit = k if filtered else max(k, self.cache_k)
+            if len(candidates) > limit:
+                candidates = candidates[np.argpartition(-scores[candidates], limit - 1)[:limit]]
+            candidates = candidates[np.argsort(-scores[candidates], kind="stable")]
+            neighbors = [(int(candidate), float(scores[candidate])) for candidate in candidates]
+            if not filtered:
+                cache[row] = neighbors
+            neighbors = neighbors[:k]
+
+        source_categories = set(np.flatnonzero(features["category_matrix"][row]))
+        return {
+            "camp": {"camp_id": features["camp_ids"][row], "camp_name": features["names"][row]},
+            "similar": [self._describe(features, neighbor, score, source_categories) for neighbor, score in neighbors],
+            "elapsed_ms": round((time.perf_counter() - start_time) * 1000, 3)
+        }
+
+    @staticmethod
+    def _describe(features: Dict[str, Any], row: int, score: float, source_categories: set) -> Dict[str, Any]:
+        low, high = int(features["min_grade"][row]), int(features["max_grade"][row])
+        shared = [features["categories"][column] for column in np.flatnonzero(features["category_matrix"][row])
+                  if column in source_categories]
+        return {
+            "camp_id": features["camp_ids"][row],
+            "camp_name": features["names"][row],
+            "organization_name": features["organizations"][row],
+            "city": features["cities"][row],
+            "price": float(features["price"][row]),
+            "grades": f"{'K' if low == 0 else low}-{high}",
+            "similarity": round(score, 4),
+            "shared_categories": shared
+        }
@@ -0,0 +1,98 @@
+"""
+Single-flight request coalescing for the camp chatbot API
+Duplicate requests (same session + idempotency key) attach to the one already running
+instead of starting a second LLM call, and recent results are replayed for a short window
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Any, Callable, Hashable, Optional, Tuple
+
+
+class StillInFlight(TimeoutError):
+    """A duplicate gave up waiting for the identical request it attached to"""
+
+
+class SingleFlight:
+    """
+    Runs fn once per key at a time
+    The first caller (the leader) executes; callers arriving while it runs wait for its result.
+    Successful results stay replayable for `replay_seconds`; failures are shared with waiting
+    callers but never replayed, so a retry after an error runs again
+    """
+
+    def __init__(self, replay_seconds: float = 30.0, max_entries: int = 10000):
+        self.replay_seconds = replay_seconds
+        self.max_entries = max_entries
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # key -> {"done", "result", "error", "finished_at", "replayable"}
+        self.stats = {"executed": 0, "coalesced": 0, "replayed": 0, "wait_timeouts": 0}
+
+    def run(self, key: Hashable, fn: Callable[[], Any], timeout: Optional[float] = None,
+            replay: bool = True) -> Tuple[Any, bool]:
+        """
+        Result of fn for this key, computed at most once while in flight
+        replay: keep the result for later duplicates (only meaningful with a client-chosen key)
+        Returns: (result, shared) where shared is True when another request's result was reused
+        Raises fn's exception, or StillInFlight if a duplicate waits longer than `timeout`
+        """
+        with self._lock:
+            self._expire(time.monotonic())
+            entry = self._entries.get(key)
+            leader = entry is None
+            if leader:
+                entry = {"done": threading.Event(), "result": None, "error": None,
+                         "finished_at": None, "replayable": replay}
+                self._entries[key] = entry
+                self.stats["executed"] += 1
+            elif entry["done"].is_set():
+                self.stats["replayed"] += 1
+            else:
+                self.stats["coalesced"] += 1
+
+        if leader:
+            return self._lead(key, entry, fn), False
+
+        if not entry["done"].wait(timeout):
+            with self._lock:
+                self.stats["wait_timeouts"] += 1
+            raise StillInFlight("An identical request is still being processed")
+        if entry["error"] is not None:
+            raise entry["error"]
+        return entry["result"], True
+
+    def get_stats(self) -> Dict[str, Any]:
+        with self._lock:
+            in_flight = sum(1 for entry in self._entries.values() if not entry["done"].is_set())
+            return {**self.stats, "in_flight": in_flight, "replayable": len(self._entries) - in_flight}
+
+    def _lead(self, key: Hashable, entry: Dict[str, Any], fn: Callable[[], Any]) -> Any:
+        try:
+            entry["result"] = fn()
+            return entry["result"]
+        except BaseException as e:
+            entry["error"] = e
+            raise
+        finally:
+            with self._lock:
+                entry["finished_at"] = time.monotonic()
+                if entry["error"] is not None or not entry["replayable"]:
+                    self._entries.pop(key, None)
+                else:
+                    self._entries.move_to_end(key)
+                    while len(self._entries) > self.max_entries:
+                        oldest = next(iter(self._entries))
+                        if not self._entries[oldest]["done"].is_set():
+                            break
+                        del self._entries[oldest]
+            entry["done"].set()
+
+    def _expire(self, now: float) -> None:
+        """Drop finished entries past the replay window (caller holds the lock)"""
+        for key in list(self._entries):
+            entry = self._entries[key]
+            if entry["finished_at"] is None:
+                continue
+            if now - entry["finished_at"] <= self.replay_seconds:
+                break
+            del self._entries[key]
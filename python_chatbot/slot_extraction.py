@@ -0,0 +1,310 @@
+"""
+Slot extraction helpers for the camp chatbot
+Pulls grade, age, price, category and location mentions out of free text without the LLM
+"""
+import re
+from datetime import date, timedelta
+from typing import Dict, Any, List, Optional, Tuple, Iterable
+
+ORDINAL_WORDS = {
+    'first': 1, 'second': 2, 'third': 3, 'fourth': 4, 'fifth': 5, 'sixth': 6,
+    'seventh': 7, 'eighth': 8, 'ninth': 9, 'tenth': 10, 'eleventh': 11, 'twelfth': 12
+}
+
+# Everyday words parents use, mapped onto the catalog's category names
+CATEGORY_SYNONYMS = {
+    'Science & Engineering': ['stem', 'steam', 'science', 'engineering', 'robot', 'robots', 'robotics',
+                              'coding', 'code', 'programming', 'tech', 'technology', 'lego', 'vex'],
+    'Arts & Digital Media': ['art', 'arts', 'painting', 'drawing', 'craft', 'crafts', 'creative',
+                             'watercolor', 'digital media', 'video production', 'youtube'],
+    'Gaming': ['gaming', 'game', 'games', 'video game', 'video games', 'minecraft', 'roblox'],
+    'Sports & Fitness': ['sport', 'sports', 'swim', 'swimming', 'tennis', 'ninja', 'fitness',
+                         'athletic', 'athletics', 'soccer', 'basketball'],
+    'Outdoors & Adventure': ['outdoor', 'outdoors', 'nature', 'adventure', 'hiking', 'zoo', 'animals'],
+    'Performance & Performing Arts': ['dance', 'dancing', 'drama', 'theater', 'theatre', 'music',
+                                      'acting', 'performing'],
+    'Writing & Storytelling': ['writing', 'storytelling', 'stories', 'reading'],
+    'History & Culture': ['history', 'culture'],
+    'Problem Solving & Logic': ['logic', 'puzzles', 'problem solving', 'math', 'chess'],
+    'Life Skills & Hobbies': ['life skills', 'cooking', 'hobbies', 'entrepreneur', 'business']
+}
+
+_GRADE_PATTERNS = [
+    re.compile(r'\b(\d{1,2})(?:st|nd|rd|th)?[\s-]+grade(?:rs?)?\b', re.IGNORECASE),
+    re.compile(r'\bgrade\s+(\d{1,2})\b', re.IGNORECASE),
+    re.compile(r'\b(' + '|'.join(ORDINAL_WORDS) + r')[\s-]+grade(?:rs?)?\b', re.IGNORECASE)
+]
+_KINDERGARTEN_PATTERN = re.compile(r'\bkinder(?:garten(?:er)?)?\b', re.IGNORECASE)
+_AGE_PATTERNS = [
+    re.compile(r'\b(\d{1,2})[\s-]*(?:years?|yrs?)[\s-]*old\b', re.IGNORECASE),
+    re.compile(r'\b(\d{1,2})[\s-]*yo\b', re.IGNORECASE),
+    re.compile(r'\bage[sd]?\s+(\d{1,2})\b', re.IGNORECASE)
+]
+
+# Amounts followed by a unit ('under 10 years old', 'within 5 miles') are not prices
+_AMOUNT = r'\$?\s*(\d[\d,]*)(?!\d|\s*(?:years?|yrs?|yo|weeks?|days?|miles?|mi|minutes?|min)\b)'
+_PRICE_RANGE_PATTERN = re.compile(
+    r'(?:between\s+)?\$\s*(\d[\d,]*)\s*(?:-|–|to|and)\s*\$?\s*(\d[\d,]*)', re.IGNORECASE
+)
+_PRICE_MAX_PATTERN = re.compile(
+    r'\b(?:under|below|less than|up to|at most|max(?:imum)?(?: of)?|no more than|cheaper than|within)\s+' + _AMOUNT,
+    re.IGNORECASE
+)
+_PRICE_MIN_PATTERN = re.compile(
+    r'\b(?:over|above|more than|at least|min(?:imum)?(?: of)?)\s+' + _AMOUNT, re.IGNORECASE
+)
+_BUDGET_PATTERN = re.compile(r'\bbudget(?:\s+(?:is|of|around|about))?\s*(?::\s*)?' + _AMOUNT, re.IGNORECASE)
+_DOLLAR_PATTERN = re.compile(r'\$\s*(\d[\d,]*)')
+_ZIP_PATTERN = re.compile(r'\b(7[5-9]\d{3})\b')
+_STATE_ZIP_PATTERN = re.compile(r'^[A-Z]{2}(?:\s+\d{5})?$')
+
+
+def _to_int(value: str) -> int:
+    return int(value.replace(',', ''))
+
+
+def parse_grade(text: str) -> Optional[int]:
+    """Find an explicit grade mention (0 = kindergarten)"""
+    if not text:
+        return None
+    for pattern in _GRADE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            value = match.group(1).lower()
+            grade = ORDINAL_WORDS[value] if value in ORDINAL_WORDS else int(value)
+            if 0 <= grade <= 12:
+                return grade
+    if _KINDERGARTEN_PATTERN.search(text):
+        return 0
+    return None
+
+
+def parse_age(text: str) -> Optional[int]:
+    """Find a child age mention such as '8-year-old' or 'age 8'"""
+    if not text:
+        return None
+    for pattern in _AGE_PATTERNS:
+        match = pattern.search(text)
+        if match:
+            age = int(match.group(1))
+            if 3 <= age <= 18:
+                return age
+    return None
+
+
+def age_to_grade(age: int) -> int:
+    """Approximate US grade for an age (6-year-olds are typically in 1st grade)"""
+    return min(max(age - 5, 0), 12)
+
+
+def grade_label(grade: int) -> str:
+    """Human label for a grade number, matching how grade_level is stored in state"""
+    if grade == 0:
+        return "Kindergarten"
+    suffix = 'th' if 10 <= grade % 100 <= 20 else {1: 'st', 2: 'nd', 3: 'rd'}.get(grade % 10, 'th')
+    return f"{grade}{suffix}"
+
+
+def parse_price_range(text: str) -> Tuple[Optional[int], Optional[int]]:
+    """
+    Find a price/budget constraint
+    Returns: (min_price, max_price), either of which may be None
+    """
+    if not text:
+        return None, None
+
+    match = _PRICE_RANGE_PATTERN.search(text)
+    if match:
+        low, high = sorted((_to_int(match.group(1)), _to_int(match.group(2))))
+        return low, high
+
+    min_price = max_price = None
+    match = _PRICE_MAX_PATTERN.search(text)
+    if match:
+        max_price = _to_int(match.group(1))
+    match = _PRICE_MIN_PATTERN.search(text)
+    if match:
+        min_price = _to_int(match.group(1))
+    if min_price is None and max_price is None:
+        match = _BUDGET_PATTERN.search(text) or _DOLLAR_PATTERN.search(text)
+        if match:
+            max_price = _to_int(match.group(1))
+    return min_price, max_price
+
+
+def format_price_range(min_price: Optional[int], max_price: Optional[int]) -> str:
+    """Format a price range the way budget_range is stored in state"""
+    if min_price is not None and max_price is not None:
+        return f"${min_price}-${max_price}"
+    if max_price is not None:
+        return f"under ${max_price}"
+    if min_price is not None:
+        return f"over ${min_price}"
+    return ""
+
+
+def split_categories(value: Any) -> List[str]:
+    """Split a catalog `categories` cell into clean category names"""
+    if not value or not isinstance(value, str):
+        return []
+    return [part.strip() for part in value.split(',') if part.strip()]
+
+
+def city_from_address(address: Any) -> str:
+    """Extract the city from a formatted address such as '2601 Prairie Dr, Prosper, TX 75078, USA'"""
+    if not address or not isinstance(address, str):
+        return ""
+    parts = [part.strip() for part in address.split(',')]
+    for index, part in enumerate(parts):
+        if index > 0 and _STATE_ZIP_PATTERN.match(part):
+            return parts[index - 1]
+    return ""
+
+
+def zip_from_address(address: Any) -> str:
+    """Extract a 5-digit zip code from a formatted address"""
+    if not address or not isinstance(address, str):
+        return ""
+    match = re.search(r'\b(\d{5})\b', address)
+    return match.group(1) if match else ""
+
+
+def find_zip(text: str) -> Optional[str]:
+    """Find a North Texas style zip code mention"""
+    match = _ZIP_PATTERN.search(text or "")
+    return match.group(1) if match else None
+
+
+class PhraseLexicon:
+    """
+    Maps phrases found in free text onto canonical values with one compiled regex
+    Longer phrases win over shorter ones ('video game' before 'game')
+    """
+
+    def __init__(self, phrases: Dict[str, str]):
+        self.phrases = {phrase.lower(): value for phrase, value in phrases.items() if phrase}
+        ordered = sorted(self.phrases, key=len, reverse=True)
+        self.pattern = re.compile(
+            r'\b(' + '|'.join(re.escape(phrase) for phrase in ordered) + r')\b', re.IGNORECASE
+        ) if ordered else None
+
+    def find_all(self, text: str) -> List[str]:
+        """Canonical values mentioned in text, in order of first mention"""
+        if not self.pattern or not text:
+            return []
+        found = []
+        for match in self.pattern.finditer(text):
+            value = self.phrases[match.group(1).lower()]
+            if value not in found:
+                found.append(value)
+        return found
+
+    def substitute(self, text: str, placeholder: str) -> str:
+        """Replace every known phrase with a placeholder token"""
+        if not self.pattern or not text:
+            return text
+        return self.pattern.sub(placeholder, text)
+
+
+def build_category_lexicon(categories: Iterable[str]) -> PhraseLexicon:
+    """Build a lexicon for the categories that actually occur in the catalog"""
+    phrases = {}
+    for category in sorted(set(categories)):
+        phrases[category] = category
+        for word in re.split(r'\s*&\s*', category):
+            phrases.setdefault(word, category)
+        for synonym in CATEGORY_SYNONYMS.get(category, []):
+            phrases.setdefault(synonym, category)
+    return PhraseLexicon(phrases)
+
+
+def build_city_lexicon(cities: Iterable[str]) -> PhraseLexicon:
+    """Build a lexicon for the cities camps are located in"""
+    return PhraseLexicon({city: city for city in set(cities) if city})
+
+
+_SESSION_PAIR_PATTERN = re.compile(r"(\d{4}-\d{2}-\d{2})'?\s*,\s*'?(\d{4}-\d{2}-\d{2})")
+_MONTHS = {
+    'jan': 1, 'january': 1, 'feb': 2, 'february': 2, 'mar': 3, 'march': 3, 'apr': 4, 'april': 4,
+    'may': 5, 'jun': 6, 'june': 6, 'jul': 7, 'july': 7, 'aug': 8, 'august': 8, 'sep': 9, 'sept': 9,
+    'september': 9, 'oct': 10, 'october': 10, 'nov': 11, 'november': 11, 'dec': 12, 'december': 12
+}
+_MONTH_NAMES = '|'.join(sorted(_MONTHS, key=len, reverse=True))
+_MONTH_DAY_PATTERN = re.compile(
+    r'\b(' + _MONTH_NAMES + r')\.?\s+(\d{1,2})(?:st|nd|rd|th)?'
+    r'(?:\s*(?:-|–|to|through)\s*(?:(' + _MONTH_NAMES + r')\.?\s+)?(\d{1,2})(?:st|nd|rd|th)?)?\b',
+    re.IGNORECASE
+)
+_MONTH_PATTERN = re.compile(r'\b(' + _MONTH_NAMES + r')\b', re.IGNORECASE)
+_ISO_DATE_PATTERN = re.compile(r'\b(\d{4}-\d{2}-\d{2})\b')
+
+
+def parse_session_dates(value: Any) -> List[Tuple[date, date]]:
+    """Parse a catalog `session_dates` cell such as "[('2025-07-14', '2025-07-18'), ...]" """
+    if not value or not isinstance(value, str):
+        return []
+    sessions = []
+    for start, end in _SESSION_PAIR_PATTERN.findall(value):
+        try:
+            sessions.append((date.fromisoformat(start), date.fromisoformat(end)))
+        except ValueError:
+            continue
+    return sessions
+
+
+def _month_is_intended(match: re.Match) -> bool:
+    """A bare 'may' is only a month when capitalised ('May', not 'may I ask')"""
+    word = match.group(1)
+    return word.lower() != 'may' or word[0] == 'M'
+
+
+def parse_date_mentions(text: str, year: int) -> List[Tuple[date, date]]:
+    """
+    Find date ranges mentioned in text ('June 16-20', 'July', '2025-07-14')
+    Bare months expand to the whole month; `year` is used when none is given
+    """
+    if not text:
+        return []
+    ranges = []
+    consumed = []
+
+    for match in _ISO_DATE_PATTERN.finditer(text):
+        try:
+            day = date.fromisoformat(match.group(1))
+        except ValueError:
+            continue
+        ranges.append((day, day))
+        consumed.append(match.span())
+
+    for match in _MONTH_DAY_PATTERN.finditer(text):
+        month = _MONTHS[match.group(1).lower()]
+        end_month = _MONTHS[match.group(3).lower()] if match.group(3) else month
+        try:
+            start = date(year, month, int(match.group(2)))
+            end = date(year, end_month, int(match.group(4))) if match.group(4) else start
+        except ValueError:
+            continue
+        ranges.append((start, max(start, end)))
+        consumed.append(match.span())
+
+    for match in _MONTH_PATTERN.finditer(text):
+        if any(begin <= match.start() < finish for begin, finish in consumed):
+            continue
+        if not _month_is_intended(match):
+            continue
+        month = _MONTHS[match.group(1).lower()]
+        last_day = (date(year + (month == 12), month % 12 + 1, 1) - timedelta(days=1)).day
+        ranges.append((date(year, month, 1), date(year, month, last_day)))
+
+    return ranges
+
+
+def weeks_in_range(start: date, end: date) -> List[Tuple[int, int]]:
+    """ISO (year, week) pairs touched by a date range"""
+    weeks = []
+    day = start - timedelta(days=start.weekday())
+    while day <= end:
+        iso = day.isocalendar()
+        weeks.append((iso[0], iso[1]))
+        day += timedelta(days=7)
+    return weeks
@@ -0,0 +1,195 @@
+"""
+Speculative prefetch for the camp chatbot
+Pre-generates responses for suggested follow-up messages so a matching click returns instantly
+"""
+import re
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, Any, List, Optional, Tuple, Callable, Hashable
+
+class SpeculativeCache:
+    """
+    Background worker pool that pre-generates responses for suggestion chips
+    Results are keyed by conversation version, so anything computed against an
+    older state is discarded instead of being served. Prompts are built on the workers
+    (prompt_fn), and a prompt built while the conversation moved past its version is dropped
+    """
+
+    def __init__(self,
+                 generate_fn: Callable[[str], Dict[str, Any]],
+                 prompt_fn: Callable[[str], str],
+                 version_fn: Callable[[], Hashable],
+                 max_workers: int = 2,
+                 top_n: int = 3,
+                 session_budget: int = 20,
+                 global_budget: int = 200,
+                 global_window_seconds: float = 3600.0):
+        self.generate_fn = generate_fn
+        self.prompt_fn = prompt_fn
+        self.version_fn = version_fn
+        self.top_n = top_n
+        self.session_budget = session_budget
+        self.global_budget = global_budget
+        self.global_window_seconds = global_window_seconds
+        self.executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="speculate")
+
+        self._lock = threading.Lock()
+        self._current_version = None
+        self._entries = {}  # (version, normalized message) -> entry dict
+        self._session_usage = {}  # session_id -> speculative calls spent
+        self._global_calls = deque()  # timestamps of recent speculative calls
+
+        self.stats = {
+            "scheduled": 0,
+            "hits": 0,
+            "misses": 0,
+            "stale_discarded": 0,
+            "failed": 0,
+            "budget_skipped": 0
+        }
+
+    @staticmethod
+    def normalize_message(message: str) -> str:
+        """Normalize a message so chip text and typed text compare equal"""
+        text = re.sub(r"\s+", " ", message.strip().lower())
+        return text.rstrip("?!. ")
+
+    def schedule(self,
+                 version: Hashable,
+                 messages: List[str],
+                 session_id: str = "default") -> int:
+        """
+        Queue speculative generations for follow-up messages against `version`
+        Returns the number of generations actually scheduled
+        """
+        scheduled = 0
+        with self._lock:
+            self._advance_version(version)
+
+            for message in messages[:self.top_n]:
+                key = (version, self.normalize_message(message))
+                if key in self._entries:
+                    continue
+                if not self._consume_budget(session_id):
+                    self.stats["budget_skipped"] += 1
+                    break
+
+                entry = {"message": message, "prompt": None, "result": None, "done": threading.Event()}
+                self._entries[key] = entry
+                entry["future"] = self.executor.submit(self._run, key, entry)
+                self.stats["scheduled"] += 1
+                scheduled += 1
+
+        return scheduled
+
+    def lookup(self,
+               version: Hashable,
+               message: str,
+               wait_seconds: float = 0.0) -> Optional[Tuple[str, Dict[str, Any]]]:
+        """
+        Return (prompt, llm_response) if a speculation for this message and version exists
+        A speculation still in flight is awaited for up to `wait_seconds`
+        """
+        key = (version, self.normalize_message(message))
+        with self._lock:
+            self._advance_version(version)
+            entry = self._entries.get(key)
+
+            if entry is None:
+                self.stats["misses"] += 1
+                return None
+
+        if not entry["done"].wait(wait_seconds) or entry["result"] is None:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None
+
+        with self._lock:
+            self._entries.pop(key, None)
+            self.stats["hits"] += 1
+        return entry["prompt"], entry["result"]
+
+    def reset_session(self, session_id: str = "default") -> None:
+        """Drop all speculations and refill the session budget"""
+        with self._lock:
+            self._discard(list(self._entries.keys()))
+            self._session_usage.pop(session_id, None)
+
+    def get_stats(self) -> Dict[str, Any]:
+        """Get speculation counters"""
+        with self._lock:
+            pending = len(self._entries)
+            stats = dict(self.stats)
+        total_lookups = stats["hits"] + stats["misses"]
+        return {
+            **stats,
+            "pending": pending,
+            "hit_rate": round(stats["hits"] / total_lookups, 3) if total_lookups else 0.0
+        }
+
+    def shutdown(self) -> None:
+        """Stop the worker pool without waiting for in-flight speculations"""
+        self.executor.shutdown(wait=False)
+
+    def _run(self, key: Tuple, entry: Dict[str, Any]) -> None:
+        """Worker body: build the prompt, generate, then keep the result only if still current"""
+        version, prompt, result = key[0], None, None
+        try:
+            # A prompt built while the conversation moved past this version would mix two states
+            if self.version_fn() == version:
+                prompt = self.prompt_fn(entry["message"])
+                if self.version_fn() != version:
+                    prompt = None
+            if prompt is not None:
+                entry["prompt"] = prompt
+                result = self.generate_fn(prompt)
+        except Exception as e:
+            print(f"Speculative generation failed: {e}")
+            prompt = prompt or ""
+
+        with self._lock:
+            is_current = self._entries.get(key) is entry
+            if prompt is None or (result is not None and not is_current):
+                self.stats["stale_discarded"] += 1
+                if is_current:
+                    del self._entries[key]
+            elif result is None:
+                self.stats["failed"] += 1
+                if is_current:
+                    del self._entries[key]
+            else:
+                entry["result"] = result
+        entry["done"].set()
+
+    def _advance_version(self, version: Hashable) -> None:
+        """Discard every speculation made against an older version (lock held)"""
+        if version == self._current_version:
+            return
+        self._current_version = version
+        self._discard([key for key in self._entries if key[0] != version])
+
+    def _discard(self, keys: List[Tuple]) -> None:
+        """Remove entries, cancelling any that have not started yet (lock held)"""
+        for key in keys:
+            entry = self._entries.pop(key)
+            entry["future"].cancel()
+            if entry["result"] is not None or entry["future"].cancelled():
+                self.stats["stale_discarded"] += 1
+            entry["done"].set()
+
+    def _consume_budget(self, session_id: str) -> bool:
+        """Charge one speculative call to the session and global budgets (lock held)"""
+        now = time.monotonic()
+        while self._global_calls and now - self._global_calls[0] > self.global_window_seconds:
+            self._global_calls.popleft()
+
+        if len(self._global_calls) >= self.global_budget:
+            return False
+        if self._session_usage.get(session_id, 0) >= self.session_budget:
+            return False
+
+        self._global_calls.append(now)
+        self._session_usage[session_id] = self._session_usage.get(session_id, 0) + 1
+        return True
@@ -2,11 +2,27 @@
 State management for the camp chatbot
 """
 import json
-from typing import Dict, Any, List
+from typing import Dict, Any, List, Optional
+
+# Short field names used by state operations -> path in the state tree
+STATE_FIELDS = {
+    "name": ("child_name",),
+    "age": ("child_age",),
+    "grade": ("grade_level",),
+    "acts": ("preferred_activities",),
+    "budget": ("budget_range",),
+    "loc": ("location_preference",),
+    "dates": ("scheduling", "available_dates"),
+    "blackout": ("scheduling", "blackout_dates"),
+    "consider": ("session_context", "camps_being_considered"),
+    "ruled_out": ("session_context", "camps_ruled_out")
+}
+STATE_OPERATIONS = ("add", "set", "remove")
 
 class StateManager:
     def __init__(self):
         self.state = self._initialize_state()
+        self.version = 0  # Bumped on every change so snapshots can be compared cheaply
     
     def _initialize_state(self) -> Dict[str, Any]:
         """Initialize empty state structure"""
@@ -41,7 +57,8 @@ class StateManager:
         """Update state with new information from LLM response"""
         if not state_updates:
             return
-            
+        
+        self.version += 1
         for key, value in state_updates.items():
             if key in self.state:
                 if isinstance(self.state[key], dict) and isinstance(value, dict):
@@ -55,6 +72,65 @@ class StateManager:
                     if value is not None and value != "":
                         self.state[key] = value
     
+    def apply_operations(self, operations: List[Dict[str, Any]]) -> Dict[str, Any]:
+        """
+        Apply add/set/remove operations ({"op", "f", "v"}) from a compact LLM response
+        Each operation touches one field, so the cost is proportional to the number of changes
+        Returns: {"changed": [state keys], "rejected": [(operation, reason)]}
+        """
+        changed, rejected = [], []
+        for operation in operations or []:
+            reason = self._apply_operation(operation)
+            if reason:
+                rejected.append((operation, reason))
+            elif STATE_FIELDS[operation["f"]][0] not in changed:
+                changed.append(STATE_FIELDS[operation["f"]][0])
+        if changed:
+            self.version += 1
+        return {"changed": changed, "rejected": rejected}
+    
+    def _apply_operation(self, operation: Any) -> Optional[str]:
+        """Apply one operation; returns why it was rejected, or None"""
+        if not isinstance(operation, dict):
+            return "not an object"
+        op, field, value = operation.get("op"), operation.get("f"), operation.get("v")
+        if op not in STATE_OPERATIONS:
+            return f"unknown op '{op}'"
+        if field not in STATE_FIELDS:
+            return f"unknown field '{field}'"
+        
+        *parents, key = STATE_FIELDS[field]
+        container = self.state
+        for parent in parents:
+            container = container[parent]
+        current = container[key]
+        if isinstance(value, str):
+            value = value.strip()
+        
+        if op == "remove":
+            if isinstance(current, list):
+                if value in current:
+                    current.remove(value)
+            else:
+                container[key] = None if field == "age" else ""
+            return None
+        if value is None or value == "":
+            return "missing value"
+        if field == "age":
+            try:
+                value = int(float(value))
+            except (TypeError, ValueError, OverflowError):  # OverflowError: "inf"
+                return f"age is not a number: {value!r}"
+        
+        if isinstance(current, list):
+            items = value if isinstance(value, list) else [value]
+            if op == "set":
+                current.clear()
+            self._update_list(current, items)
+        else:
+            container[key] = value
+        return None
+    
     def _update_nested_dict(self, current_dict: Dict, updates: Dict) -> None:
         """Update nested dictionary structures"""
         for key, value in updates.items():
@@ -101,6 +177,7 @@ class StateManager:
     def reset_state(self) -> None:
         """Reset state to initial empty state"""
         self.state = self._initialize_state()
+        self.version += 1
     
     def get_state_summary(self) -> str:
         """Get a human-readable summary of current state"""
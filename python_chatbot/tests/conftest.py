@@ -0,0 +1,6 @@
+"""Test setup: the chatbot modules import each other by bare name, as they do when run from python_chatbot/"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+os.environ.setdefault('GOOGLE_API_KEY', 'test-key')
@@ -0,0 +1,102 @@
+"""DatabaseCatalogHandler on a temporary SQLite catalog imported from camps_data.csv"""
+import os
+import sqlite3
+
+import pandas as pd
+import pytest
+
+from csv_handler import CSVHandler
+from db_catalog import DatabaseCatalogHandler, ConnectionPool, connector, main, upsert_camps
+from slot_extraction import split_categories
+
+CSV_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "camps_data.csv")
+
+
+@pytest.fixture
+def database_path(tmp_path):
+    path = tmp_path / "camps.db"
+    assert main(["import", CSV_PATH, "--database", f"sqlite:///{path}"]) == 0
+    return path
+
+
+@pytest.fixture
+def handlers(database_path):
+    csv_handler = CSVHandler(CSV_PATH)
+    csv_handler.load_csv()
+    db_handler = DatabaseCatalogHandler(f"sqlite:///{database_path}")
+    yield csv_handler, db_handler
+    db_handler.close()
+
+
+def filter_cases(csv_handler):
+    frame = csv_handler.csv_data
+    categories = sorted({name for value in frame["categories"] for name in split_categories(value)})
+    latitude, longitude = frame["latitude"].astype(float), frame["longitude"].astype(float)
+    return [
+        {},
+        {"grade": 3},
+        {"grade": 0},
+        {"min_price": 200},
+        {"max_price": 300},
+        {"min_price": 150, "max_price": 400, "grade": 5},
+        {"categories": categories[:1]},
+        {"categories": categories[:3], "grade": 4},
+        {"bbox": [longitude.min(), latitude.min(), longitude.median(), latitude.median()]},
+        {"bbox": [longitude.min(), latitude.min(), longitude.max(), latitude.max()], "max_price": 350}
+    ]
+
+
+def test_import_loads_every_camp(handlers):
+    csv_handler, db_handler = handlers
+    assert len(db_handler.csv_data) == len(csv_handler.csv_data)
+    assert db_handler.loaded_from == "database"
+
+
+def test_pushdown_matches_in_memory_filters(handlers):
+    csv_handler, db_handler = handlers
+    for filters in filter_cases(csv_handler):
+        expected = {int(camp_id) for camp_id in csv_handler.query_camps(**filters)}
+        assert set(db_handler.query_camps(**filters)) == expected, filters
+
+
+def test_sync_picks_up_updates_and_deletes(handlers, database_path):
+    _, db_handler = handlers
+    records = db_handler.csv_data.to_dict("records")
+    updated, removed = dict(records[0], price=1234.0), records[1]["camp_id"]
+    version = db_handler.catalog_version
+
+    connect, placeholder = connector(f"sqlite:///{database_path}")
+    pool = ConnectionPool(connect, size=1)
+    upsert_camps(pool, placeholder, [updated])
+    with pool.connection() as connection:
+        connection.execute("DELETE FROM camps WHERE camp_id = ?", (removed,))
+    pool.close()
+
+    result = db_handler.sync()
+
+    assert result == {"changed": 1, "deleted": 1, "catalog_version": version + 1}
+    frame = db_handler.csv_data.set_index("camp_id")
+    assert frame.loc[updated["camp_id"], "price"] == 1234.0
+    assert removed not in frame.index
+    assert db_handler.query_camps(min_price=1000) == [updated["camp_id"]]
+
+
+def test_unchanged_sync_keeps_catalog_version(handlers):
+    _, db_handler = handlers
+    version = db_handler.catalog_version
+    index = db_handler.get_derived("test_index", lambda frame: object())
+
+    result = db_handler.sync()
+
+    assert result == {"changed": 0, "deleted": 0, "catalog_version": version}
+    assert db_handler.catalog_version == version
+    assert db_handler.get_derived("test_index", lambda frame: object()) is index
+    stats = db_handler.get_sync_stats()
+    assert stats["syncs"] == 1 and stats["unchanged_syncs"] == 1
+
+
+def test_import_is_an_upsert(database_path):
+    assert main(["import", CSV_PATH, "--database", f"sqlite:///{database_path}"]) == 0
+    with sqlite3.connect(database_path) as connection:
+        count = connection.execute("SELECT COUNT(*) FROM camps").fetchone()[0]
+    assert count == len(pd.read_csv(CSV_PATH))
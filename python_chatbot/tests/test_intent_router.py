@@ -0,0 +1,33 @@
+"""Local catalog lookups through CampChatbot: answered without the model and without touching the profile"""
+import json
+import os
+
+import pytest
+
+from chatbot_enhanced import CampChatbot
+from csv_handler import CSVHandler
+from llm_handler import LLMHandler
+
+CSV_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__)))), "camps_data.csv")
+
+
+def model_backend(prompt, timeout):
+    raise AssertionError("a local lookup must not reach the model")
+
+
+@pytest.fixture
+def chatbot():
+    csv_handler = CSVHandler(CSV_PATH)
+    csv_handler.load_csv()
+    return CampChatbot(csv_handler=csv_handler, llm_handler=LLMHandler(backend=model_backend))
+
+
+def test_lookup_leaves_the_profile_unchanged(chatbot):
+    chatbot.state_manager.update_state({"location_preference": "Dallas", "budget_range": "under $500"})
+    before = json.dumps(chatbot.state_manager.get_state(), sort_keys=True)
+
+    for message in ("what's in Plano?", "show me STEM programs under $300"):
+        assert chatbot.can_answer_locally(message), message
+        chatbot.process_message(message, show_token_details=False)
+        assert json.dumps(chatbot.state_manager.get_state(), sort_keys=True) == before, message
+    assert chatbot.last_response["state_updates"] == {}
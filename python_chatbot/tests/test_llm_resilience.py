@@ -0,0 +1,163 @@
+"""LLMHandler against a FaultInjectingBackend: retries, JSON repair, the circuit breaker and deadlines"""
+import json
+import time
+
+import pytest
+
+import llm_resilience
+from config import Config
+from llm_handler import LLMHandler
+from llm_resilience import Deadline, FaultInjectingBackend, CircuitBreaker
+
+REPLY = {
+    "r": "Here are three camps that fit your son's schedule and budget this summer.",
+    "ops": [{"op": "set", "f": "age", "v": "8"}, {"op": "add", "f": "acts", "v": "Swimming"}]
+}
+
+
+def reply_backend(prompt, timeout):
+    return json.dumps(REPLY)
+
+
+@pytest.fixture(autouse=True)
+def fast_retries(monkeypatch):
+    monkeypatch.setattr(Config, "LLM_MAX_ATTEMPTS", 3)
+    monkeypatch.setattr(Config, "LLM_RETRY_BASE_DELAY", 0.01)
+    monkeypatch.setattr(Config, "LLM_RETRY_MAX_DELAY", 0.02)
+
+
+def make_handler(backend, failure_threshold=5, reset_timeout=30.0):
+    handler = LLMHandler(backend=backend)
+    handler.circuit_breaker = CircuitBreaker(failure_threshold=failure_threshold, reset_timeout=reset_timeout)
+    return handler
+
+
+def test_transient_failure_is_retried_with_backoff(monkeypatch):
+    sleeps = []
+    monkeypatch.setattr(llm_resilience.time, "sleep", sleeps.append)
+    # Seed 9 draws a failure on the first call and a clean reply on the second
+    backend = FaultInjectingBackend(inner=reply_backend, failure_rate=0.5, seed=9)
+    handler = make_handler(backend)
+
+    response = handler.generate_response("prompt", deadline=Deadline(5.0))
+
+    assert response["response"].startswith("Here are three camps")
+    assert not response.get("degraded")
+    assert backend.calls == 2
+    assert handler.resilience_stats["retries"] == 1
+    assert len(sleeps) == 1 and 0 <= sleeps[0] <= Config.LLM_RETRY_BASE_DELAY
+    assert handler.circuit_breaker.state == CircuitBreaker.CLOSED
+
+
+def test_retries_stop_at_max_attempts_and_degrade():
+    backend = FaultInjectingBackend(inner=reply_backend, failure_rate=1.0)
+    handler = make_handler(backend)
+
+    response = handler.generate_response("prompt", deadline=Deadline(5.0))
+
+    assert response["degraded"] is True
+    assert backend.calls == Config.LLM_MAX_ATTEMPTS
+    assert handler.resilience_stats["degraded_responses"] == 1
+
+
+def test_truncated_output_is_repaired():
+    backend = FaultInjectingBackend(inner=reply_backend, truncate_rate=1.0, seed=1)
+    handler = make_handler(backend)
+
+    response = handler.generate_response("prompt", deadline=Deadline(5.0))
+
+    assert handler.resilience_stats["json_repaired"] == 1
+    assert response["response"].startswith("Here are three camps")
+    assert not response.get("degraded")
+
+
+def test_fenced_output_is_repaired():
+    backend = FaultInjectingBackend(inner=reply_backend, fence_rate=1.0)
+    handler = make_handler(backend)
+
+    response = handler.generate_response("prompt", deadline=Deadline(5.0))
+
+    assert response["response"] == REPLY["r"]
+    assert response["state_operations"] == REPLY["ops"]
+
+
+def test_circuit_opens_after_failures_and_closes_after_a_good_probe(monkeypatch):
+    monkeypatch.setattr(Config, "LLM_MAX_ATTEMPTS", 1)
+    backend = FaultInjectingBackend(inner=reply_backend, failure_rate=1.0)
+    handler = make_handler(backend, failure_threshold=2, reset_timeout=0.05)
+
+    for _ in range(2):
+        assert handler.generate_response("prompt", deadline=Deadline(5.0))["degraded"] is True
+    assert handler.circuit_breaker.state == CircuitBreaker.OPEN
+
+    # While open, calls are rejected without reaching the provider
+    calls = backend.calls
+    assert handler.generate_response("prompt", deadline=Deadline(5.0))["degraded"] is True
+    assert backend.calls == calls
+    assert handler.resilience_stats["circuit_rejections"] == 1
+
+    # After the reset timeout one probe goes through; its success closes the circuit
+    time.sleep(0.06)
+    backend.failure_rate = 0.0
+    response = handler.generate_response("prompt", deadline=Deadline(5.0))
+    assert response["response"] == REPLY["r"]
+    assert handler.circuit_breaker.state == CircuitBreaker.CLOSED
+    assert handler.circuit_breaker.times_opened == 1
+
+
+def test_failed_probe_reopens_the_circuit(monkeypatch):
+    monkeypatch.setattr(Config, "LLM_MAX_ATTEMPTS", 1)
+    backend = FaultInjectingBackend(inner=reply_backend, failure_rate=1.0)
+    handler = make_handler(backend, failure_threshold=1, reset_timeout=0.05)
+
+    handler.generate_response("prompt", deadline=Deadline(5.0))
+    time.sleep(0.06)
+    handler.generate_response("prompt", deadline=Deadline(5.0))
+
+    assert handler.circuit_breaker.state == CircuitBreaker.OPEN
+    assert handler.circuit_breaker.times_opened == 2
+
+
+def test_non_transient_probe_failure_frees_the_probe(monkeypatch):
+    monkeypatch.setattr(Config, "LLM_MAX_ATTEMPTS", 1)
+    backend = FaultInjectingBackend(inner=reply_backend, failure_rate=1.0)
+    handler = make_handler(backend, failure_threshold=1, reset_timeout=0.05)
+    handler.generate_response("prompt", deadline=Deadline(5.0))
+    time.sleep(0.06)
+
+    def bad_request(prompt, timeout):
+        raise ValueError("invalid request")
+
+    handler.backend = bad_request
+    assert "error" in handler.generate_response("prompt", deadline=Deadline(5.0))["response"]
+
+    # The probe slot is free again, so the next call probes and closes the circuit
+    handler.backend = reply_backend
+    response = handler.generate_response("prompt", deadline=Deadline(5.0))
+    assert response["response"] == REPLY["r"]
+    assert handler.circuit_breaker.state == CircuitBreaker.CLOSED
+
+
+def test_deadline_expiry_returns_a_degraded_reply_in_time():
+    backend = FaultInjectingBackend(inner=reply_backend, latency=2.0)
+    handler = make_handler(backend)
+
+    start = time.monotonic()
+    response = handler.generate_response("prompt", deadline=Deadline(0.2))
+    elapsed = time.monotonic() - start
+
+    assert response["degraded"] is True
+    assert elapsed < 1.0
+    assert handler.resilience_stats["deadline_exceeded"] == 1
+
+
+def test_expired_deadline_never_calls_the_provider():
+    backend = FaultInjectingBackend(inner=reply_backend)
+    handler = make_handler(backend)
+    deadline = Deadline(0.01)
+    time.sleep(0.02)
+
+    response = handler.generate_response("prompt", deadline=deadline)
+
+    assert response["degraded"] is True
+    assert backend.calls == 0
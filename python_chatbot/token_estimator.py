@@ -3,8 +3,12 @@ Token estimation utilities for the camp chatbot
 Provides rough token counting for prompts and responses
 """
 import json
+import math
 import re
-from typing import Dict, Any, List
+import threading
+import uuid
+from collections import deque
+from typing import Dict, Any, List, Optional
 from datetime import datetime
 
 class TokenEstimator:
@@ -108,83 +112,222 @@ class TokenEstimator:
         return self.estimate_text_tokens(response)
 
 
+class QuantileSketch:
+    """
+    Log-bucketed histogram (DDSketch-style) for streaming percentiles
+    Any quantile is within `relative_accuracy` of the true value; memory depends only on the
+    range of values seen (a few hundred buckets for token counts), not on how many were added
+    """
+    
+    def __init__(self, relative_accuracy: float = 0.01):
+        self.gamma = (1 + relative_accuracy) / (1 - relative_accuracy)
+        self.log_gamma = math.log(self.gamma)
+        self.buckets = {}  # bucket index -> count
+        self.zero_count = 0
+        self.count = 0
+    
+    def add(self, value: float) -> None:
+        if value <= 0:
+            self.zero_count += 1
+        else:
+            key = math.ceil(math.log(value) / self.log_gamma)
+            self.buckets[key] = self.buckets.get(key, 0) + 1
+        self.count += 1
+    
+    def quantile(self, q: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = q * (self.count - 1)
+        seen = self.zero_count
+        if rank < seen:
+            return 0.0
+        for key in sorted(self.buckets):
+            seen += self.buckets[key]
+            if seen > rank:
+                return 2 * self.gamma ** key / (self.gamma + 1)
+        return 2 * self.gamma ** max(self.buckets) / (self.gamma + 1)
+
+
+class RollingStat:
+    """Count, sum, min, max and percentiles of a stream in O(1) memory"""
+    
+    def __init__(self):
+        self.count = 0
+        self.total = 0
+        self.min = None
+        self.max = None
+        self.sketch = QuantileSketch()
+    
+    def add(self, value: float) -> None:
+        self.count += 1
+        self.total += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+        self.sketch.add(value)
+    
+    def summary(self) -> Dict[str, Any]:
+        return {
+            "count": self.count,
+            "sum": self.total,
+            "mean": round(self.total / self.count, 1) if self.count else 0.0,
+            "min": self.min or 0,
+            "max": self.max or 0,
+            "p50": round(self.sketch.quantile(0.5)),
+            "p95": round(self.sketch.quantile(0.95)),
+            "p99": round(self.sketch.quantile(0.99))
+        }
+
+
 class ConversationLogger:
     """
     Logs conversation rounds with detailed token analysis
+    Memory stays flat: rolling aggregates plus a ring buffer of the most recent rounds.
+    With a RoundWriter, token estimation and full-record JSONL output happen on its background
+    thread (call flush() before reading the newest round); without one they run inline
     """
     
-    def __init__(self):
+    def __init__(self, writer=None, recent_rounds: int = 50, session_id: Optional[str] = None):
         self.token_estimator = TokenEstimator()
-        self.conversation_log = []
+        self.writer = writer
+        self.session_id = session_id or uuid.uuid4().hex[:12]
+        self.conversation_log = deque(maxlen=recent_rounds)  # Most recent rounds only
+        self._lock = threading.Lock()
+        self._pending = 0
+        self._idle = threading.Condition(self._lock)
+        self._generation = 0  # Bumped by clear_log so queued rounds from before it are ignored
+        self._reset_aggregates()
+    
+    def _reset_aggregates(self) -> None:
+        self.rounds_logged = 0
         self.total_input_tokens = 0
         self.total_output_tokens = 0
+        self.input_tokens = RollingStat()
+        self.output_tokens = RollingStat()
+        self.total_tokens = RollingStat()
     
     def log_conversation_round(self, 
                                user_input: str,
                                prompt: str,
                                llm_response: Dict[str, Any],
                                state_before: Dict[str, Any],
-                               state_after: Dict[str, Any]) -> Dict[str, Any]:
+                               state_after: Dict[str, Any]) -> Optional[Dict[str, Any]]:
         """
         Log a complete conversation round with token analysis
+        Returns the log entry, or None when it is being processed in the background
         """
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+        with self._lock:
+            generation = self._generation
+            self._pending += 1
+        
+        def process() -> Optional[Dict[str, Any]]:
+            try:
+                return self._record_round(generation, timestamp, user_input, prompt,
+                                          llm_response, state_before, state_after)
+            finally:
+                with self._lock:
+                    self._pending -= 1
+                    self._idle.notify_all()
         
+        if self.writer is not None and self.writer.submit(process):
+            return None
+        # No writer, or its queue is full: process inline (aggregates stay right, no file record)
+        process()
+        return self.last_round()
+    
+    def _record_round(self, generation: int, timestamp: str, user_input: str, prompt: str,
+                      llm_response: Dict[str, Any], state_before: Dict[str, Any],
+                      state_after: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Estimate tokens, update aggregates and the ring buffer; returns the full JSONL record"""
         # Estimate tokens
         prompt_tokens = self.token_estimator.estimate_prompt_tokens(prompt)
         response_text = llm_response.get("response", "")
         response_tokens = self.token_estimator.estimate_response_tokens(response_text)
+        # Cards rendered server-side from camp_ids were not generated by the model
+        rendered_card_tokens = self.token_estimator.estimate_text_tokens(llm_response.get("rendered_cards") or "")
+        response_tokens = max(0, response_tokens - rendered_card_tokens)
         state_update_tokens = self.token_estimator.estimate_json_tokens(
             llm_response.get("state_updates", {})
-        )
+        ) + self.token_estimator.estimate_json_tokens(llm_response.get("state_operations") or [])
+        output_tokens = response_tokens + state_update_tokens
         
-        # Create log entry
-        log_entry = {
-            "timestamp": timestamp,
-            "round_number": len(self.conversation_log) + 1,
-            "user_input": user_input,
-            "user_input_tokens": self.token_estimator.estimate_text_tokens(user_input),
-            "prompt_analysis": prompt_tokens,
-            "response": {
-                "text": response_text,
-                "tokens": response_tokens
-            },
-            "state_updates": {
-                "data": llm_response.get("state_updates", {}),
-                "tokens": state_update_tokens
-            },
-            "token_summary": {
-                "input_tokens": prompt_tokens["total"],
-                "output_tokens": response_tokens + state_update_tokens,
-                "total_tokens": prompt_tokens["total"] + response_tokens + state_update_tokens
+        with self._lock:
+            if generation != self._generation:
+                return None
+            self.rounds_logged += 1
+            
+            # Create log entry
+            log_entry = {
+                "timestamp": timestamp,
+                "round_number": self.rounds_logged,
+                "user_input": user_input,
+                "user_input_tokens": self.token_estimator.estimate_text_tokens(user_input),
+                "prompt_analysis": prompt_tokens,
+                "response": {
+                    "text": response_text,
+                    "tokens": response_tokens,
+                    "server_rendered_tokens": rendered_card_tokens
+                },
+                "state_updates": {
+                    "data": llm_response.get("state_updates", {}),
+                    "operations": llm_response.get("state_operations") or [],
+                    "tokens": state_update_tokens
+                },
+                "token_summary": {
+                    "input_tokens": prompt_tokens["total"],
+                    "output_tokens": output_tokens,
+                    "total_tokens": prompt_tokens["total"] + output_tokens
+                }
             }
-        }
-        
-        # Update totals
-        self.total_input_tokens += prompt_tokens["total"]
-        self.total_output_tokens += response_tokens + state_update_tokens
-        
-        # Add to log
-        self.conversation_log.append(log_entry)
-        
-        return log_entry
-    
-    def get_session_summary(self) -> Dict[str, Any]:
-        """Get summary of entire conversation session"""
-        if not self.conversation_log:
-            return {"message": "No conversation rounds logged yet"}
+            
+            # Update totals
+            self.total_input_tokens += prompt_tokens["total"]
+            self.total_output_tokens += output_tokens
+            self.input_tokens.add(prompt_tokens["total"])
+            self.output_tokens.add(output_tokens)
+            self.total_tokens.add(prompt_tokens["total"] + output_tokens)
+            
+            # Add to log
+            self.conversation_log.append(log_entry)
         
         return {
-            "total_rounds": len(self.conversation_log),
-            "total_input_tokens": self.total_input_tokens,
-            "total_output_tokens": self.total_output_tokens,
-            "total_session_tokens": self.total_input_tokens + self.total_output_tokens,
-            "average_input_per_round": round(self.total_input_tokens / len(self.conversation_log)),
-            "average_output_per_round": round(self.total_output_tokens / len(self.conversation_log))
+            "session_id": self.session_id,
+            **log_entry,
+            "state_before": state_before,
+            "state_after": state_after
         }
     
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Wait until this session's queued rounds are processed; False on timeout"""
+        with self._lock:
+            return self._idle.wait_for(lambda: self._pending == 0, timeout)
+    
+    def last_round(self) -> Optional[Dict[str, Any]]:
+        """Newest processed round (flush first to include one just logged)"""
+        with self._lock:
+            return self.conversation_log[-1] if self.conversation_log else None
+    
+    def get_session_summary(self) -> Dict[str, Any]:
+        """Get summary of entire conversation session (from rolling aggregates, O(1))"""
+        with self._lock:
+            if not self.rounds_logged:
+                return {"message": "No conversation rounds logged yet"}
+            
+            return {
+                "total_rounds": self.rounds_logged,
+                "total_input_tokens": self.total_input_tokens,
+                "total_output_tokens": self.total_output_tokens,
+                "total_session_tokens": self.total_input_tokens + self.total_output_tokens,
+                "average_input_per_round": round(self.total_input_tokens / self.rounds_logged),
+                "average_output_per_round": round(self.total_output_tokens / self.rounds_logged),
+                "input_tokens": self.input_tokens.summary(),
+                "output_tokens": self.output_tokens.summary(),
+                "pending_rounds": self._pending
+            }
+    
     def clear_log(self) -> None:
         """Clear conversation log"""
-        self.conversation_log = []
-        self.total_input_tokens = 0
-        self.total_output_tokens = 0
+        with self._lock:
+            self._generation += 1
+            self.conversation_log.clear()
+            self._reset_aggregates()